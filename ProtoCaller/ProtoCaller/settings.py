@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -32,7 +33,7 @@ ALLOWED_HOSTS = []
 
 INSTALLED_APPS = [
     'rest_framework',
-    'caller',
+    'caller.apps.CallerConfig',
     'bootstrap5',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'caller.snapshots.SnapshotMiddleware',
     'caller.middleware.RedirectToIndexMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,9 +73,18 @@ TEMPLATES = [
     },
 ]
 
+# JSON through orjson, MessagePack when msgpack is installed (Accept: application/msgpack or ?format=msgpack),
+# and the browsable API only while debugging
+RENDERER_CLASSES = ['caller.renderers.ORJSONRenderer']
+if find_spec('msgpack') is not None:
+    RENDERER_CLASSES.append('caller.renderers.MessagePackRenderer')
+if DEBUG:
+    RENDERER_CLASSES.append('rest_framework.renderers.BrowsableAPIRenderer')
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': RENDERER_CLASSES,
 }
 
 WSGI_APPLICATION = 'ProtoCaller.wsgi.application'
@@ -89,6 +100,62 @@ DATABASES = {
     }
 }
 
+# SQLite performance profile, enabled with PROTOCALLER_SQLITE_PROFILE=production.
+# The pragmas are applied to every new connection (see caller/db.py). WAL lets readers carry on while the
+# loader or a POST is writing, and persistent connections keep the page cache and mmap warm between requests.
+SQLITE_PROFILE = os.environ.get('PROTOCALLER_SQLITE_PROFILE', '')
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,  # 256 MiB
+    'cache_size': -65536,  # 64 MiB
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS = {}
+
+if SQLITE_PROFILE == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    DATABASES['default']['CONN_MAX_AGE'] = None
+    DATABASES['default']['OPTIONS'] = {'timeout': 20}
+
+# Read-only replicas, e.g. PROTOCALLER_REPLICAS=/srv/replica-a.sqlite3,/srv/replica-b.sqlite3
+# Each file is opened read-only and immutable, and is refreshed with `manage.py publish_replica`.
+# caller.routers.ReadReplicaRouter sends reads of the caller models to them and every write to 'default'.
+DATABASE_REPLICAS = {}
+
+for n, path in enumerate(filter(None, os.environ.get('PROTOCALLER_REPLICAS', '').split(','))):
+    DATABASE_REPLICAS[f'replica{n}'] = path
+    DATABASES[f'replica{n}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{path}?mode=ro&immutable=1',
+        'CONN_MAX_AGE': 60,  # reconnecting is how a worker picks up a newly published snapshot
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['caller.routers.ReadReplicaRouter']
+
+# Response cache of the read-mostly detail endpoints (see caller/cache.py). Any Django cache backend works, e.g.
+# PROTOCALLER_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache PROTOCALLER_CACHE_LOCATION=/var/tmp/protocaller
+# or a memcached/redis backend shared by every worker. RESPONSE_CACHE_TIMEOUT=0 turns the cache off.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get('PROTOCALLER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PROTOCALLER_CACHE_LOCATION', 'protocaller-responses'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('PROTOCALLER_CACHE_TIMEOUT', 3600))
+
+# Prerendered snapshots of the read API, written by `manage.py prerender`, e.g. PROTOCALLER_SNAPSHOTS=/srv/snapshots
+# When set, caller.snapshots.SnapshotMiddleware serves the requests it has a file for straight from this directory.
+# The links of the paginated listings are rendered for SNAPSHOT_BASE_URL, the address the clients use.
+SNAPSHOT_ROOT = os.environ.get('PROTOCALLER_SNAPSHOTS') or None
+SNAPSHOT_BASE_URL = os.environ.get('PROTOCALLER_SNAPSHOT_BASE_URL', 'http://127.0.0.1:8000')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -2,8 +2,22 @@ from django.contrib import admin
 from .models import * 
 
 # Register your models here.
-admin.site.register(Protein)
-admin.site.register(Domain)
-admin.site.register(Pfam)
-admin.site.register(Organism)
-admin.site.register(ProteinDomains)
\ No newline at end of file
+class VersionedAdmin(admin.ModelAdmin):
+    
+    def delete_queryset(self, request, queryset):
+        # the bulk delete action skips Model.delete(), so the whole dataset is marked as changed instead
+        super().delete_queryset(request, queryset)
+        DataVersion.objects.changed('dataset', everything=True)
+
+class ProteinAdmin(VersionedAdmin):
+    # the changelist only shows these columns, the sequence stays deferred until a protein is opened
+    list_display = ['protein_id', 'organism_id', 'length', 'coverage']
+    list_select_related = ['organism_id']
+    search_fields = ['protein_id']
+
+admin.site.register(Protein, ProteinAdmin)
+admin.site.register(Domain, VersionedAdmin)
+admin.site.register(Pfam, VersionedAdmin)
+admin.site.register(Organism, VersionedAdmin)
+admin.site.register(ProteinDomains, VersionedAdmin)
+admin.site.register(OrganismPfam, VersionedAdmin)
\ No newline at end of file
@@ -2,48 +2,159 @@ from rest_framework import viewsets
 from rest_framework import permissions
 from .serializers import *
 from .models import * 
+from .pagination import CatalogPagination
+from .renderers import ORJSONRenderer
+from .streaming import EXPORT_CHUNK_SIZE, NDJSONRenderer, chunked, json_results, ndjson_chunks, ndjson_response, streaming_response
+from .builders import *
+from .cache import CachedResponse, query_key, response_cache
+from .ingest import MAX_RECORDS, ingest_proteins
 from django.urls import reverse,reverse_lazy
-from django.http import JsonResponse,HttpResponseNotFound
+from django.http import Http404,JsonResponse,HttpResponseNotFound
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.parsers import JSONParser
 from django.shortcuts import redirect
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Value
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
 from rest_framework import mixins
+from rest_framework import exceptions
 
 #my code starts here 
-class CoverageDetail(generics.GenericAPIView, mixins.RetrieveModelMixin):
+class ValuesListMixin:
+    """
+    Lists served by the fast path in builders.py: the page is read with .values() and assembled into the
+    serializer's JSON shape as plain dicts, without model instances or DRF field trees. By default the page is
+    the values_fields columns (every concrete field when empty) as they come; the views that nest relations or
+    rename fields override get_values and build with the functions of builders.py.
     """
-    Retrieve the domain coverage for a given protein. That is the sum of the protein domain lengths (start-stop) divided by the length of the protein.
 
-    [ref]: http://127.0.0.1:8000/api/coverage/[PROTEIN ID]
+    values_fields = ()
+
+    def get_values(self, queryset):
+        return queryset.values(*self.values_fields)
+
+    def build(self, rows):
+        return list(rows)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.build(page))
+        return Response(self.build(rows))
+
+
+class ProteinShapeMixin:
+    """
+    Protein endpoints taking ?fields=protein_id,length (the fields to return) and ?expand=domains.pfam (the
+    relations to nest, the others are rendered as their key). See ProteinShape in builders.py.
     """
 
-    serializer_class = CoverageSerializer
-    lookup_field = 'protein_id'
+    default_shape = SUMMARY_SHAPE
+
+    def get_shape(self):
+        try:
+            return ProteinShape.from_query(self.request.query_params, self.default_shape)
+        except ValueError as error:
+            raise exceptions.ValidationError(error.args[0])
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        queryset = self.get_queryset()
 
-        protein = queryset[0] if len(queryset) == 1 else None
+class CachedResponseMixin:
+    """
+    Keeps the rendered body of successful GETs in the response cache (caller/cache.py), keyed on the endpoint,
+    the lookup key, the renderer, the query string and the entities the body is built from, so a write drops
+    exactly the responses of the protein, organism or Pfam it touched. Views set cache_endpoint and declare their
+    entities (cache_entities or get_cache_entities()); an empty list is a body only a full invalidation drops.
+    """
 
-        if protein is not None:
-            domains = protein.domains.all()
-            summary = 0
+    cache_endpoint = None
+    cache_entities = None
+
+    def get_cache_lookup(self):
+        return self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+
+    def get_cache_entities(self):
+        # a body kept without the entities it is built from would outlive the writes to them
+        if self.cache_entities is None:
+            raise ImproperlyConfigured(f'{self.__class__.__name__} caches its responses without declaring cache_entities')
+        return list(self.cache_entities)
+
+    def render_entry(self, request, response):
+        if isinstance(response, Response):
+            response = self.finalize_response(request, response)
+            response.render()
+        if response.status_code != 200:
+            # errors and redirects go out as they are and are never stored
+            return {'status': response.status_code, 'response': response}
+        return {'status': response.status_code, 'content_type': response['Content-Type'], 'content': response.content}
+
+    def cached(self, request, compute):
+        # the browsable API embeds per user forms and tokens, it is never cached
+        if self.cache_endpoint is None:
+            raise ImproperlyConfigured(f'{self.__class__.__name__} caches its responses without a cache_endpoint')
+        # checked whether or not the cache is on, so a view missing them fails in every deployment
+        entities = self.get_cache_entities()
+        if not response_cache.enabled or request.accepted_renderer.format == 'api':
+            return compute()
+        key = response_cache.response_key(self.cache_endpoint, self.get_cache_lookup(), request.accepted_renderer.format,
+                                          query_key(request.query_params), entities)
+        entry = response_cache.get_or_compute(key, lambda: self.render_entry(request, compute()), lambda entry: 'content' in entry)
+        if 'response' in entry:
+            return entry['response']
+        return CachedResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETags and Last-Modified built from the DataVersion counters the response depends on.
+    If-None-Match/If-Modified-Since are answered with 304 from one small read, before any query or serializer runs.
+    """
 
-            for domain in domains:
-                summary += (domain.stop - domain.start)
+    version_scopes = ['dataset']
 
-            coverage = summary / protein.length
-            context['coverage'] = coverage
-        return context
+    def get_version_scopes(self):
+        return list(self.version_scopes)
+
+    def not_modified(self, request):
+        versions, modified = DataVersion.objects.current(self.get_version_scopes())
+        # the representation is part of a strong ETag: the JSON and the MessagePack body of a resource differ
+        self.etag = '"%s-%s"' % (request.accepted_renderer.format, '.'.join(str(version) for version in versions))
+        self.last_modified = modified.timestamp() if modified is not None else None
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(self.last_modified)
+        return response
+
+
+class CoverageDetail(CachedResponseMixin, generics.GenericAPIView, mixins.RetrieveModelMixin):
+    """
+    Retrieve the domain coverage for a given protein. That is the length covered by the union of the protein domains (start-stop) divided by the length of the protein.
+
+    [ref]: http://127.0.0.1:8000/api/coverage/[PROTEIN ID]
+    """
+
+    serializer_class = CoverageSerializer
+    lookup_field = 'protein_id'
+    cache_endpoint = 'coverage'
+
+    def get_cache_entities(self):
+        return [('protein', self.kwargs['protein_id'])]
 
     def get_queryset(self):
-        queryset = Protein.objects.all()
+        # coverage is stored on the protein row, so this is a single-row read
+        queryset = Protein.objects.only('id', 'protein_id', 'coverage')
         try:
             if self.kwargs['protein_id'] is not None:
                 queryset = queryset.filter(protein_id=self.kwargs['protein_id'])
@@ -55,7 +166,7 @@ class CoverageDetail(generics.GenericAPIView, mixins.RetrieveModelMixin):
     def get(self, request, *args, **kwargs):
         try:
             if self.kwargs['protein_id'] is not None:
-                return self.retrieve(request, *args, **kwargs)
+                return self.cached(request, lambda: self.retrieve(request, *args, **kwargs))
             else:
                 return redirect('index')
         except Protein.DoesNotExist:
@@ -68,37 +179,41 @@ class OrganismList(generics.ListAPIView):
     """
 
     serializer_class = OrganismSerializer
-    queryset = Organism.objects.all()
+    queryset = Organism.objects.order_by('id')
 
 
-class OrganismPfamList(generics.ListAPIView):
+class OrganismPfamList(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     """
-    List all domains in all the proteins for a given organism.
+    List the distinct Pfams found in the proteins of a given organism, with how often each occurs.
 
     [ref]: http://127.0.0.1:8000/api/pfams/[TAXA ID]
     """
 
     serializer_class = OrganismDomainSerializer
     lookup_field = 'taxa_id'
+    cache_endpoint = 'organism_pfams'
 
     def get_queryset(self):
-        try:
-            if self.kwargs['taxa_id'] is not None:
-                organism = Organism.objects.get(taxa_id=self.kwargs['taxa_id'])
-                organismPfams = organism.get_pfams()
-            return organismPfams
-        except KeyError:
-            return HttpResponseNotFound
+        # served from the precomputed OrganismPfam summary: a single range read on its (organism, pfam) index
+        return OrganismPfam.objects.filter(organism__taxa_id=self.kwargs['taxa_id']).select_related('pfam').order_by('pfam_id')
+
+    def get_version_scopes(self):
+        return ['dataset', 'pfam', DataVersion.taxa_scope(self.kwargs['taxa_id'])]
+
+    def get_cache_entities(self):
+        return [('taxa', self.kwargs['taxa_id'])]
 
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return self.not_modified(request) or self.cached(request, lambda: self.list(request, *args, **kwargs))
 
 
-class ProteinDetail(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.CreateModelMixin):
+class ProteinDetail(ProteinShapeMixin, ConditionalGetMixin, CachedResponseMixin, generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.CreateModelMixin):
     """
-    Retrieve the protein sequence and all information about it.
+    Retrieve the protein sequence and all information about it, or only some fields of it.
 
     [ref]: http://127.0.0.1:8000/api/protein/[PROTEIN ID]
+    [ref]: http://127.0.0.1:8000/api/protein/[PROTEIN ID]?fields=protein_id,length
+    [ref]: http://127.0.0.1:8000/api/protein/[PROTEIN ID]?expand=domains (Pfams as their accession)
 
     Add a new record.
 
@@ -107,7 +222,13 @@ class ProteinDetail(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.C
 
     serializer_class = ProteinSerializer
     lookup_field = 'protein_id'
-    queryset = Protein.objects.all()
+    queryset = Protein.objects.with_sequence().with_domains()
+    version_scopes = ['dataset', 'protein', 'domain', 'pfam', 'organism']
+    cache_endpoint = 'protein'
+    default_shape = DETAIL_SHAPE
+
+    def get_cache_entities(self):
+        return [('protein', self.kwargs['protein_id'])]
 
     def get_object(self):
         protein = super().get_object()
@@ -120,52 +241,70 @@ class ProteinDetail(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.C
     def get(self, request, *args, **kwargs):
         try:
             if self.kwargs['protein_id'] is not None:
-                return self.retrieve(request, *args, **kwargs)
+                return self.not_modified(request) or self.cached(request, lambda: self.retrieve(request, *args, **kwargs))
         except KeyError:
             return redirect('protein_create')
 
+    def retrieve(self, request, *args, **kwargs):
+        # fast path: the protein row and its domain rows, assembled without the serializer
+        shape = self.get_shape()
+        queryset = self.filter_queryset(self.get_queryset()).filter(protein_id=self.kwargs['protein_id'])
+        proteins = fetch_proteins(protein_values(queryset, shape)[:1], shape)
+        if not proteins:
+            raise Http404
+        return Response(proteins[0])
+
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def create(self, request, *args, **kwargs):
         try:
-            proteinDomains = []
-            domainData = [domain for domain in request.data['domains']]
-            organismData = request.data['organism_id']
-            request.data.pop('organism_id')
-            organismSerial = OrganismSerializer(data=organismData)
-            if organismSerial.is_valid(raise_exception=True):
-                organismSerial.save()
-                organism = organismSerial.data
-
-            proteinData = request.data
-            proteinData['taxonomy'] = organism
-            proteinSerializer = ProteinSerializer(data=proteinData)
-            if proteinSerializer.is_valid(raise_exception=True):
-                proteinObj = proteinSerializer.save()
-
-                for domain in domainData:
-                    pfam = domain['pfam_id']
-                    pfamSerial = PfamSerializer(data=pfam)
-
-                    if pfamSerial.is_valid(raise_exception=True):
-                        pfamSerial.save()
-
-                    domain['pfam_id'] = pfam
-                    domain['protein_id'] = proteinObj
-                    domainSerial = DomainSerializer(data=domain)
-                    if domainSerial.is_valid(raise_exception=True):
-                        domainObj = domainSerial.save()
-
-                    proteinDomains.append(ProteinDomains(protein=proteinObj, domain=domainObj))
-
-                ProteinDomains.objects.bulk_create(proteinDomains)
-
-                return Response(proteinSerializer.data, status=status.HTTP_201_CREATED)
-
-            else:
-                return Response(proteinSerializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
+            with transaction.atomic():
+                proteinDomains = []
+                domainData = [domain for domain in request.data['domains']]
+                organismData = request.data['organism_id']
+                request.data.pop('organism_id')
+                organismSerial = OrganismSerializer(data=organismData)
+                if organismSerial.is_valid(raise_exception=True):
+                    organismSerial.save()
+                    organism = organismSerial.data
+
+                proteinData = request.data
+                proteinData['taxonomy'] = organism
+                proteinSerializer = ProteinSerializer(data=proteinData)
+                if proteinSerializer.is_valid(raise_exception=True):
+                    proteinObj = proteinSerializer.save()
+
+                    for domain in domainData:
+                        pfam = domain['pfam_id']
+                        pfamSerial = PfamSerializer(data=pfam)
+
+                        if pfamSerial.is_valid(raise_exception=True):
+                            pfamSerial.save()
+
+                        domain['pfam_id'] = pfam
+                        domain['protein_id'] = proteinObj
+                        domainSerial = DomainSerializer(data=domain)
+                        if domainSerial.is_valid(raise_exception=True):
+                            domainObj = domainSerial.save()
+
+                        proteinDomains.append(ProteinDomains(protein=proteinObj, domain=domainObj))
+
+                    ProteinDomains.objects.bulk_create(proteinDomains)
+                    OrganismPfam.objects.record(proteinObj)
+                    Protein.objects.refresh_coverage([proteinObj.id])
+                    # the links, summary and coverage were written in bulk, past Model.save()
+                    DataVersion.objects.changed('protein', proteins=[proteinObj.protein_id], taxa=proteinObj.taxa_ids(),
+                                                pfams=[domain['pfam_id']['domain_id'] for domain in domainData])
+
+                    return Response(proteinSerializer.data, status=status.HTTP_201_CREATED)
+
+                else:
+                    return Response(proteinSerializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        except exceptions.ValidationError as error:
+            # field errors, e.g. a protein_id that is already taken, go back as they are
+            return Response(error.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception:
             error = {}
             error['exception'] = Exception("error in creating protein")
@@ -182,19 +321,80 @@ class ProteinCreate(generics.CreateAPIView):
     serializer_class = ProteinSerializer
 
 
-class ProteinList(generics.ListAPIView):
+class ProteinBulkCreate(generics.GenericAPIView):
     """
-    List all proteins.
+    Add many protein records at once: a JSON list (or {"proteins": [...]}) of records shaped like the single
+    record POST. Records are validated in one pass, organisms and Pfams are looked up set based and everything
+    is written with bulk inserts in one transaction. Invalid or existing records are reported under "errors"
+    by their position in the list and do not stop the others.
+
+    [ref]: http://127.0.0.1:8000/api/proteins/bulk [{PROTEIN DATA}, ...]
     """
 
-    serializer_class = ProteinSerializer
-    queryset = Protein.objects.all()
+    serializer_class = ProteinRecordSerializer
+    pagination_class = None
+
+    def post(self, request, *args, **kwargs):
+        records = request.data.get('proteins') if isinstance(request.data, dict) else request.data
+        if not isinstance(records, list) or not records:
+            raise exceptions.ValidationError({'proteins': 'expected a list of protein records'})
+        if len(records) > MAX_RECORDS:
+            raise exceptions.ValidationError({'proteins': f'at most {MAX_RECORDS} records per request'})
+
+        try:
+            created, errors = ingest_proteins(records)
+        except IntegrityError:
+            # another writer added one of the proteins in the meantime
+            return Response({'detail': 'conflicting concurrent write, nothing was created'}, status=status.HTTP_409_CONFLICT)
+
+        errors = [{'index': index, 'protein_id': records[index].get('protein_id') if isinstance(records[index], dict) else None,
+                   'errors': errors[index]} for index in sorted(errors)]
+        if not errors:
+            code = status.HTTP_201_CREATED
+        elif not created:
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_200_OK
+        return Response({'created': created, 'errors': errors}, status=code)
+
+
+class ProteinList(ProteinShapeMixin, ValuesListMixin, generics.ListAPIView):
+    """
+    List all proteins. Sequences are left out unless asked for with ?fields=, they are returned by the protein and sequence endpoints.
+
+    [ref]: http://127.0.0.1:8000/api/proteins?page_size=100
+    [ref]: http://127.0.0.1:8000/api/proteins?pagination=cursor&page_size=1000 (then follow "next")
+    [ref]: http://127.0.0.1:8000/api/proteins?fields=protein_id,length (one query per page)
+    """
+
+    serializer_class = ProteinSummarySerializer
+    pagination_class = CatalogPagination
+    queryset = Protein.objects.with_domains().order_by('id')
+
+    def get_values(self, queryset):
+        self.shape = self.get_shape()
+        return protein_values(queryset, self.shape)
+
+    def build(self, rows):
+        return fetch_proteins(rows, self.shape)
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class OrganismProteinList(generics.ListAPIView):
+class ProteinSequenceDetail(generics.RetrieveAPIView):
+    """
+    Retrieve the sequence of a protein.
+
+    [ref]: http://127.0.0.1:8000/api/sequence/[PROTEIN ID]
+    """
+
+    serializer_class = ProteinSequenceSerializer
+    lookup_field = 'protein_id'
+    queryset = Protein.objects.with_sequence().only('id', 'protein_id', 'length', 'sequence')
+
+
+class OrganismProteinList(ValuesListMixin, generics.ListAPIView):
     """
     List all proteins for a given organism.
 
@@ -205,11 +405,10 @@ class OrganismProteinList(generics.ListAPIView):
     lookup_field = 'taxa_id'
 
     def get_queryset(self):
-        queryset = Protein.objects.all()
+        queryset = Protein.objects.only('id', 'protein_id').order_by('id')
         try:
             if self.kwargs['taxa_id'] is not None:
-                org = Organism.objects.get(taxa_id=self.kwargs['taxa_id'])
-                queryset = queryset.filter(organism_id=org)
+                queryset = queryset.filter(organism_id__taxa_id=self.kwargs['taxa_id'])
         except KeyError:
             pass  # need to throw a 404 error here
 
@@ -223,28 +422,43 @@ class OrganismProteinList(generics.ListAPIView):
         except KeyError:
             return HttpResponseNotFound("error")
 
+    def get_values(self, queryset):
+        return organism_protein_values(queryset)
+
+    def build(self, rows):
+        return build_organism_proteins(rows)
+
     def get(self, request, *args, **kwargs):
-        return self.list(self, request, *args, **kwargs)
+        return self.list(request, *args, **kwargs)
 
 
-class DomainList(generics.ListAPIView):
+class DomainList(ValuesListMixin, generics.ListAPIView):
     """
-    List all domains.
+    List all domains. Takes the same ?page_size= and ?pagination=cursor options as the protein listing.
     """
 
-    queryset = Domain.objects.all()
+    pagination_class = CatalogPagination
+    queryset = Domain.objects.select_related('pfam_id').order_by('id')
     serializer_class = DomainSerializer
 
+    def get_values(self, queryset):
+        return domain_values(queryset)
+
+    def build(self, rows):
+        return build_domains(rows)
+
 
 class PfamList(generics.GenericAPIView, mixins.ListModelMixin):
     """
     List all Pfams.
 
     [ref]: http://127.0.0.1:8000/api/pfams/
+    [ref]: http://127.0.0.1:8000/api/pfams?pagination=cursor&page_size=1000
     """
 
     serializer_class = PfamSerializer
-    queryset = Pfam.objects.all()
+    pagination_class = CatalogPagination
+    queryset = Pfam.objects.order_by('id')
 
     def get(self, request, *args, **kwargs):
         try:
@@ -253,7 +467,204 @@ class PfamList(generics.GenericAPIView, mixins.ListModelMixin):
             return self.retrieve(request, *args, **kwargs)
 
 
-class PfamDetail(generics.GenericAPIView, mixins.RetrieveModelMixin):
+class ExportView(generics.GenericAPIView):
+    """
+    Base for the NDJSON exports: one JSON record per line, streamed in chunks so a whole organism or the
+    whole catalogue goes out in bounded memory. Gzipped on the fly when the client sends Accept-Encoding: gzip.
+    """
+
+    renderer_classes = [NDJSONRenderer, ORJSONRenderer]
+    pagination_class = None
+    filename = None
+    # the lookup from the exported model to Organism.taxa_id; None when the export cannot be filtered by organism
+    taxa_lookup = None
+
+    def filter_taxa(self, queryset, taxaId):
+        if self.taxa_lookup is None:
+            raise exceptions.ValidationError({'taxa_id': 'this export cannot be filtered by organism'})
+        return queryset.filter(**{self.taxa_lookup: taxaId})
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        taxaId = request.query_params.get('taxa_id')
+        if taxaId is not None:
+            try:
+                queryset = self.filter_taxa(queryset, int(taxaId))
+            except ValueError:
+                return Response({'taxa_id': 'must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serialize = lambda chunk: self.get_serializer(chunk, many=True).data
+        return ndjson_response(request, ndjson_chunks(queryset, serialize), self.filename)
+
+
+class ProteinExport(ExportView):
+    """
+    Export every protein with its sequence, organism and domains, optionally only those of one organism.
+
+    [ref]: http://127.0.0.1:8000/api/export/proteins.ndjson?taxa_id=[TAXA ID]
+    """
+
+    serializer_class = ProteinSerializer
+    queryset = Protein.objects.with_sequence().with_domains().order_by('id')
+    filename = 'proteins.ndjson'
+    taxa_lookup = 'organism_id__taxa_id'
+
+
+class DomainExport(ExportView):
+    """
+    Export every domain with its Pfam, optionally only the domains found in the proteins of one organism.
+
+    [ref]: http://127.0.0.1:8000/api/export/domains.ndjson?taxa_id=[TAXA ID]
+    """
+
+    serializer_class = DomainSerializer
+    queryset = Domain.objects.select_related('pfam_id').order_by('id')
+    filename = 'domains.ndjson'
+
+    def filter_taxa(self, queryset, taxaId):
+        return queryset.filter(id__in=ProteinDomains.objects.filter(protein__organism_id__taxa_id=taxaId).values('domain_id'))
+
+
+class OrganismExport(ExportView):
+    """
+    Export every organism.
+
+    [ref]: http://127.0.0.1:8000/api/export/organisms.ndjson
+    """
+
+    serializer_class = OrganismSerializer
+    queryset = Organism.objects.order_by('id')
+    filename = 'organisms.ndjson'
+    taxa_lookup = 'taxa_id'
+
+
+class BatchView(generics.GenericAPIView):
+    """
+    Base for the batch endpoints: the ids come from ?ids=a,b,c (small sets) or a POSTed JSON list
+    (or {"ids": [...]}), and the results are streamed as {"results": [...], "missing": [...]}.
+    """
+
+    renderer_classes = [ORJSONRenderer]
+    pagination_class = None
+    max_ids = 10000
+    # ids looked up per IN query
+    chunk_size = 500
+
+    def get_ids(self, request):
+        """The requested ids in request order, without repeats, or None when no ids were given."""
+        if request.method == 'POST':
+            ids = request.data.get('ids') if isinstance(request.data, dict) else request.data
+        else:
+            ids = request.query_params.get('ids')
+            ids = [proteinId for proteinId in ids.split(',') if proteinId] if ids is not None else None
+        if ids is None:
+            return None
+        if not isinstance(ids, list) or not all(isinstance(proteinId, str) for proteinId in ids):
+            raise exceptions.ValidationError({'ids': 'must be a list of protein ids'})
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > self.max_ids:
+            raise exceptions.ValidationError({'ids': f'at most {self.max_ids} ids per request'})
+        return ids
+
+    def stream(self, request, chunks, tail=dict):
+        return streaming_response(request, json_results(chunks, ORJSONRenderer().render, tail), 'application/json')
+
+    def post(self, request, *args, **kwargs):
+        return self.get(request, *args, **kwargs)
+
+
+class ProteinBatch(BatchView):
+    """
+    Retrieve many proteins at once, each as /api/protein/[PROTEIN ID] returns it, in request order.
+    Ids that do not exist are listed under "missing".
+
+    [ref]: http://127.0.0.1:8000/api/proteins/batch?ids=[PROTEIN ID],[PROTEIN ID]
+    [ref]: http://127.0.0.1:8000/api/proteins/batch {"ids": [[PROTEIN ID], ...]}
+    """
+
+    def get(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        if not ids:
+            raise exceptions.ValidationError({'ids': 'no protein ids given'})
+        missing = []
+
+        def chunks():
+            # two IN queries (proteins with their organism, then their domains with their Pfams) per chunk
+            for chunk in chunked(ids, self.chunk_size):
+                found = fetch_proteins_by_id(chunk)
+                missing.extend(proteinId for proteinId in chunk if proteinId not in found)
+                yield [found[proteinId] for proteinId in chunk if proteinId in found]
+
+        return self.stream(request, chunks(), lambda: {'missing': missing})
+
+
+class CoverageBatch(BatchView):
+    """
+    Domain coverage of many proteins at once: every protein of an organism (?taxa_id=), every protein carrying
+    a Pfam (?pfam=[PFAM ID]) and/or a list of ids, optionally limited to ?min_coverage= and ?max_coverage=.
+    Coverage is kept up to date on the protein rows, so each selection is a single query streamed in chunks.
+
+    [ref]: http://127.0.0.1:8000/api/coverage/batch?taxa_id=[TAXA ID]&max_coverage=0.5
+    [ref]: http://127.0.0.1:8000/api/coverage/batch {"ids": [[PROTEIN ID], ...]}
+    """
+
+    def get_number(self, request, name, cast):
+        value = request.query_params.get(name)
+        try:
+            number = cast(value) if value is not None else None
+        except ValueError:
+            raise exceptions.ValidationError({name: 'must be a number'})
+        # float('nan') parses, but compares false with every coverage
+        if number != number:
+            raise exceptions.ValidationError({name: 'must be a number'})
+        return number
+
+    def get_queryset(self):
+        request = self.request
+        queryset = Protein.objects.all()
+        taxaId = self.get_number(request, 'taxa_id', int)
+        if taxaId is not None:
+            queryset = queryset.filter(organism_id__taxa_id=taxaId)
+        pfam = request.query_params.get('pfam')
+        if pfam is not None:
+            queryset = queryset.filter(id__in=ProteinDomains.objects.filter(domain__pfam_id__domain_id=pfam).values('protein_id'))
+        return queryset
+
+    def get_range(self, request):
+        return self.get_number(request, 'min_coverage', float), self.get_number(request, 'max_coverage', float)
+
+    def get(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        low, high = self.get_range(request)
+        queryset = self.get_queryset()
+        inRange = lambda coverage: (low is None or coverage >= low) and (high is None or coverage <= high)
+
+        if ids is None:
+            if low is not None:
+                queryset = queryset.filter(coverage__gte=low)
+            if high is not None:
+                queryset = queryset.filter(coverage__lte=high)
+            rows = queryset.order_by('id').values('protein_id', 'coverage')
+            return self.stream(request, chunked(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE), EXPORT_CHUNK_SIZE))
+
+        missing = []
+
+        # ids filtered out by ?taxa_id=/?pfam= or outside the range exist and are left out, only ids matching no
+        # protein at all are missing: existence is looked up on every protein, the filters become a flag on the row
+        selected = Exists(queryset.filter(pk=OuterRef('pk'))) if queryset.query.has_filters() else Value(True)
+
+        def chunks():
+            for chunk in chunked(ids, self.chunk_size):
+                rows = Protein.objects.filter(protein_id__in=chunk).annotate(selected=selected)
+                found = {proteinId: (coverage, chosen) for proteinId, coverage, chosen in rows.values_list('protein_id', 'coverage', 'selected')}
+                missing.extend(proteinId for proteinId in chunk if proteinId not in found)
+                yield [{'protein_id': proteinId, 'coverage': found[proteinId][0]} for proteinId in chunk
+                       if proteinId in found and found[proteinId][1] and inRange(found[proteinId][0])]
+
+        return self.stream(request, chunks(), lambda: {'missing': missing})
+
+
+class PfamDetail(ConditionalGetMixin, CachedResponseMixin, generics.GenericAPIView, mixins.RetrieveModelMixin):
     """
     Retrieve the domain and its description.
 
@@ -263,6 +674,11 @@ class PfamDetail(generics.GenericAPIView, mixins.RetrieveModelMixin):
     serializer_class = PfamSerializer
     lookup_field = 'domain_id'
     lookup_url_kwarg = 'pfam_id'
+    version_scopes = ['dataset', 'pfam']
+    cache_endpoint = 'pfam'
+
+    def get_cache_entities(self):
+        return [('pfam', self.kwargs['pfam_id'])]
 
     def get_queryset(self):
         queryset = Pfam.objects.all()
@@ -274,7 +690,20 @@ class PfamDetail(generics.GenericAPIView, mixins.RetrieveModelMixin):
         return queryset
 
     def get(self, request, *args, **kwargs):
-        return self.retrieve(self, request, *args, **kwargs)
+        return self.not_modified(request) or self.cached(request, lambda: self.retrieve(self, request, *args, **kwargs))
+
+
+class CacheStats(generics.GenericAPIView):
+    """
+    Hit, miss and eviction counters of the response cache in this worker process.
+
+    [ref]: http://127.0.0.1:8000/api/cache/stats
+    """
+
+    pagination_class = None
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats())
 
                
         
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CallerConfig(AppConfig):
     name = 'caller'
+
+    def ready(self):
+        from .db import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='caller.apply_sqlite_pragmas')
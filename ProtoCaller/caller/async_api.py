@@ -0,0 +1,225 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+#my code starts here
+
+# Native async versions of the read endpoints, for deployments under an ASGI server (ProtoCaller/asgi.py).
+# DRF views are sync only, so under ASGI every request to caller.api holds a worker thread for its whole
+# duration; these views await the async ORM instead and give the thread back between queries.
+# They answer with the same JSON bytes, ETags and cache entries as their counterparts in caller.api (the
+# tests compare the two), without the content negotiation: they always render JSON.
+
+from .builders import *
+from .cache import CachedResponse, query_key, response_cache
+from .models import *
+from .pagination import AsyncPageNumberPagination
+from .renderers import ORJSONRenderer
+
+JSON_MEDIA_TYPE = 'application/json'
+
+
+class AsyncReadView(View):
+    """
+    Base for the async read views: get_data() builds the response data, the optional conditional GET
+    (version_scopes) and response cache (cache_endpoint) work as ConditionalGetMixin and CachedResponseMixin do.
+    By default the data is the values_fields of the queryset row whose lookup_field (lookup_url_kwarg unless set)
+    matches the URL, or a 404.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    renderer = ORJSONRenderer()
+    # the format part of the ETags and cache keys, shared with the JSON responses of the sync views
+    format = 'json'
+    version_scopes = None
+    cache_endpoint = None
+    cache_entities = None
+    lookup_url_kwarg = None
+    lookup_field = None
+    queryset = None
+    values_fields = ()
+
+    def get_version_scopes(self):
+        return list(self.version_scopes) if self.version_scopes is not None else None
+
+    def get_cache_lookup(self):
+        return self.kwargs[self.lookup_url_kwarg]
+
+    def get_cache_entities(self):
+        # as in CachedResponseMixin, a cached view declares the entities its body is built from
+        if self.cache_entities is None:
+            raise ImproperlyConfigured(f'{self.__class__.__name__} caches its responses without declaring cache_entities')
+        return list(self.cache_entities)
+
+    def get_queryset(self):
+        assert self.queryset is not None, (
+            "'%s' should either include a `queryset` attribute, or override the `get_queryset()` method." % self.__class__.__name__)
+        return self.queryset.all()
+
+    async def get_data(self, request):
+        lookup = {self.lookup_field or self.lookup_url_kwarg: self.kwargs[self.lookup_url_kwarg]}
+        row = await self.get_queryset().filter(**lookup).values(*self.values_fields).afirst()
+        if row is None:
+            raise Http404('No %s matches the given query' % self.queryset.model._meta.object_name)
+        return row
+
+    async def render_entry(self, request):
+        content = self.renderer.render(await self.get_data(request))
+        return {'status': 200, 'content_type': JSON_MEDIA_TYPE, 'content': content}
+
+    async def cached(self, request):
+        # no cache_endpoint: a view that is not cached; with one, the entities must be declared, cache on or off
+        entities = self.get_cache_entities() if self.cache_endpoint is not None else None
+        if not response_cache.enabled or self.cache_endpoint is None:
+            entry = await self.render_entry(request)
+        else:
+            key = await response_cache.aresponse_key(self.cache_endpoint, self.get_cache_lookup(), self.format,
+                                                     query_key(request.GET), entities)
+            entry = await response_cache.aget_or_compute(key, lambda: self.render_entry(request), lambda entry: True)
+        return CachedResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+
+    async def get(self, request, *args, **kwargs):
+        etag = lastModified = None
+        scopes = self.get_version_scopes()
+        if scopes is not None:
+            versions, modified = await DataVersion.objects.acurrent(scopes)
+            etag = '"%s-%s"' % (self.format, '.'.join(str(version) for version in versions))
+            lastModified = modified.timestamp() if modified is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=lastModified)
+            if response is not None:
+                return response
+
+        # errors (Http404) are raised out of the cache computation, so only successful bodies are stored
+        response = await self.cached(request)
+        if etag is not None:
+            response['ETag'] = etag
+            if lastModified is not None:
+                response['Last-Modified'] = http_date(lastModified)
+        return response
+
+
+class AsyncPageView(AsyncReadView):
+    """
+    Base for the paginated async listings: same ?page= pages and links as the default DRF pagination. By default
+    a page is the values_fields of the queryset rows as they come; get_queryset and build shape them otherwise.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().values(*self.values_fields)
+
+    def build(self, rows):
+        return list(rows)
+
+    async def get_data(self, request):
+        paginator = AsyncPageNumberPagination()
+        rows = await paginator.apaginate(self.get_queryset(), request)
+        return paginator.get_paginated_data(self.build(rows))
+
+
+class AsyncProteinDetail(AsyncReadView):
+    """
+    Retrieve the protein sequence and all information about it. Takes ?fields= and ?expand= as /api/protein/ does.
+
+    [ref]: http://127.0.0.1:8000/api/async/protein/[PROTEIN ID]
+    """
+
+    lookup_url_kwarg = 'protein_id'
+    version_scopes = ['dataset', 'protein', 'domain', 'pfam', 'organism']
+    cache_endpoint = 'protein'
+
+    def get_cache_entities(self):
+        return [('protein', self.kwargs['protein_id'])]
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.shape = ProteinShape.from_query(request.GET, DETAIL_SHAPE)
+        except ValueError as error:
+            # answered as the ValidationError of the sync view
+            errors = {name: [message] for name, message in error.args[0].items()}
+            return HttpResponse(self.renderer.render(errors), status=400, content_type=JSON_MEDIA_TYPE)
+        return await super().get(request, *args, **kwargs)
+
+    async def get_data(self, request):
+        shape = self.shape
+        proteinRows = [row async for row in protein_values(Protein.objects.filter(protein_id=self.kwargs['protein_id']), shape)[:1]]
+        if not proteinRows:
+            raise Http404('No such protein')
+        domainRows = []
+        if shape.has('domains'):
+            domainRows = [row async for row in protein_domain_values([proteinRows[0]['id']], shape)]
+        return build_proteins(proteinRows, domainRows, shape)[0]
+
+
+class AsyncPfamDetail(AsyncReadView):
+    """
+    Retrieve the domain and its description.
+
+    [ref]: http://127.0.0.1:8000/api/async/pfam/[PFAM ID]
+    """
+
+    lookup_url_kwarg = 'pfam_id'
+    version_scopes = ['dataset', 'pfam']
+    cache_endpoint = 'pfam'
+    lookup_field = 'domain_id'
+    queryset = Pfam.objects.all()
+    values_fields = ('id', 'domain_id', 'domain_description')
+
+    def get_cache_entities(self):
+        return [('pfam', self.kwargs['pfam_id'])]
+
+
+class AsyncCoverageDetail(AsyncReadView):
+    """
+    Retrieve the domain coverage for a given protein.
+
+    [ref]: http://127.0.0.1:8000/api/async/coverage/[PROTEIN ID]
+    """
+
+    lookup_url_kwarg = 'protein_id'
+    cache_endpoint = 'coverage'
+    queryset = Protein.objects.all()
+    values_fields = ('coverage',)
+
+    def get_cache_entities(self):
+        return [('protein', self.kwargs['protein_id'])]
+
+
+class AsyncOrganismProteinList(AsyncPageView):
+    """
+    List all proteins for a given organism.
+
+    [ref]: http://127.0.0.1:8000/api/async/proteins/[TAXA ID]
+    """
+
+    def get_queryset(self):
+        return organism_protein_values(Protein.objects.filter(organism_id__taxa_id=self.kwargs['taxa_id']).order_by('id'))
+
+    def build(self, rows):
+        return build_organism_proteins(rows)
+
+
+class AsyncOrganismPfamList(AsyncPageView):
+    """
+    List the distinct Pfams found in the proteins of a given organism, with how often each occurs.
+
+    [ref]: http://127.0.0.1:8000/api/async/pfams/[TAXA ID]
+    """
+
+    lookup_url_kwarg = 'taxa_id'
+    # not the sync listing's 'organism_pfams': the pages carry absolute links back to the endpoint they came from
+    cache_endpoint = 'async_organism_pfams'
+
+    def get_version_scopes(self):
+        return ['dataset', 'pfam', DataVersion.taxa_scope(self.kwargs['taxa_id'])]
+
+    def get_cache_entities(self):
+        return [('taxa', self.kwargs['taxa_id'])]
+
+    def get_queryset(self):
+        return organism_pfam_values(OrganismPfam.objects.filter(organism__taxa_id=self.kwargs['taxa_id']).order_by('pfam_id'))
+
+    def build(self, rows):
+        return build_organism_pfams(rows)
+
+#my code ends here
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from .fields import decode_sequence
+from .models import *
+#my code starts here
+
+# Read-only fast path for the hot GET endpoints: the same JSON as the serializers in serializers.py, built
+# straight from .values() rows. Fetching (the *_values functions, which only build querysets) and assembling
+# (the build_* functions, plain dict work with no database access) are kept apart so either half can be reused
+# on its own, e.g. evaluated in a worker thread and assembled elsewhere.
+# Any change to a serializer's output has to be made here as well; the golden tests in tests.py compare the two.
+
+ORGANISM_VALUES = ('organism_id', 'organism_id__taxa_id', 'organism_id__clade', 'organism_id__genus', 'organism_id__species')
+PFAM_VALUES = ('pfam_id', 'pfam_id__domain_id', 'pfam_id__domain_description')
+DOMAIN_VALUES = ('id', 'description', 'start', 'stop') + PFAM_VALUES
+PROTEIN_DOMAIN_VALUES = ('protein_id',) + tuple('domain__' + name for name in DOMAIN_VALUES)
+
+# the fields of a protein, in the order ProteinSerializer renders them, and the relations ?expand= can name
+PROTEIN_FIELDS = ('protein_id', 'sequence', 'taxonomy', 'length', 'domains')
+PROTEIN_EXPANSIONS = ('taxonomy', 'domains', 'domains.pfam')
+
+
+class ProteinShape:
+    """
+    The fields a protein response carries (?fields=) and which of its relations are expanded into nested
+    objects (?expand=). A relation that is not expanded is rendered as its key: the taxa id, the domain ids
+    or the Pfam accession. Only the columns, joins and queries the shape needs are read.
+    """
+
+    def __init__(self, fields=PROTEIN_FIELDS, expand=PROTEIN_EXPANSIONS):
+        self.fields = tuple(name for name in PROTEIN_FIELDS if name in fields)
+        self.expand = frozenset(expand)
+
+    @classmethod
+    def from_query(cls, params, default):
+        """The shape asked for in the query parameters, `default` for the parameters not given. ValueError on unknown names."""
+        fields = default.fields
+        if params.get('fields'):
+            fields = cls.split(params['fields'], 'fields', PROTEIN_FIELDS)
+        expand = default.expand
+        if 'expand' in params:
+            # expanding domains.pfam expands the domains it hangs from as well
+            expand = {'.'.join(name.split('.')[:n + 1]) for name in cls.split(params['expand'], 'expand', PROTEIN_EXPANSIONS)
+                      for n in range(name.count('.') + 1)}
+        return cls(fields, expand)
+
+    @staticmethod
+    def split(value, param, choices):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in choices]
+        if unknown:
+            raise ValueError({param: f'unknown {", ".join(unknown)}, choose from {", ".join(choices)}'})
+        return names
+
+    def has(self, name):
+        return name in self.fields
+
+    def expands(self, name):
+        return name in self.expand
+
+    def protein_values(self):
+        names = ['id']  # what the domain rows are matched on
+        if self.has('protein_id'):
+            names.append('protein_id')
+        if self.has('sequence'):
+            names.append('sequence')
+        if self.has('taxonomy'):
+            names += ORGANISM_VALUES if self.expands('taxonomy') else ['organism_id__taxa_id']
+        if self.has('length'):
+            names.append('length')
+        return names
+
+    def domain_values(self):
+        if not self.expands('domains'):
+            # the link table alone, no join
+            return ('protein_id', 'domain_id')
+        if self.expands('domains.pfam'):
+            return PROTEIN_DOMAIN_VALUES
+        return ('protein_id', 'domain__description', 'domain__start', 'domain__stop', 'domain__pfam_id__domain_id')
+
+
+# what /api/protein/<id> and /api/proteins return when no ?fields= or ?expand= is given
+DETAIL_SHAPE = ProteinShape()
+SUMMARY_SHAPE = ProteinShape(fields=[name for name in PROTEIN_FIELDS if name != 'sequence'])
+
+
+def protein_values(queryset, shape=SUMMARY_SHAPE):
+    """Protein rows (with their organism joined in, if the shape renders it) as dicts."""
+    return queryset.select_related(None).prefetch_related(None).values(*shape.protein_values())
+
+
+def domain_values(queryset):
+    """Domain rows (with their Pfam joined in) as dicts."""
+    return queryset.select_related(None).values(*DOMAIN_VALUES)
+
+
+def protein_domain_values(proteinIds, shape=SUMMARY_SHAPE):
+    """The domain rows of the given proteins, in the order the prefetch in ProteinQuerySet.with_domains() returns them."""
+    return ProteinDomains.objects.filter(protein_id__in=proteinIds).order_by('domain_id').values(*shape.domain_values())
+
+
+def organism_protein_values(queryset, *extra):
+    return queryset.values('id', 'protein_id', *extra)
+
+
+def organism_pfam_values(queryset, *extra):
+    """OrganismPfam summary rows (with their Pfam joined in) as dicts."""
+    return queryset.select_related(None).values('pfam_id', 'pfam__domain_id', 'pfam__domain_description', 'occurrences', 'proteins', *extra)
+
+
+def build_pfam(row, prefix, withId):
+    if row[prefix] is None:
+        return None
+    pfam = {'id': row[prefix]} if withId else {}
+    pfam['domain_id'] = row[prefix + '__domain_id']
+    pfam['domain_description'] = row[prefix + '__domain_description']
+    return pfam
+
+
+def build_domain(row, prefix='', withId=True):
+    """A domain as DomainSerializer renders it, or as it is nested in a protein (withId=False)."""
+    domain = {'id': row[prefix + 'id']} if withId else {}
+    domain['pfam_id'] = build_pfam(row, prefix + 'pfam_id', withId)
+    domain['description'] = row[prefix + 'description']
+    domain['start'] = row[prefix + 'start']
+    domain['stop'] = row[prefix + 'stop']
+    return domain
+
+
+def build_domains(rows):
+    return [build_domain(row) for row in rows]
+
+
+def build_taxonomy(row, shape=SUMMARY_SHAPE):
+    if not shape.expands('taxonomy'):
+        return row['organism_id__taxa_id']
+    if row['organism_id'] is None:
+        return None
+    return {
+        'taxa_id': row['organism_id__taxa_id'],
+        'clade': row['organism_id__clade'],
+        'genus': row['organism_id__genus'],
+        'species': row['organism_id__species'],
+    }
+
+
+def build_protein_domain(row, shape):
+    if not shape.expands('domains'):
+        return row['domain_id']
+    if shape.expands('domains.pfam'):
+        return build_domain(row, 'domain__', withId=False)
+    return {'pfam_id': row['domain__pfam_id__domain_id'], 'description': row['domain__description'],
+            'start': row['domain__start'], 'stop': row['domain__stop']}
+
+
+def build_proteins(proteinRows, domainRows, shape=SUMMARY_SHAPE):
+    """
+    Proteins as ProteinSerializer (DETAIL_SHAPE) or ProteinSummarySerializer (SUMMARY_SHAPE) renders them,
+    or narrowed down to another shape.
+    """
+    domains = defaultdict(list)
+    for row in domainRows:
+        domains[row['protein_id']].append(build_protein_domain(row, shape))
+
+    proteins = []
+    for row in proteinRows:
+        protein = {}
+        if shape.has('protein_id'):
+            protein['protein_id'] = row['protein_id']
+        if shape.has('sequence'):
+            protein['sequence'] = decode_sequence(row['sequence'])
+        if shape.has('taxonomy'):
+            protein['taxonomy'] = build_taxonomy(row, shape)
+        if shape.has('length'):
+            protein['length'] = row['length']
+        if shape.has('domains'):
+            protein['domains'] = domains.get(row['id'], [])
+        proteins.append(protein)
+    return proteins
+
+
+def build_organism_proteins(rows):
+    return [{'protein_id': row['protein_id'], 'id': row['id']} for row in rows]
+
+
+def build_organism_pfams(rows):
+    """The Pfams of an organism as OrganismDomainSerializer renders them."""
+    return [{'id': row['pfam_id'], 'domain_id': row['pfam__domain_id'], 'domain_description': row['pfam__domain_description'],
+             'occurrences': row['occurrences'], 'proteins': row['proteins']} for row in rows]
+
+
+def fetch_proteins(proteinRows, shape=SUMMARY_SHAPE):
+    """Evaluate a page of protein rows and their domains (unless the shape leaves them out) and assemble them."""
+    proteinRows = list(proteinRows)
+    domainRows = protein_domain_values([row['id'] for row in proteinRows], shape) if shape.has('domains') and proteinRows else []
+    return build_proteins(proteinRows, domainRows, shape)
+
+
+def fetch_proteins_by_id(proteinIds, shape=DETAIL_SHAPE):
+    """The proteins among proteinIds (accessions) that exist, keyed on their accession. Two queries whatever the count."""
+    proteins = fetch_proteins(protein_values(Protein.objects.filter(protein_id__in=proteinIds), shape), shape)
+    return {protein['protein_id']: protein for protein in proteins}
+
+#my code ends here
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import urlencode
+#my code starts here
+
+# Cached responses are keyed on the endpoint, the lookup key, the renderer, the query string and the *generations*
+# of the entities the response is built from. Invalidating an entity gives it a new generation, which makes every
+# response built from it unreachable at once; the stale entries are left for the backend to evict.
+# Generations are random tokens rather than counters, so a generation evicted from the cache can never come back
+# as an old value and resurrect stale entries.
+
+EVERYTHING = 'gen:all'
+LOCK_STRIPES = 64
+LEASE_SECONDS = 10
+LEASE_POLL = 0.05
+# keys remembered per process to tell a miss on an evicted/expired entry from a miss on a new one
+TRACKED_KEYS = 100000
+
+
+def query_key(params):
+    """The query string part of a response key: the parameters in a stable order, without ?format=."""
+    return urlencode(sorted((name, values) for name, values in params.lists() if name != 'format'), doseq=True)
+
+
+class CachedResponse(HttpResponse):
+    """A response served from the cache. Its body is already rendered, render() is there for callers expecting a DRF Response."""
+
+    def render(self):
+        return self
+
+
+class Flight:
+    """One computation of a key in progress in this process, which the other threads asking for the key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+class ResponseCache:
+    """Response cache with per-entity invalidation, hit/miss/eviction counters and stampede protection."""
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        # the stripe locks only guard the registry of computations in flight, they are never held while waiting or computing
+        self.stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.flights = {}
+        self.counterLock = threading.Lock()
+        self.counters = Counter()
+        self.stored = OrderedDict()
+
+    @property
+    def cache(self):
+        return caches[self.alias or settings.RESPONSE_CACHE_ALIAS]
+
+    @property
+    def enabled(self):
+        return self.get_timeout() != 0
+
+    def get_timeout(self):
+        return settings.RESPONSE_CACHE_TIMEOUT if self.timeout is None else self.timeout
+
+    def count(self, name, n=1):
+        with self.counterLock:
+            self.counters[name] += n
+
+    def stats(self):
+        with self.counterLock:
+            stats = {name: self.counters[name] for name in ('hits', 'misses', 'evictions', 'collapsed', 'invalidations')}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else None
+        stats['backend'] = self.cache.__class__.__name__
+        return stats
+
+    def reset_stats(self):
+        with self.counterLock:
+            self.counters.clear()
+            self.stored.clear()
+
+    def clear(self):
+        self.cache.clear()
+        self.reset_stats()
+
+    # generations
+
+    @staticmethod
+    def generation_key(kind, key):
+        return f'gen:{kind}:{key}'
+
+    def generations(self, entities):
+        """The current generation tokens of (kind, key) entities, creating the missing ones."""
+        keys = [EVERYTHING] + [self.generation_key(kind, key) for kind, key in entities]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                token = uuid.uuid4().hex
+                # add(), so a token set concurrently by another worker wins and everyone agrees on it
+                if not self.cache.add(key, token, timeout=None):
+                    token = self.cache.get(key, token)
+                found[key] = token
+        return [found[key] for key in keys]
+
+    def invalidate(self, proteins=(), taxa=(), pfams=(), everything=False):
+        """
+        Drop the cached responses of the given protein ids, taxa ids and Pfam domain ids (or of everything).
+        Inside a transaction it is done again on commit, so a response rebuilt from the old data in the meantime
+        is not kept.
+        """
+        if not self.enabled:
+            return
+        keys = [EVERYTHING] if everything else []
+        keys += [self.generation_key('protein', key) for key in proteins]
+        keys += [self.generation_key('taxa', key) for key in taxa]
+        keys += [self.generation_key('pfam', key) for key in pfams]
+        if not keys:
+            return
+
+        def bump():
+            self.cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+            self.count('invalidations', len(keys))
+
+        bump()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(bump)
+
+    def invalidate_all(self):
+        self.invalidate(everything=True)
+
+    # lookups
+
+    def response_key(self, endpoint, lookup, renderer, query, entities):
+        parts = [endpoint, str(lookup), renderer, query] + self.generations(entities)
+        return f'resp:{endpoint}:' + hashlib.md5('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def remember(self, key):
+        with self.counterLock:
+            self.stored[key] = True
+            self.stored.move_to_end(key)
+            while len(self.stored) > TRACKED_KEYS:
+                self.stored.popitem(last=False)
+
+    def note_miss(self, key):
+        with self.counterLock:
+            self.counters['misses'] += 1
+            if self.stored.pop(key, None):
+                # this process stored the entry and nothing invalidated it (that changes the key), so it was evicted or expired
+                self.counters['evictions'] += 1
+
+    def wait_for(self, key, leaseKey):
+        # another worker holds the lease on this key: wait for its result rather than computing it a second time,
+        # but only as long as the lease is held, a result that was not cacheable (a 404) never shows up
+        deadline = time.monotonic() + LEASE_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LEASE_POLL)
+            found = self.cache.get_many([key, leaseKey])
+            if key in found:
+                return found[key]
+            if leaseKey not in found:
+                return None
+        return None
+
+    def get_or_compute(self, key, compute, cacheable):
+        """
+        The cached entry for key, or compute() it. Concurrent misses on the same key collapse into a single
+        computation: threads of this process wait for the one computing it, other processes on a lease held
+        in the cache. Entries for which cacheable(entry) is false are returned but neither stored nor handed to
+        the waiting threads, which compute their own.
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.count('hits')
+            return entry
+
+        stripe = self.stripes[hash(key) % LOCK_STRIPES]
+        with stripe:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.entry is not None and cacheable(flight.entry):
+                self.count('hits')
+                self.count('collapsed')
+                return flight.entry
+            # the computation failed, or its result (a 404 holding the leader's response) is not for sharing:
+            # this thread computes its own
+            return self.compute(key, compute, cacheable)
+
+        try:
+            flight.entry = self.compute(key, compute, cacheable)
+            return flight.entry
+        finally:
+            with stripe:
+                del self.flights[key]
+            flight.done.set()
+
+    def compute(self, key, compute, cacheable):
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.count('hits')
+            self.count('collapsed')
+            return entry
+        self.note_miss(key)
+
+        leaseKey = 'lease:' + key
+        leased = self.cache.add(leaseKey, 1, timeout=LEASE_SECONDS)
+        if not leased:
+            entry = self.wait_for(key, leaseKey)
+            if entry is not None:
+                self.count('collapsed')
+                return entry
+        try:
+            entry = compute()
+            if cacheable(entry):
+                self.cache.set(key, entry, timeout=self.get_timeout())
+                self.remember(key)
+        finally:
+            if leased:
+                self.cache.delete(leaseKey)
+        return entry
+
+    # the same lookups for the async views
+
+    async def aresponse_key(self, endpoint, lookup, renderer, query, entities):
+        return await sync_to_async(self.response_key)(endpoint, lookup, renderer, query, entities)
+
+    async def await_for(self, key, leaseKey):
+        deadline = time.monotonic() + LEASE_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LEASE_POLL)
+            found = await self.cache.aget_many([key, leaseKey])
+            if key in found:
+                return found[key]
+            if leaseKey not in found:
+                return None
+        return None
+
+    async def aget_or_compute(self, key, compute, cacheable):
+        """
+        get_or_compute() for the async views, compute being a coroutine function. Requests on one event loop
+        do not block each other, so concurrent misses collapse on the cache lease alone.
+        """
+        entry = await self.cache.aget(key)
+        if entry is not None:
+            self.count('hits')
+            return entry
+        self.note_miss(key)
+
+        leaseKey = 'lease:' + key
+        leased = await self.cache.aadd(leaseKey, 1, timeout=LEASE_SECONDS)
+        if not leased:
+            entry = await self.await_for(key, leaseKey)
+            if entry is not None:
+                self.count('collapsed')
+                return entry
+        try:
+            entry = await compute()
+            if cacheable(entry):
+                await self.cache.aset(key, entry, timeout=self.get_timeout())
+                self.remember(key)
+        finally:
+            if leased:
+                await self.cache.adelete(leaseKey)
+        return entry
+
+
+response_cache = ResponseCache()
+
+#my code ends here
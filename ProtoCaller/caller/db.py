@@ -0,0 +1,19 @@
+from django.conf import settings
+#my code starts here
+
+READ_ONLY_PRAGMAS = {'mmap_size', 'cache_size', 'temp_store'}
+
+# sqlite pragmas are per connection, so they are (re)applied whenever django opens one
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    readOnly = connection.alias in getattr(settings, 'DATABASE_REPLICAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # replicas are opened read-only, so leave their journal settings alone
+            if readOnly and name not in READ_ONLY_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+#my code ends here
@@ -0,0 +1,114 @@
+import struct
+import zlib
+from django import forms
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+#my code starts here
+
+# Sequences are stored as a one byte format tag, a 4 byte residue count and the payload:
+#   PACKED  - residues from ALPHABET as 5 bit codes, 8 residues to every 5 bytes
+#   ZLIB    - anything else (lower case, unusual symbols) as zlib compressed utf-8, so nothing is ever lost
+PACKED = 1
+ZLIB = 2
+HEADER = struct.Struct('>BI')
+
+# the 20 standard amino acids, the ambiguity/rare codes, stop and gap: 28 of the 32 available codes
+ALPHABET = 'ACDEFGHIKLMNPQRSTVWYBZXUOJ*-'
+CODES = {residue: code for code, residue in enumerate(ALPHABET)}
+
+
+def encode_sequence(sequence):
+    """Pack an amino-acid sequence into its stored binary form."""
+    if not set(sequence).issubset(CODES):
+        return HEADER.pack(ZLIB, len(sequence)) + zlib.compress(sequence.encode('utf-8'))
+
+    codes = [CODES[residue] for residue in sequence]
+    codes += [0] * (-len(codes) % 8)
+    packed = bytearray(HEADER.pack(PACKED, len(sequence)))
+    for start in range(0, len(codes), 8):
+        group = 0
+        for code in codes[start:start + 8]:
+            group = (group << 5) | code
+        packed += group.to_bytes(5, 'big')
+    return bytes(packed)
+
+
+def decode_sequence(data):
+    """Unpack a stored sequence back into a string. Plain strings (rows written before packing) pass through."""
+    if isinstance(data, str):
+        return data
+    data = bytes(data)
+    kind, length = HEADER.unpack_from(data)
+    payload = data[HEADER.size:]
+    if kind == ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+
+    residues = []
+    for start in range(0, len(payload), 5):
+        group = int.from_bytes(payload[start:start + 5], 'big')
+        residues.extend(ALPHABET[(group >> shift) & 31] for shift in range(35, -5, -5))
+    return ''.join(residues[:length])
+
+
+class PackedSequenceDescriptor(DeferredAttribute):
+    """Keeps the packed bytes loaded from the database on the instance and only decodes them on first access."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = decode_sequence(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # a data descriptor, otherwise the value in __dict__ would shadow __get__ and skip the decoding
+        instance.__dict__[self.field.attname] = value
+
+
+class PackedSequenceField(models.Field):
+    """An amino-acid sequence of any length, stored packed in a binary column and decoded lazily."""
+
+    description = 'Packed amino-acid sequence'
+    descriptor_class = PackedSequenceDescriptor
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        return bytes(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decode_sequence(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        # bytes that were loaded but never read are saved back as they are, without a decode/encode round trip
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, (bytes, memoryview)):
+            return value
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+        return encode_sequence(str(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
+
+#my code ends here
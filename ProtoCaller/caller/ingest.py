@@ -0,0 +1,96 @@
+from django.db import transaction
+from rest_framework import serializers
+#my code starts here
+
+from .models import *
+from .serializers import ProteinRecordSerializer
+
+# largest number of protein records accepted per request
+MAX_RECORDS = 5000
+
+
+def validate_records(records):
+    """
+    Validate every record in one pass, without touching the database.
+    Returns the valid records as (index, validated data) and the errors as {index: errors}.
+    """
+    serializer = ProteinRecordSerializer()
+    valid = []
+    errors = {}
+    seen = set()
+    for index, record in enumerate(records):
+        try:
+            data = serializer.run_validation(record)
+        except serializers.ValidationError as error:
+            errors[index] = error.detail
+            continue
+        if data['protein_id'] in seen:
+            errors[index] = {'protein_id': ['repeated in this batch']}
+            continue
+        seen.add(data['protein_id'])
+        valid.append((index, data))
+    return valid, errors
+
+
+def resolve(model, field, wanted):
+    """
+    Map natural keys to primary keys, creating the rows that are missing from the first record carrying them.
+    Existing rows are reused as they are, like the get_or_create of the single record POST.
+    """
+    existing = dict(model.objects.filter(**{field + '__in': list(wanted)}).values_list(field, 'id'))
+    missing = [model(**data) for key, data in wanted.items() if key not in existing]
+    # bulk_create sets the primary keys the database assigned on the instances
+    existing.update((getattr(row, field), row.pk) for row in model.objects.bulk_create(missing))
+    return existing
+
+
+def write_records(valid):
+    """Write validated records (none of which exists yet) with set based lookups and bulk inserts."""
+    organisms = {}
+    pfams = {}
+    for index, data in valid:
+        organisms.setdefault(data['organism_id']['taxa_id'], data['organism_id'])
+        for domain in data['domains']:
+            pfams.setdefault(domain['pfam_id']['domain_id'], domain['pfam_id'])
+
+    organismIds = resolve(Organism, 'taxa_id', organisms)
+    pfamIds = resolve(Pfam, 'domain_id', pfams)
+
+    proteins = Protein.objects.bulk_create([
+        Protein(protein_id=data['protein_id'], sequence=data['sequence'], length=data['length'],
+                organism_id_id=organismIds[data['organism_id']['taxa_id']])
+        for index, data in valid])
+    proteinIds = {protein.protein_id: protein.pk for protein in proteins}
+
+    # (protein id, domain) pairs, the domains get their ids from the insert and are linked after it
+    domains = [(proteinIds[data['protein_id']],
+                Domain(pfam_id_id=pfamIds[domain['pfam_id']['domain_id']], description=domain['description'],
+                       start=domain['start'], stop=domain['stop']))
+               for index, data in valid for domain in data['domains']]
+    Domain.objects.bulk_create([domain for proteinId, domain in domains])
+    ProteinDomains.objects.bulk_create([ProteinDomains(protein_id=proteinId, domain_id=domain.pk) for proteinId, domain in domains])
+
+    OrganismPfam.objects.rebuild(organisms=set(organismIds[taxaId] for taxaId in organisms))
+    Protein.objects.refresh_coverage(list(proteinIds.values()))
+    # nothing above went through Model.save()
+    DataVersion.objects.changed('protein', 'domain', 'pfam', 'organism', proteins=list(proteinIds), taxa=list(organisms), pfams=list(pfams))
+    return [data['protein_id'] for index, data in valid]
+
+
+def ingest_proteins(records):
+    """
+    Create many proteins (with their organisms, domains and Pfams) in one transaction.
+    Invalid records and proteins that already exist are reported per record and do not stop the others.
+    Returns the protein ids created and {index: errors}.
+    """
+    valid, errors = validate_records(records)
+    with transaction.atomic():
+        existing = set(Protein.objects.filter(protein_id__in=[data['protein_id'] for index, data in valid]).values_list('protein_id', flat=True))
+        for index, data in valid:
+            if data['protein_id'] in existing:
+                errors[index] = {'protein_id': ['protein with this protein id already exists.']}
+        valid = [(index, data) for index, data in valid if data['protein_id'] not in existing]
+        created = write_records(valid) if valid else []
+    return created, errors
+
+#my code ends here
@@ -0,0 +1,125 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from django.db import connection, transaction
+#my code starts here
+
+# shared helpers for the benchmark commands, the leading underscore keeps django from listing this module as a command
+
+from caller.models import *
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+@contextmanager
+def scratchDatabase(keep=False):
+    """Point the default connection at a throw-away, fully migrated SQLite file and restore the real database afterwards."""
+    tmpdir = tempfile.mkdtemp(prefix='protocaller-bench-')
+    path = os.path.join(tmpdir, 'bench.sqlite3')
+    testSettings = connection.settings_dict.setdefault('TEST', {})
+    oldTestName = testSettings.get('NAME')
+    testSettings['NAME'] = path
+    oldName = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield path
+    finally:
+        connection.creation.destroy_test_db(oldName, verbosity=0, keepdb=keep)
+        testSettings['NAME'] = oldTestName
+        if not keep:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class SyntheticDataset:
+    """Generates a deterministic protein catalogue that can be grown in steps (e.g. 10k -> 100k -> 1M proteins)."""
+
+    def __init__(self, maxProteins, domainsPerProtein=2, proteinsPerOrganism=100, pfams=2000, batchSize=5000, seed=0):
+        self.maxProteins = maxProteins
+        self.domainsPerProtein = domainsPerProtein
+        self.organisms = max(1, maxProteins // proteinsPerOrganism)
+        self.pfams = pfams
+        self.batchSize = batchSize
+        self.size = 0
+        rng = random.Random(seed)
+        # a small pool of sequences is enough, generating a fresh one per protein dominates the set up time
+        self.sequences = [''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(100, 600))) for _ in range(64)]
+
+    @staticmethod
+    def proteinId(n):
+        return 'BENCH%08d' % n
+
+    @staticmethod
+    def taxaId(n):
+        return n + 1
+
+    @staticmethod
+    def pfamId(n):
+        return 'PF%05d' % n
+
+    def seed(self):
+        with transaction.atomic():
+            Pfam.objects.bulk_create(
+                [Pfam(id=n + 1, domain_id=self.pfamId(n), domain_description='synthetic domain %d' % n) for n in range(self.pfams)],
+                batch_size=self.batchSize)
+            Organism.objects.bulk_create(
+                [Organism(id=n + 1, taxa_id=self.taxaId(n), clade='E', genus='Genus%d' % n, species='species%d' % n) for n in range(self.organisms)],
+                batch_size=self.batchSize)
+
+    def grow(self, size):
+        """Add proteins (with their domains) until the catalogue holds `size` proteins."""
+        if self.size == 0:
+            self.seed()
+        size = min(size, self.maxProteins)
+        for start in range(self.size, size, self.batchSize):
+            stop = min(start + self.batchSize, size)
+            proteins = []
+            domains = []
+            proteinDomains = []
+            for n in range(start, stop):
+                sequence = self.sequences[n % len(self.sequences)]
+                proteins.append(Protein(id=n + 1, protein_id=self.proteinId(n), organism_id_id=n % self.organisms + 1,
+                                        sequence=sequence, length=len(sequence)))
+                for k in range(self.domainsPerProtein):
+                    domainNo = n * self.domainsPerProtein + k + 1
+                    begin = 1 + k * 50
+                    domains.append(Domain(id=domainNo, pfam_id_id=(n * 7 + k) % self.pfams + 1,
+                                          start=begin, stop=begin + 80, description='synthetic domain'))
+                    proteinDomains.append(ProteinDomains(protein_id=n + 1, domain_id=domainNo))
+            with transaction.atomic():
+                Protein.objects.bulk_create(proteins)
+                Domain.objects.bulk_create(domains)
+                ProteinDomains.objects.bulk_create(proteinDomains)
+        OrganismPfam.objects.rebuild()
+        Protein.objects.refresh_coverage()
+        self.size = max(self.size, size)
+        return self.size
+
+    def sampleKeys(self, count, seed=1):
+        """Random existing lookup keys as (protein_id, taxa_id, pfam domain_id) triples."""
+        rng = random.Random(seed)
+        organisms = min(self.organisms, self.size)
+        return [(self.proteinId(rng.randrange(self.size)), self.taxaId(rng.randrange(organisms)), self.pfamId(rng.randrange(self.pfams)))
+                for _ in range(count)]
+
+
+def timeCalls(func, args):
+    """Call func once per argument and return the per-call durations in seconds."""
+    durations = []
+    for arg in args:
+        began = time.perf_counter()
+        func(arg)
+        durations.append(time.perf_counter() - began)
+    return durations
+
+
+def summarise(durations):
+    """Mean, p50 and p99 (in milliseconds) of a list of durations in seconds."""
+    ordered = sorted(durations)
+    if not ordered:
+        return {'mean': 0.0, 'p50': 0.0, 'p99': 0.0}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'mean': sum(ordered) / len(ordered) * 1000, 'p50': pick(0.50), 'p99': pick(0.99)}
+
+#my code ends here
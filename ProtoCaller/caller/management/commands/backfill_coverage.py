@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+#my code starts here
+
+from caller.models import *
+
+
+class Command(BaseCommand):
+    help = 'Computes the stored domain coverage of every protein with one aggregate SQL statement'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Protein.objects.refresh_coverage()
+        self.stdout.write(f'coverage computed for {Protein.objects.count()} proteins')
+
+#my code ends here
@@ -0,0 +1,164 @@
+import asyncio
+import socket
+import time
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+#my code starts here
+
+from ProtoCaller.asgi import application
+from caller.models import *
+from ._benchmark import SyntheticDataset, scratchDatabase, summarise
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+# (sync view, async view) paths per read endpoint
+ENDPOINTS = {
+    'protein': ('/api/protein/{protein}', '/api/async/protein/{protein}'),
+    'pfam': ('/api/pfam/{pfam}', '/api/async/pfam/{pfam}'),
+    'coverage': ('/api/coverage/{protein}', '/api/async/coverage/{protein}'),
+    'organism_proteins': ('/api/proteins/{taxa}', '/api/async/proteins/{taxa}'),
+    'organism_pfams': ('/api/pfams/{taxa}', '/api/async/pfams/{taxa}'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def asgi_get(path):
+    """One GET straight through the ASGI application, without a server or socket in between."""
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+             'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80)}
+    done = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif not message.get('more_body', False):
+            done.set()
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def tcp_get(host, port, path):
+    """One GET on a fresh connection, read to the end."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        data = await reader.read()
+    finally:
+        writer.close()
+    return int(data.split(b' ', 2)[1])
+
+
+class Command(BaseCommand):
+    help = ('Load tests the sync (caller.api) and async (caller.async_api) read views under ASGI at increasing '
+            'numbers of concurrent connections. Serves them with an in-process uvicorn when it is installed, '
+            'or drives the ASGI application directly (--server asgi); --url load tests a server started by hand, '
+            'e.g. uvicorn --workers 4 ProtoCaller.asgi:application, against the current database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proteins', type=int, default=10000, help='size of the scratch catalogue')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128], help='concurrent connections to measure')
+        parser.add_argument('--requests', type=int, default=2000, help='requests per measurement')
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=['protein', 'organism_pfams'])
+        parser.add_argument('--server', choices=['uvicorn', 'asgi'], default='uvicorn' if uvicorn is not None else 'asgi')
+        parser.add_argument('--url', type=str, help='base url of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--cache', action='store_true', help='keep the response cache on (by default every request is computed)')
+
+    def sampleKeys(self, count):
+        # lookups that exist in the database the server reads, whatever its size
+        proteins = list(Protein.objects.order_by('?').values_list('protein_id', flat=True)[:count])
+        pfams = list(Pfam.objects.order_by('?').values_list('domain_id', flat=True)[:count])
+        taxa = list(OrganismPfam.objects.order_by('?').values_list('organism__taxa_id', flat=True)[:count])
+        if not (proteins and pfams and taxa):
+            raise CommandError('the database has no proteins to ask for')
+        return [(proteins[n % len(proteins)], taxa[n % len(taxa)], pfams[n % len(pfams)]) for n in range(count)]
+
+    async def load(self, get, paths, concurrency):
+        """Send every path with `concurrency` clients; returns the durations, the failures and the wall time."""
+        queue = list(reversed(paths))
+        durations = []
+        failures = 0
+
+        async def client():
+            nonlocal failures
+            while queue:
+                path = queue.pop()
+                began = time.perf_counter()
+                try:
+                    status = await get(path)
+                except OSError:
+                    status = None
+                durations.append(time.perf_counter() - began)
+                if status != 200:
+                    failures += 1
+
+        began = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return durations, failures, time.perf_counter() - began
+
+    async def run(self, get, keys, options):
+        for endpoint in options['endpoints']:
+            for label, template in zip(('sync', 'async'), ENDPOINTS[endpoint]):
+                paths = [template.format(protein=protein, taxa=taxa, pfam=pfam) for protein, taxa, pfam in keys]
+                # warm up: connections, url resolver, imports
+                await self.load(get, paths[:20], 4)
+                for concurrency in options['concurrency']:
+                    durations, failures, wall = await self.load(get, paths, concurrency)
+                    stats = summarise(durations)
+                    self.stdout.write(f'{endpoint:<17} {label:<5} {concurrency:>4} conns {len(paths) / wall:>8.0f} req/s '
+                                      f'{stats["p50"]:>8.2f} ms p50 {stats["p99"]:>8.2f} ms p99 {failures:>5} failed')
+
+    async def serve(self, keys, options):
+        if options['server'] == 'asgi':
+            return await self.run(asgi_get, keys, options)
+        if uvicorn is None:
+            raise CommandError('uvicorn is not installed, use --server asgi or --url')
+        port = free_port()
+        # lifespan off: Django's ASGI application only speaks http
+        server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=port, lifespan='off',
+                                               log_level='warning', backlog=4096))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            await self.run(lambda path: tcp_get('127.0.0.1', port, path), keys, options)
+        finally:
+            server.should_exit = True
+            await task
+
+    def handle(self, *args, **options):
+        # with --url the server's own settings apply, --cache only concerns the in-process servers
+        with override_settings(RESPONSE_CACHE_TIMEOUT=settings.RESPONSE_CACHE_TIMEOUT if options['cache'] else 0):
+            if options['url']:
+                url = urlsplit(options['url'])
+                keys = self.sampleKeys(options['requests'])
+                get = lambda path: tcp_get(url.hostname, url.port or 80, path)
+                asyncio.run(self.run(get, keys, options))
+                return
+            with scratchDatabase():
+                dataset = SyntheticDataset(options['proteins'])
+                dataset.grow(options['proteins'])
+                keys = dataset.sampleKeys(options['requests'])
+                asyncio.run(self.serve(keys, options))
+
+#my code ends here
@@ -0,0 +1,92 @@
+import csv
+import os
+import threading
+import time
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+#my code starts here
+
+from caller.api import *
+from ._benchmark import scratchDatabase
+
+# what a bare sqlite3 config gives you: rollback journal, full fsyncs, default caches
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = 'Measures read throughput on /api/protein/<id> while the loader runs, with and without the production SQLite profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pfams', type=str, help='File path for PFAM descriptions, passed on to the loader')
+        parser.add_argument('--proteins', type=str, help='File path for proteins, passed on to the loader')
+        parser.add_argument('--sequences', type=str, help='File path for sequences, passed on to the loader')
+        parser.add_argument('--readers', type=int, default=4, help='concurrent reader threads')
+
+    def proteinIds(self, options):
+        # readers ask for the proteins the loader is writing, whether or not they are in yet
+        path = options['proteins'] or 'assignment_data_set.csv'
+        with open(os.path.join(settings.BASE_DIR, 'data', path)) as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            return list(dict.fromkeys(row[0] for row in reader))[:2000]
+
+    def reader(self, proteinIds, done, results):
+        view = ProteinDetail.as_view()
+        factory = APIRequestFactory()
+        reads = errors = 0
+        n = 0
+        try:
+            while not done.is_set():
+                proteinId = proteinIds[n % len(proteinIds)]
+                n += 1
+                try:
+                    view(factory.get(f'/api/protein/{proteinId}', HTTP_HOST='localhost'), protein_id=proteinId).render()
+                    reads += 1
+                except OperationalError:
+                    # 'database is locked': the reader gave up waiting for the writer
+                    errors += 1
+        finally:
+            connections.close_all()
+        results.append((reads, errors))
+
+    def writer(self, options, done, timing):
+        began = time.perf_counter()
+        try:
+            call_command('loader', pfams=options['pfams'], proteins=options['proteins'],
+                         sequences=options['sequences'], stdout=StringIO())
+        finally:
+            timing.append(time.perf_counter() - began)
+            connections.close_all()
+            done.set()
+
+    def run(self, options, proteinIds):
+        done = threading.Event()
+        results = []
+        timing = []
+        readers = [threading.Thread(target=self.reader, args=(proteinIds, done, results)) for _ in range(options['readers'])]
+        writer = threading.Thread(target=self.writer, args=(options, done, timing))
+        for thread in readers:
+            thread.start()
+        writer.start()
+        writer.join()
+        for thread in readers:
+            thread.join()
+        reads = sum(result[0] for result in results)
+        errors = sum(result[1] for result in results)
+        return reads / timing[0], errors, timing[0]
+
+    def handle(self, *args, **options):
+        proteinIds = self.proteinIds(options)
+        for label, pragmas in [('default', DEFAULT_PRAGMAS), ('production', settings.SQLITE_PRODUCTION_PRAGMAS)]:
+            # new connections (one per thread) pick the pragmas up through the connection_created hook
+            with override_settings(SQLITE_PRAGMAS=pragmas), scratchDatabase():
+                connections.close_all()
+                readsPerSec, errors, loadTime = self.run(options, proteinIds)
+            self.stdout.write(f'{label:<11} {readsPerSec:>9.0f} reads/s during load, {errors} locked reads, loader took {loadTime:.1f}s')
+
+#my code ends here
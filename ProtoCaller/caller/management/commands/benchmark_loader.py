@@ -0,0 +1,85 @@
+import csv
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+#my code starts here
+
+from caller.models import *
+from ._benchmark import AMINO_ACIDS, SyntheticDataset, scratchDatabase
+
+# the tables the loader writes, with the columns compared between the engines
+TABLES = [
+    (Pfam, ['id', 'domain_id', 'domain_description']),
+    (Organism, ['id', 'taxa_id', 'clade', 'genus', 'species']),
+    (Protein, ['id', 'protein_id', 'length', 'organism_id_id', 'coverage', 'sequence']),
+    (Domain, ['id', 'pfam_id_id', 'start', 'stop', 'description']),
+    (ProteinDomains, ['id', 'protein_id', 'domain_id']),
+    (OrganismPfam, ['organism_id', 'pfam_id', 'occurrences', 'proteins']),
+]
+
+
+def write_inputs(folder, proteins, domainsPerProtein=2, proteinsPerOrganism=100, pfams=2000, seed=0):
+    """Write a deterministic pfams/proteins/sequences CSV triple in the loader's format; returns the file paths and the row count."""
+    rng = random.Random(seed)
+    paths = {name: os.path.join(folder, name + '.csv') for name in ('pfams', 'proteins', 'sequences')}
+    organisms = max(1, proteins // proteinsPerOrganism)
+    sequences = [''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(100, 600))) for _ in range(64)]
+    with open(paths['pfams'], 'w', newline='') as pfamFile, open(paths['proteins'], 'w', newline='') as proteinFile, \
+            open(paths['sequences'], 'w', newline='') as sequenceFile:
+        csv.writer(pfamFile).writerows([['pfam', 'description']] + [[SyntheticDataset.pfamId(n), 'synthetic domain %d' % n] for n in range(pfams)])
+        proteinRows = csv.writer(proteinFile)
+        proteinRows.writerow(['protein_id', 'taxa_id', 'clade', 'genus species', 'domain description', 'pfam', 'start', 'stop', 'length'])
+        sequenceRows = csv.writer(sequenceFile)
+        sequenceRows.writerow(['protein_id', 'sequence'])
+        for n in range(proteins):
+            organism = n % organisms
+            sequence = sequences[n % len(sequences)]
+            for d in range(domainsPerProtein):
+                start = rng.randint(1, len(sequence) - 20)
+                proteinRows.writerow([SyntheticDataset.proteinId(n), SyntheticDataset.taxaId(organism), 'E', f'Genus{organism} species{organism}',
+                                      'synthetic domain', SyntheticDataset.pfamId(rng.randrange(pfams)), start, min(len(sequence), start + rng.randint(10, 200)), len(sequence)])
+            sequenceRows.writerow([SyntheticDataset.proteinId(n), sequence])
+    return paths, pfams + proteins * domainsPerProtein + proteins
+
+
+def table_digest():
+    """md5 of every table the loader writes, to check the engines agree."""
+    digest = hashlib.md5()
+    for model, fields in TABLES:
+        for row in model.objects.order_by(*fields[:1]).values_list(*fields).iterator():
+            digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = ('Compares the input rows/sec of the loader engines (row by row python, columnar pandas) on generated '
+            'CSV files, each into a fresh scratch database, and checks they write the same tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proteins', type=int, default=100000, help='proteins in the generated files')
+        parser.add_argument('--engines', nargs='+', choices=['python', 'pandas'], default=['python', 'pandas'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        folder = tempfile.mkdtemp(prefix='protocaller-load-')
+        try:
+            paths, rows = write_inputs(folder, options['proteins'])
+            digests = set()
+            for engine in options['engines']:
+                with scratchDatabase():
+                    began = time.perf_counter()
+                    call_command('loader', engine=engine, batch_size=options['batch_size'], stdout=StringIO(), **paths)
+                    elapsed = time.perf_counter() - began
+                    digests.add(table_digest())
+                self.stdout.write(f'{engine:<7} {rows:>9} rows {elapsed:>8.2f} s {rows / elapsed:>10.0f} rows/s')
+            self.stdout.write('tables identical' if len(digests) == 1 else 'TABLES DIFFER between the engines')
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+#my code ends here
@@ -0,0 +1,82 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import mixins
+#my code starts here
+
+from caller.api import *
+from caller.models import *
+from ._benchmark import SyntheticDataset, scratchDatabase, summarise, timeCalls
+
+# a full scan of one of the keyed tables is what this benchmark exists to catch
+SCAN = re.compile(r'\bSCAN (TABLE )?(caller_protein|caller_organism|caller_pfam)\b')
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN QUERY PLAN and times the lookup behind every detail endpoint at growing protein counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='protein counts to benchmark at')
+        parser.add_argument('--lookups', type=int, default=200, help='lookups timed per endpoint and size')
+        parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+
+    def lookups(self):
+        """(endpoint, view class, url kwargs builder) for every keyed endpoint."""
+        return [
+            ('ProteinDetail', ProteinDetail, lambda key: {'protein_id': key[0]}),
+            ('CoverageDetail', CoverageDetail, lambda key: {'protein_id': key[0]}),
+            ('OrganismProteinList', OrganismProteinList, lambda key: {'taxa_id': key[1]}),
+            ('OrganismPfamList', OrganismPfamList, lambda key: {'taxa_id': key[1]}),
+            ('PfamDetail', PfamDetail, lambda key: {'pfam_id': key[2]}),
+        ]
+
+    def endpointQueryset(self, viewClass, kwargs):
+        # build the queryset exactly the way the view does, including the lookup_field filter applied by get_object()
+        view = viewClass()
+        view.kwargs = kwargs
+        view.request = None
+        view.format_kwarg = None
+        queryset = view.get_queryset()
+        lookupKwarg = view.lookup_url_kwarg or view.lookup_field
+        if isinstance(view, mixins.RetrieveModelMixin) and lookupKwarg in kwargs:
+            queryset = queryset.filter(**{view.lookup_field: kwargs[lookupKwarg]})
+        return queryset
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        dataset = SyntheticDataset(max(sizes))
+        scans = []
+
+        with scratchDatabase(keep=options['keep']) as path:
+            self.stdout.write(f'scratch database: {path}')
+            for size in sizes:
+                self.stdout.write(f'populating {size} proteins...')
+                dataset.grow(size)
+                keys = dataset.sampleKeys(options['lookups'])
+
+                # the organism endpoints resolve taxa_id inside get_queryset(), so explain the key lookups on their own too
+                keyLookups = [
+                    ('Protein.protein_id', Protein.objects.filter(protein_id=keys[0][0])),
+                    ('Organism.taxa_id', Organism.objects.filter(taxa_id=keys[0][1])),
+                    ('Pfam.domain_id', Pfam.objects.filter(domain_id=keys[0][2])),
+                ]
+                for name, queryset in keyLookups:
+                    plan = queryset.explain()
+                    self.stdout.write(f'{size:>9} {name:<20} {plan}')
+                    if SCAN.search(plan):
+                        scans.append(f'{name} at {size} proteins')
+
+                for name, viewClass, kwargsFor in self.lookups():
+                    plan = self.endpointQueryset(viewClass, kwargsFor(keys[0])).explain()
+                    durations = timeCalls(lambda key: list(self.endpointQueryset(viewClass, kwargsFor(key))[:10]), keys)
+                    stats = summarise(durations)
+                    self.stdout.write(f'{size:>9} {name:<20} mean {stats["mean"]:.3f}ms p50 {stats["p50"]:.3f}ms p99 {stats["p99"]:.3f}ms')
+                    for line in plan.splitlines():
+                        self.stdout.write(f'          {line}')
+                    if SCAN.search(plan):
+                        scans.append(f'{name} at {size} proteins')
+
+        if scans:
+            raise CommandError('full table scan in: ' + ', '.join(scans))
+        self.stdout.write('no full table scans on keyed tables')
+
+#my code ends here
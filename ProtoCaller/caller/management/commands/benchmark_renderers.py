@@ -0,0 +1,52 @@
+import gzip
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+#my code starts here
+
+from caller.api import *
+from caller.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from ._benchmark import SyntheticDataset, scratchDatabase, summarise
+
+
+class Command(BaseCommand):
+    help = 'Compares render time and payload size of the JSON, orjson and MessagePack renderers on large /api/proteins and /api/domains pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proteins', type=int, default=10000, help='size of the scratch catalogue')
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000], help='page sizes to measure')
+        parser.add_argument('--repeat', type=int, default=20, help='renders timed per measurement')
+
+    def renderers(self):
+        renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        else:
+            self.stderr.write('msgpack is not installed, skipping MessagePackRenderer')
+        return renderers
+
+    def pageData(self, view, url, pageSize):
+        # the data is built once, only the rendering step is timed
+        response = view(self.factory.get(url, {'page_size': pageSize}, HTTP_HOST='localhost'))
+        return response.data
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        renderers = self.renderers()
+        with scratchDatabase():
+            SyntheticDataset(options['proteins']).grow(options['proteins'])
+            for label, view, url in [('proteins', ProteinList.as_view(), '/api/proteins'), ('domains', DomainList.as_view(), '/api/domains')]:
+                for pageSize in options['page_sizes']:
+                    data = self.pageData(view, url, pageSize)
+                    for name, renderer in renderers:
+                        durations = []
+                        for _ in range(options['repeat']):
+                            began = time.perf_counter()
+                            body = renderer.render(data, renderer.media_type, {})
+                            durations.append(time.perf_counter() - began)
+                        stats = summarise(durations)
+                        self.stdout.write(f'{label:<8} page size {pageSize:>5} {name:<8} {stats["mean"]:>8.2f} ms mean {stats["p99"]:>8.2f} ms p99 '
+                                          f'{len(body) / 1024:>9.1f} KiB {len(gzip.compress(body)) / 1024:>8.1f} KiB gzipped')
+
+#my code ends here
@@ -0,0 +1,62 @@
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory
+#my code starts here
+
+from caller.api import *
+from caller.models import *
+from caller.serializers import *
+from ._benchmark import SyntheticDataset, scratchDatabase
+
+
+class Command(BaseCommand):
+    help = 'Compares memory per page and rows/sec on /api/proteins with and without the sequence column loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proteins', type=int, default=10000, help='size of the scratch catalogue')
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000], help='page sizes to measure')
+        parser.add_argument('--pages', type=int, default=20, help='pages fetched per measurement')
+
+    def variants(self):
+        """(label, view overrides) for the old full-row listing and the current one."""
+        return [
+            ('with sequence', {'queryset': Protein.objects.with_sequence(), 'serializer_class': ProteinSerializer}),
+            ('deferred', {}),
+        ]
+
+    def fetch(self, view, page):
+        response = view(self.factory.get('/api/proteins', {'page': page}, HTTP_HOST='localhost'))
+        response.render()
+        return len(response.data['results'])
+
+    def measure(self, view, pages):
+        # timed and traced in separate passes, tracemalloc slows allocation down too much to time under it
+        rows = 0
+        began = time.perf_counter()
+        for page in range(1, pages + 1):
+            rows += self.fetch(view, page)
+        elapsed = time.perf_counter() - began
+
+        peaks = []
+        for page in range(1, pages + 1):
+            tracemalloc.start()
+            self.fetch(view, page)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        return rows / elapsed, sum(peaks) / len(peaks)
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        with scratchDatabase():
+            SyntheticDataset(options['proteins']).grow(options['proteins'])
+            for pageSize in options['page_sizes']:
+                paginator = type('BenchPagination', (PageNumberPagination,), {'page_size': pageSize})
+                pages = max(1, min(options['pages'], options['proteins'] // pageSize))
+                for label, overrides in self.variants():
+                    view = ProteinList.as_view(pagination_class=paginator, **overrides)
+                    rowsPerSec, peak = self.measure(view, pages)
+                    self.stdout.write(f'page size {pageSize:>5} {label:<14} {rowsPerSec:>10.0f} rows/s {peak / 1024:>10.1f} KiB peak per page')
+
+#my code ends here
@@ -5,7 +5,15 @@ import csv
 import pandas as pd 
 from collections import defaultdict
 import copy
-from django.db import transaction
+import gzip
+import hashlib
+import io
+import mmap
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.db import connection, transaction
+from django.db import models
 from django.utils import timezone 
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings 
@@ -14,7 +22,129 @@ from django.conf import settings
 #paths are all relative
 
 
+from caller.fields import decode_sequence
 from caller.models import *
+from caller.routers import use_primary
+from caller.streaming import chunked
+
+# CSV rows per bulk_create batch and transaction
+LOAD_BATCH_SIZE = 5000
+
+
+# the columns of the files, by position, as the pandas engine names them
+PFAM_COLUMNS = ['domain_id', 'domain_description']
+PROTEIN_COLUMNS = ['protein_id', 'taxa_id', 'clade', 'genus_species', 'description', 'pfam_id', 'start', 'stop', 'length']
+
+# sequence files with these extensions (optionally followed by .gz) are read as FASTA, anything else as CSV
+FASTA_EXTENSIONS = ('.fasta', '.fa', '.faa', '.fas')
+# unknown accessions written out one by one before only the total is reported
+UNKNOWN_REPORTED = 20
+
+# with --workers, files larger than this are parsed in chunks of about this many bytes across the process pool
+PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def split_file(fp, chunkBytes):
+    """(start, end) byte ranges covering the file after its header, each ending on a line boundary."""
+    with open(fp, 'rb') as data_file:
+        data_file.readline()
+        start = data_file.tell()
+        size = os.fstat(data_file.fileno()).st_size
+        while start < size:
+            data_file.seek(min(start + chunkBytes, size))
+            data_file.readline()
+            end = data_file.tell()
+            yield start, end
+            start = end
+
+
+def parse_chunk(fp, start, end):
+    """
+    Parse one byte range of a CSV file (run in a worker process) as Command.readRows does.
+    Returns the number of lines read and the rows as (line number within the chunk, tuple of fields).
+    """
+    with open(fp, 'rb') as data_file:
+        data_file.seek(start)
+        data = data_file.read(end - start)
+    # decoded and newline translated as open(fp) does for the serial reader
+    csv_reader = csv.reader(io.TextIOWrapper(io.BytesIO(data)), delimiter=',')
+    rows = []
+    for row in csv_reader:
+        if row.count(',') > 0:
+            row.remove(',')
+        rows.append((csv_reader.line_num, tuple(row)))
+    return csv_reader.line_num, rows
+
+
+def is_fasta(fp):
+    name = fp[:-len('.gz')] if fp.endswith('.gz') else fp
+    return name.lower().endswith(FASTA_EXTENSIONS)
+
+
+def fasta_accession(header):
+    """The accession of a FASTA header line: the first word, or the accession of a UniProt sp|P12345|NAME_HUMAN id."""
+    words = header[1:].split(None, 1)
+    if not words:
+        return ''
+    parts = words[0].split('|')
+    if len(parts) >= 3 and parts[0] in ('sp', 'tr'):
+        return parts[1]
+    return words[0]
+
+
+def binary_lines(fp):
+    """
+    The lines of a file as bytes, one at a time: decompressed as they are read for .gz files, otherwise straight
+    from a memory map, so neither a multi-GB file nor its decompressed content is ever held in memory.
+    """
+    if fp.endswith('.gz'):
+        with gzip.open(fp, 'rb') as data_file:
+            yield from data_file
+        return
+    with open(fp, 'rb') as data_file:
+        if os.fstat(data_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter(mapped.readline, b'')
+
+
+def read_fasta(fp, skip=None):
+    """
+    (line number of the header, (accession, sequence)) for every record of a FASTA file, one record in memory at a time.
+    A record that is not text (a header outside UTF-8, a sequence outside ASCII) is passed to skip(line number, header)
+    instead when skip is given, and raises UnicodeDecodeError otherwise.
+    """
+    header = None
+    header_num = 0
+    lines = []
+
+    def record():
+        # the finished record as a one element list, or none when it is skipped
+        try:
+            return [(header_num, (fasta_accession(header.decode('utf-8')), b''.join(lines).decode('ascii')))]
+        except UnicodeDecodeError:
+            if skip is None:
+                raise
+            skip(header_num, header.decode('utf-8', 'replace'))
+            return []
+
+    for line_num, line in enumerate(binary_lines(fp), 1):
+        line = line.strip()
+        if line.startswith(b'>'):
+            if header is not None:
+                yield from record()
+            header = line
+            header_num = line_num
+            lines = []
+        elif line and header is not None:
+            lines.append(line)
+    if header is not None:
+        yield from record()
+
+
+def content_hash(*values):
+    # short digest of the content of a row, compared with the one of its counterpart in the database
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
 
 class Command(BaseCommand):
     help = 'A loader script for the populating the ProtoCaller database'
@@ -31,7 +161,13 @@ class Command(BaseCommand):
         parser.add_argument('--test',type=str,help="testing mode")
         parser.add_argument('--pfams', type=str, help='File path for PFAM descriptions')
         parser.add_argument('--proteins', type=str, help='File path for proteins')
-        parser.add_argument('--sequences', type=str, help='File path for sequences')
+        parser.add_argument('--sequences', type=str, help='File path for sequences, a protein_id,sequence CSV or a FASTA file (.fasta/.fa/.faa/.fas), either optionally gzipped')
+        parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE, help='CSV rows read and written per transaction')
+        parser.add_argument('--incremental', action='store_true', help='update the database to match the files instead of emptying and reloading it')
+        parser.add_argument('--prune', action='store_true', help='with --incremental, also delete the rows missing from the files')
+        parser.add_argument('--workers', type=int, default=1, help='processes parsing the CSV files, the database is written from this one')
+        parser.add_argument('--engine', choices=['python', 'pandas'], default='python',
+                            help='full loads: row by row in bounded memory (python) or whole files as columnar frames (pandas)')
     
     def get_fps(self,*args,**options):
         self.stdout.write('fps')
@@ -84,6 +220,11 @@ class Command(BaseCommand):
             return default_folders
         
     def handle(self,*args,**options):
+        # the loader reads back what it writes, so none of its reads may go to a replica
+        with use_primary():
+            return self.load(*args,**options)
+        
+    def load(self,*args,**options):
         
         try: 
                 if options['test'] =='test':
@@ -94,6 +235,18 @@ class Command(BaseCommand):
                 self.stdout.write('loading script')
                 self.stdout.write('loading data from: ') 
                 self.stdout.write(self.data_fp)
+                self.batchSize = options.get('batch_size') or LOAD_BATCH_SIZE
+                self.workers = max(1, options.get('workers') or 1)
+                self.unknown = 0
+                self.undecodable = 0
+                if options.get('incremental'):
+                    self.stdout.write('updating the database incrementally....')
+                    counts = self.loadIncremental(dataFolders, options.get('prune', False))
+                    for name,count in counts.items():
+                        self.stdout.write(f'{name}: {count["inserted"]} inserted, {count["updated"]} updated, {count["deleted"]} deleted')
+                    self.reportUnknown()
+                    return
+                
                 self.stdout.write('ensuring database is flushed....')
             
                 
@@ -101,130 +254,559 @@ class Command(BaseCommand):
                 if flag:
                     self.stdout.write('DB flushed successfully')
                     
-                dataLists = self.loadDb(dataFolders)
-                for name,data in dataLists.items():
-                    if len(data) == 0:
+                counts = self.loadDbPandas(dataFolders) if options.get('engine') == 'pandas' else self.loadDb(dataFolders)
+                for name,count in counts.items():
+                    if count == 0:
                         self.stdout.write(name)
                         self.stdout.write('dataList is empty.')
+                self.reportUnknown()
                         
 
                 self.stdout.write('creating databases:')
-                self.createDb(dataLists['organisms'],dataLists['pfams'],dataLists['proteins'],dataLists['domains'],dataLists['proteinDomains'])
+                self.createDb()
                 self.stdout.write('Organism, Protein, Domain, Pfam, ProteinDomain tables populated successfully with:')
-                print(len(Organism.objects.all()),' ',len(Protein.objects.all()),' ', len(Domain.objects.all()),' ',len(Pfam.objects.all()),' ', len(ProteinDomains.objects.all()))
+                print(Organism.objects.count(),' ',Protein.objects.count(),' ', Domain.objects.count(),' ',Pfam.objects.count(),' ', ProteinDomains.objects.count())
         except Exception:
             raise CommandError("Something went wrong during populating the database")
         
+    # The files are streamed: rows are read in batches of batchSize and each batch is written with bulk_create in
+    # its own transaction, so memory stays flat whatever the size of the input. The only state kept across
+    # batches are the key maps (pfam -> id, taxa_id -> id, protein_id -> id) the later rows are resolved with.
+    # Ids are the row numbers of the first row naming an entity, as they always were.
+    
+    def readRows(self,fp):
+        # (row number, row) for every line after the header
+        if self.workers > 1 and os.path.getsize(fp) > PARSE_CHUNK_BYTES:
+            yield from self.readRowsParallel(fp)
+            return
+        with open(fp) as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            csv_reader.__next__()
+            for row in csv_reader:
+                if row.count(',') > 0:
+                    row.remove(',')
+                yield csv_reader.line_num, row
+    
+    def readSequences(self,fp):
+        # (row number, (protein_id, sequence)) from a CSV or FASTA file, gzipped or not
+        if is_fasta(fp):
+            return read_fasta(fp, self.skipUndecodable)
+        if fp.endswith('.gz'):
+            return self.readGzipRows(fp)
+        return self.readRows(fp)
+    
+    def readGzipRows(self,fp):
+        # readRows for a gzipped CSV, decompressed as it is read
+        with gzip.open(fp, 'rt') as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            csv_reader.__next__()
+            for row in csv_reader:
+                if row.count(',') > 0:
+                    row.remove(',')
+                yield csv_reader.line_num, row
+    
+    def skipUnknown(self,protein_id):
+        # a sequence for a protein the proteins file does not have is skipped, not a reason to stop the load
+        self.unknown += 1
+        if self.unknown <= UNKNOWN_REPORTED:
+            self.stderr.write(f'no protein {protein_id}, its sequence is skipped')
+    
+    def skipUndecodable(self,line_num,header):
+        # a FASTA record with bytes that are not text is skipped like an unknown protein, counted and reported
+        self.undecodable += 1
+        if self.undecodable <= UNKNOWN_REPORTED:
+            self.stderr.write(f'line {line_num}: record {header} is not text, its sequence is skipped')
+    
+    def reportUnknown(self):
+        if self.unknown:
+            self.stdout.write(f'{self.unknown} sequences of unknown proteins skipped')
+        if self.undecodable:
+            self.stdout.write(f'{self.undecodable} undecodable sequences skipped')
+    
+    def readRowsParallel(self,fp):
+        # --workers: the file is cut on line boundaries and the chunks parsed in the pool, this process only turns
+        # their rows into model instances and writes them. Chunks come back in file order, a few ahead of the
+        # writer at most, and their line numbers are made absolute again by counting the lines before them.
+        # Fields with line breaks in them would be cut in two, none of the loader's files have any.
+        lines = 1
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            pending = deque()
+            for start,end in split_file(fp, PARSE_CHUNK_BYTES):
+                pending.append(pool.submit(parse_chunk, fp, start, end))
+                while len(pending) > 2 * self.workers or (pending and pending[0].done()):
+                    lines = yield from self.parsedRows(pending.popleft(), lines)
+            while pending:
+                lines = yield from self.parsedRows(pending.popleft(), lines)
+    
+    def parsedRows(self,future,lines):
+        count, rows = future.result()
+        for line_num,row in rows:
+            yield lines + line_num, row
+        return lines + count
+    
+    def flush(self,*batches):
+        # one transaction per batch of rows, parents before children
+        with transaction.atomic():
+            for batch in batches:
+                if batch:
+                    type(batch[0]).objects.bulk_create(batch)
+    
     def loadDb(self,folders):
+        self.pfam_ids = {}
+        self.org_ids = {}
+        self.prot_ids = {}
+        counts = {'pfams': 0, 'organisms': 0, 'proteins': 0, 'domains': 0, 'proteinDomains': 0, 'sequences': 0}
         
-        org_ids= {}
-        pfam_ids = {}
-        prot_ids={}
+        self.stdout.write("running on: pfams_fp")
+        for rows in chunked(self.readRows(folders['pfams_fp']), self.batchSize):
+            self.loadPfams(rows, counts)
+        self.stdout.write("running on: prot_fp")
+        for rows in chunked(self.readRows(folders['prot_fp']), self.batchSize):
+            self.loadProteins(rows, counts)
+        self.stdout.write("running on: seq_fp")
+        for rows in chunked(self.readSequences(folders['seq_fp']), self.batchSize):
+            self.loadSequences(rows, counts)
+        return counts
+    
+    def loadPfams(self,rows,counts):
+        pfams = []
+        for rowNo,row in rows:
+            pfam_id = row[0]
+            domain_description = row[1]
+            if pfam_id in self.pfam_ids:
+                continue
+            self.pfam_ids[pfam_id] = rowNo
+            pfams.append(Pfam(domain_id=pfam_id,domain_description=domain_description,id=rowNo))
+        self.flush(pfams)
+        counts['pfams'] += len(pfams)
+    
+    def loadProteins(self,rows,counts):
+        organisms = []
+        proteins = []
+        domains = []
         proteinDomains = []
-        domains = [] 
-        dataLists = {}
-        for folder in folders.keys():
+        for rowNo,row in rows:
+            protein_id = row[0]
+            taxa_id = row[1]
+            clade = row[2]
+            genusSpecies = row[3]
+            description = row[4]
+            pfam_id = row[5]
+            start = row[6]
+            stop = row[7]
+            length = row[8] 
+                                            
+            if taxa_id not in self.org_ids:
+                genusSpecies = genusSpecies.split(' ')     
+                self.org_ids[taxa_id] = rowNo
+                organisms.append(Organism(taxa_id=taxa_id,
+                                          genus=genusSpecies[0],
+                                          species=genusSpecies[1],
+                                          clade=clade,id=rowNo))
             
-            with open(folders[folder]) as csv_file:
-                
-                csv_reader = csv.reader(csv_file, delimiter=',')
-                
-                header = csv_reader.__next__() 
-                
-                print("running on: "+ folder)
-                    
-                for row in csv_reader:
-                    if row.count(',') > 0:
-                        row.remove(',')
-                        
-                    rowNo = csv_reader.line_num
-                    
-                    if folder == "pfams_fp":
-                        pfam_id = row[0]
-                        domain_description = row[1]
-                        pfam_ids[pfam_id] = Pfam(domain_id=pfam_id,domain_description=domain_description,id=rowNo)
-
-                    if folder == "prot_fp":
-                        
-                        protein_id = row[0]
-                        taxa_id = row[1]
-                        clade = row[2]
-                        genusSpecies = row[3]
-                        description = row[4]
-                        pfam_id = row[5]
-                        start = row[6]
-                        stop = row[7]
-                        length = row[8] 
-                                                        
-                        if taxa_id not in org_ids.keys():
-                            
-                            genusSpecies = genusSpecies.split(' ')     
-                            org_ids[taxa_id]= Organism(taxa_id=taxa_id,
-                                                    genus=genusSpecies[0],
-                                                    species=genusSpecies[1],
-                                                    clade=clade,id=rowNo)
-                        
-                        domain = Domain(id=rowNo,pfam_id_id =int(pfam_ids[pfam_id].id),start=start,stop=stop,description=description)
-                    
-                        if protein_id not in prot_ids.keys():
-                            protein = Protein(protein_id=protein_id,
-                                        sequence ='',
+            domains.append(Domain(id=rowNo,pfam_id_id=self.pfam_ids[pfam_id],start=start,stop=stop,description=description))
+        
+            if protein_id not in self.prot_ids:
+                self.prot_ids[protein_id] = rowNo
+                proteins.append(Protein(protein_id=protein_id,
+                                        sequence='',
                                         length=length,         
-                                        organism_id_id=org_ids[taxa_id].id,
-                                        id=rowNo)
-
-                            prot_ids[protein_id] = protein 
-                            proteinDomains.append(ProteinDomains(protein = protein,domain=domain))
-                            
-                        else: 
-                            
-                            proteinDomains.append(ProteinDomains(protein = prot_ids[protein_id],domain=domain))
-                            
-                            # print('same protein',protein_id,pfam_id)
-                        domains.append(domain)   
-
-                    if folder == "seq_fp":
-                        protein_id = row[0]
-                        sequence = row[1]
-                        prot_ids[protein_id].sequence = sequence 
-
-        dataLists['domains'] = domains 
-        dataLists['organisms'] = [*org_ids.values() ] 
-        dataLists['pfams'] = [*pfam_ids.values()] 
-        dataLists['proteins'] =[*prot_ids.values()] 
-        dataLists['proteinDomains'] = proteinDomains
-        
-        return dataLists 
+                                        organism_id_id=self.org_ids[taxa_id],
+                                        id=rowNo))
+            proteinDomains.append(ProteinDomains(protein_id=self.prot_ids[protein_id],domain_id=rowNo))
+        
+        self.flush(organisms, proteins, domains, proteinDomains)
+        counts['organisms'] += len(organisms)
+        counts['proteins'] += len(proteins)
+        counts['domains'] += len(domains)
+        counts['proteinDomains'] += len(proteinDomains)
+    
+    def loadSequences(self,rows,counts):
+        # the proteins are in already, their sequences are set with one UPDATE per row, a batch per transaction
+        field = Protein._meta.get_field('sequence')
+        updates = []
+        for rowNo,row in rows:
+            if row[0] not in self.prot_ids:
+                self.skipUnknown(row[0])
+                continue
+            updates.append((field.get_db_prep_save(row[1], connection), self.prot_ids[row[0]]))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {Protein._meta.db_table} SET {field.column} = %s WHERE id = %s', updates)
+        counts['sequences'] += len(updates)
+
+    # --incremental: the tables are not emptied, the files are diffed against them instead. Every row is matched
+    # on its natural key (Pfam accession, taxa id, protein id, and protein/Pfam/start/stop for a domain) and
+    # compared on a hash of its content: new rows are inserted, changed ones updated and, with --prune, the rows
+    # missing from the files deleted, a batch of bulk statements per transaction. Only the proteins, organisms
+    # and Pfams that changed have their versions bumped and their cached responses dropped, batch by batch in
+    # the transaction of the batch, so whatever a failed run did commit is never left with stale versions.
+    
+    def loadIncremental(self,folders,prune=False):
+        self.readState()
+        self.counts = {name: {'inserted': 0, 'updated': 0, 'deleted': 0} for name in ('Pfam', 'Organism', 'Protein', 'Domain', 'ProteinDomains')}
+        self.newProteins = set()
+        self.updatedProteins = set()
+        self.pending = []
+        self.untouch()
+        
+        self.stdout.write("running on: pfams_fp")
+        for rows in chunked(self.readRows(folders['pfams_fp']), self.batchSize):
+            self.upsertPfams(rows)
+        self.stdout.write("running on: prot_fp")
+        for rows in chunked(self.readRows(folders['prot_fp']), self.batchSize):
+            self.upsertProteins(rows)
+        self.stdout.write("running on: seq_fp")
+        for rows in chunked(self.readSequences(folders['seq_fp']), self.batchSize):
+            self.upsertSequences(rows)
+        if prune:
+            self.prune()
+        
+        self.counts['Protein']['inserted'] = len(self.newProteins)
+        self.counts['Protein']['updated'] = len(self.updatedProteins - self.newProteins)
+        return self.counts
+    
+    def untouch(self):
+        # what the summaries are recomputed and the versions bumped for, per batch
+        self.touched = {'proteins': set(), 'taxa': set(), 'pfams': set(), 'everything': False}
+        self.coverageIds = set()
+        self.organismIds = set()
+        self.tables = set()
+    
+    def settle(self):
+        # the end of a batch, in its transaction: the summaries of what it touched are recomputed and the versions
+        # bumped (the cached responses are dropped again on commit)
+        if self.organismIds:
+            OrganismPfam.objects.rebuild(organisms=self.organismIds)
+        if self.coverageIds:
+            Protein.objects.refresh_coverage(self.coverageIds)
+        if self.tables or self.touched['everything']:
+            DataVersion.objects.changed(*sorted(self.tables), proteins=sorted(self.touched['proteins']), taxa=sorted(self.touched['taxa']),
+                                        pfams=sorted(self.touched['pfams']), everything=self.touched['everything'])
+        self.untouch()
+    
+    def readState(self):
+        # natural key -> (id, content hash) of every row in the database, hashed as the rows of the files are
+        self.pfams = {pfam_id: (pk, content_hash(description)) for pk, pfam_id, description in
+                      Pfam.objects.values_list('id', 'domain_id', 'domain_description').iterator()}
+        self.organisms = {taxa_id: (pk, content_hash(genus, species, clade)) for pk, taxa_id, genus, species, clade in
+                          Organism.objects.values_list('id', 'taxa_id', 'genus', 'species', 'clade').iterator()}
+        self.proteins = {protein_id: (pk, taxa_id, content_hash(length, taxa_id)) for pk, protein_id, length, taxa_id in
+                         Protein.objects.values_list('id', 'protein_id', 'length', 'organism_id__taxa_id').iterator()}
+        self.sequences = {protein_id: content_hash(decode_sequence(sequence) if sequence is not None else '') for protein_id, sequence in
+                          Protein.objects.values_list('protein_id', 'sequence').iterator()}
+        # a protein may carry the same Pfam at the same place more than once, so a key holds a list of domains
+        self.domains = defaultdict(list)
+        for pk, protein_id, pfam_id, start, stop, description in ProteinDomains.objects.order_by('domain_id').values_list(
+                'domain_id', 'protein__protein_id', 'domain__pfam_id__domain_id', 'domain__start', 'domain__stop', 'domain__description').iterator():
+            self.domains[(protein_id, pfam_id, start, stop)].append((pk, content_hash(description)))
+        self.seen = {Pfam: set(), Organism: set(), Protein: set()}
+    
+    # New rows get their ids from the database, other writers (the API) may be inserting at the same time.
+    # Until its batch is written a new row stands in the key map as its instance, which the rows referring to
+    # it in the same batch take as their foreign key; bulk_create sets the ids and the map gets them after it.
+    
+    def add(self,keys,key,instance,*rest):
+        keys[key] = (instance, *rest)
+        self.pending.append((keys, key))
+    
+    @staticmethod
+    def reference(field,value):
+        # the foreign key keyword for an id, or for an instance still waiting for its id
+        return {field: value} if isinstance(value, models.Model) else {field + '_id': value}
+    
+    def touchProtein(self,protein_id,taxa_id):
+        self.touched['proteins'].add(protein_id)
+        if taxa_id is not None:
+            self.touched['taxa'].add(taxa_id)
+            self.organismIds.add(self.organisms[taxa_id][0])
+        self.coverageIds.add(self.proteins[protein_id][0])
+    
+    def write(self,*changes,touches=()):
+        # (model, inserted rows, updated rows, updated fields) for each table, parents first, in one transaction;
+        # then the new ids go into the key maps and the proteins written are touched
+        with transaction.atomic():
+            for model,inserts,updates,fields in changes:
+                if inserts:
+                    model.objects.bulk_create(inserts)
+                if updates:
+                    model.objects.bulk_update(updates, fields)
+                if inserts or updates:
+                    self.tables.add(model._meta.model_name.replace('proteindomains', 'domain'))
+                if model is not Protein:
+                    self.counts[model.__name__]['inserted'] += len(inserts)
+                    self.counts[model.__name__]['updated'] += len(updates)
+            for keys,key in self.pending:
+                keys[key] = (keys[key][0].pk, *keys[key][1:])
+            self.pending = []
+            for protein_id,taxa_id in touches:
+                self.touchProtein(protein_id, taxa_id)
+            self.settle()
+    
+    def upsertPfams(self,rows):
+        inserts = []
+        updates = []
+        for rowNo,row in rows:
+            pfam_id = row[0]
+            domain_description = row[1]
+            if pfam_id in self.seen[Pfam]:
+                continue
+            self.seen[Pfam].add(pfam_id)
+            digest = content_hash(domain_description)
+            if pfam_id not in self.pfams:
+                inserts.append(Pfam(domain_id=pfam_id,domain_description=domain_description))
+                self.add(self.pfams, pfam_id, inserts[-1], digest)
+                self.touched['pfams'].add(pfam_id)
+            elif self.pfams[pfam_id][1] != digest:
+                self.pfams[pfam_id] = (self.pfams[pfam_id][0], digest)
+                updates.append(Pfam(id=self.pfams[pfam_id][0],domain_id=pfam_id,domain_description=domain_description))
+                # the description shows in every cached protein and organism summary carrying the Pfam
+                self.touched['pfams'].add(pfam_id)
+                self.touched['everything'] = True
+        self.write((Pfam, inserts, updates, ['domain_description']))
+    
+    def upsertProteins(self,rows):
+        organisms = ([], [])
+        proteins = ([], [])
+        domains = ([], [])
+        proteinDomains = []
+        touches = []
+        for rowNo,row in rows:
+            protein_id = row[0]
+            taxa_id = int(row[1])
+            clade = row[2]
+            genusSpecies = row[3]
+            description = row[4]
+            pfam_id = row[5]
+            start = int(row[6])
+            stop = int(row[7])
+            length = int(row[8])
+            
+            if taxa_id not in self.seen[Organism]:
+                self.seen[Organism].add(taxa_id)
+                genusSpecies = genusSpecies.split(' ')
+                digest = content_hash(genusSpecies[0], genusSpecies[1], clade)
+                if taxa_id not in self.organisms:
+                    organisms[0].append(Organism(taxa_id=taxa_id,genus=genusSpecies[0],species=genusSpecies[1],clade=clade))
+                    self.add(self.organisms, taxa_id, organisms[0][-1], digest)
+                    self.touched['taxa'].add(taxa_id)
+                elif self.organisms[taxa_id][1] != digest:
+                    self.organisms[taxa_id] = (self.organisms[taxa_id][0], digest)
+                    organisms[1].append(Organism(taxa_id=taxa_id,genus=genusSpecies[0],species=genusSpecies[1],clade=clade,id=self.organisms[taxa_id][0]))
+                    self.touched['taxa'].add(taxa_id)
+                    # the organism is part of every cached protein of it
+                    self.touched['everything'] = True
+            organism = self.organisms[taxa_id][0]
+            
+            # a Pfam the domains still refer to is kept by --prune, even when its description is gone
+            self.seen[Pfam].add(pfam_id)
+            
+            if protein_id not in self.seen[Protein]:
+                self.seen[Protein].add(protein_id)
+                digest = content_hash(length, taxa_id)
+                if protein_id not in self.proteins:
+                    proteins[0].append(Protein(protein_id=protein_id,sequence='',length=length,**self.reference('organism_id', organism)))
+                    self.add(self.proteins, protein_id, proteins[0][-1], taxa_id, digest)
+                    self.sequences[protein_id] = content_hash('')
+                    self.newProteins.add(protein_id)
+                    touches.append((protein_id, taxa_id))
+                elif self.proteins[protein_id][2] != digest:
+                    pk, previous, _ = self.proteins[protein_id]
+                    self.proteins[protein_id] = (pk, taxa_id, digest)
+                    self.updatedProteins.add(protein_id)
+                    proteins[1].append(Protein(protein_id=protein_id,length=length,id=pk,**self.reference('organism_id', organism)))
+                    touches.extend([(protein_id, previous), (protein_id, taxa_id)])
+            
+            key = (protein_id, pfam_id, start, stop)
+            digest = content_hash(description)
+            if self.domains.get(key):
+                pk, previous = self.domains[key].pop(0)
+                if not self.domains[key]:
+                    del self.domains[key]
+                if previous != digest:
+                    domains[1].append(Domain(id=pk,description=description))
+                    touches.append((protein_id, self.proteins[protein_id][1]))
+            else:
+                domains[0].append(Domain(pfam_id_id=self.pfams[pfam_id][0],start=start,stop=stop,description=description))
+                proteinDomains.append(ProteinDomains(domain=domains[0][-1],**self.reference('protein', self.proteins[protein_id][0])))
+                touches.append((protein_id, self.proteins[protein_id][1]))
+        
+        self.write((Organism, *organisms, ['genus', 'species', 'clade']),
+                   (Protein, *proteins, ['length', 'organism_id']),
+                   (Domain, *domains, ['description']),
+                   (ProteinDomains, proteinDomains, [], []),
+                   touches=touches)
+    
+    def upsertSequences(self,rows):
+        field = Protein._meta.get_field('sequence')
+        updates = []
+        for rowNo,row in rows:
+            protein_id = row[0]
+            if protein_id not in self.sequences:
+                self.skipUnknown(protein_id)
+                continue
+            digest = content_hash(row[1])
+            if self.sequences[protein_id] == digest:
+                continue
+            self.sequences[protein_id] = digest
+            updates.append((field.get_db_prep_save(row[1], connection), self.proteins[protein_id][0]))
+            if protein_id not in self.newProteins:
+                self.updatedProteins.add(protein_id)
+                self.touched['proteins'].add(protein_id)
+                self.tables.add('protein')
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.executemany(f'UPDATE {Protein._meta.db_table} SET {field.column} = %s WHERE id = %s', updates)
+            self.settle()
+    
+    def deleteRows(self,model,column,ids):
+        # DELETE ... WHERE column IN (...), a batch of ids per statement
+        ids = list(ids)
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), self.batchSize):
+                batch = ids[start:start + self.batchSize]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE {column} IN ({placeholders})', batch)
+    
+    def prune(self):
+        # whatever was not matched by a row of the files, children first
+        domains = {pk: protein_id for (protein_id, pfam_id, start, stop), matches in self.domains.items() for pk, digest in matches}
+        proteins = {protein_id: value for protein_id, value in self.proteins.items() if protein_id not in self.seen[Protein]}
+        organisms = {taxa_id: value for taxa_id, value in self.organisms.items() if taxa_id not in self.seen[Organism]}
+        pfams = {pfam_id: value for pfam_id, value in self.pfams.items() if pfam_id not in self.seen[Pfam]}
+        
+        with transaction.atomic():
+            for protein_id in set(domains.values()) | set(proteins):
+                self.touchProtein(protein_id, self.proteins[protein_id][1])
+            self.deleteRows(ProteinDomains, 'domain_id', domains)
+            self.deleteRows(ProteinDomains, 'protein_id', [pk for pk, taxa_id, digest in proteins.values()])
+            self.deleteRows(Domain, 'id', domains)
+            self.deleteRows(Protein, 'id', [pk for pk, taxa_id, digest in proteins.values()])
+            self.deleteRows(OrganismPfam, 'organism_id', [pk for pk, digest in organisms.values()])
+            self.deleteRows(Organism, 'id', [pk for pk, digest in organisms.values()])
+            self.deleteRows(OrganismPfam, 'pfam_id', [pk for pk, digest in pfams.values()])
+            self.deleteRows(Domain, 'pfam_id_id', [pk for pk, digest in pfams.values()])
+            self.deleteRows(Pfam, 'id', [pk for pk, digest in pfams.values()])
+            
+            self.organismIds -= {pk for pk, digest in organisms.values()}
+            self.coverageIds -= {pk for pk, taxa_id, digest in proteins.values()}
+            if domains or proteins:
+                self.tables.update(['protein', 'domain'])
+            if organisms or pfams:
+                # organisms and Pfams are part of many cached responses, as when they are deleted one by one
+                self.tables.update(['organism'] if organisms else [])
+                self.tables.update(['pfam', 'domain'] if pfams else [])
+                self.touched['taxa'].update(organisms)
+                self.touched['pfams'].update(pfams)
+                self.touched['everything'] = True
+            self.settle()
+        
+        self.counts['Domain']['deleted'] = self.counts['ProteinDomains']['deleted'] = len(domains)
+        self.counts['Protein']['deleted'] = len(proteins)
+        self.counts['Organism']['deleted'] = len(organisms)
+        self.counts['Pfam']['deleted'] = len(pfams)
+    
+    # --engine pandas: every file is read whole into a frame and the tables are derived from it with vectorised
+    # operations instead of a loop over the rows. The id of an entity is still the row number of the first row
+    # naming it, the groupby(...).transform('first') of the row numbers gives it to every row referring to it,
+    # and the tables are written from the frames with executemany, a batch per transaction. Faster than the
+    # python engine, but the whole proteins file is held in memory at once.
+    
+    @staticmethod
+    def dropComma(row):
+        # a row with a field too many that is a lone ',' loses that field, as readRows does
+        if row.count(',') > 0:
+            row.remove(',')
+        return row
+    
+    def readFrame(self,fp,columns):
+        # only the python parser hands the rows with a field too many to on_bad_lines, the C one stops at them
+        frame = pd.read_csv(fp, header=0, names=columns, dtype=str, keep_default_na=False,
+                            engine='python', on_bad_lines=self.dropComma)
+        frame.insert(0, 'line', frame.index + 2)
+        return frame
+    
+    def insertFrame(self,model,frame):
+        # the columns of the frame are field names of the model
+        columns = [model._meta.get_field(name).column for name in frame.columns]
+        sql = f'INSERT INTO {model._meta.db_table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))})'
+        # tolist() hands back python ints and strings, the database drivers do not take numpy scalars
+        values = zip(*(frame[name].tolist() for name in frame.columns))
+        for rows in chunked(values, self.batchSize):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        return len(frame)
+    
+    def lookup(self,keys,ids,name):
+        # the ids of the keys, every one of which must be known
+        found = keys.map(ids)
+        if found.isna().any():
+            raise KeyError(f'unknown {name}: {keys[found.isna()].iloc[0]}')
+        return found.astype('int64')
+    
+    def loadDbPandas(self,folders):
+        counts = {}
+        
+        self.stdout.write("running on: pfams_fp")
+        pfams = self.readFrame(folders['pfams_fp'], PFAM_COLUMNS).drop_duplicates('domain_id')
+        counts['pfams'] = self.insertFrame(Pfam, pfams.rename(columns={'line': 'id'}))
+        pfamIds = pd.Series(pfams['line'].values, index=pfams['domain_id'])
+        
+        self.stdout.write("running on: prot_fp")
+        rows = self.readFrame(folders['prot_fp'], PROTEIN_COLUMNS)
+        rows['organism'] = rows.groupby('taxa_id', sort=False)['line'].transform('first')
+        rows['protein'] = rows.groupby('protein_id', sort=False)['line'].transform('first')
+        rows['pfam'] = self.lookup(rows['pfam_id'], pfamIds, 'Pfam')
+        
+        organisms = rows[rows['line'] == rows['organism']]
+        genusSpecies = organisms['genus_species'].str.split(' ')
+        counts['organisms'] = self.insertFrame(Organism, pd.DataFrame({
+            'id': organisms['line'], 'taxa_id': organisms['taxa_id'].astype('int64'),
+            'genus': genusSpecies.str[0], 'species': genusSpecies.str[1], 'clade': organisms['clade']}))
+        
+        proteins = rows[rows['line'] == rows['protein']]
+        counts['proteins'] = self.insertFrame(Protein, pd.DataFrame({
+            'id': proteins['line'], 'protein_id': proteins['protein_id'], 'organism_id': proteins['organism'],
+            'sequence': [Protein._meta.get_field('sequence').get_db_prep_save('', connection)] * len(proteins),
+            'length': proteins['length'].astype('int64'), 'coverage': 0.0}))
+        
+        counts['domains'] = self.insertFrame(Domain, pd.DataFrame({
+            'id': rows['line'], 'pfam_id': rows['pfam'], 'start': rows['start'].astype('int64'),
+            'stop': rows['stop'].astype('int64'), 'description': rows['description']}))
+        counts['proteinDomains'] = self.insertFrame(ProteinDomains, pd.DataFrame({'protein': rows['protein'], 'domain': rows['line']}))
+        
+        self.stdout.write("running on: seq_fp")
+        # packing the sequences is done one by one whatever the engine, so they are streamed (CSV or FASTA) to loadSequences
+        self.prot_ids = dict(zip(proteins['protein_id'].tolist(), proteins['line'].tolist()))
+        counts['sequences'] = 0
+        for batch in chunked(self.readSequences(folders['seq_fp']), self.batchSize):
+            self.loadSequences(batch, counts)
+        return counts
 
     def resetDb(self):
-        Protein.objects.all().delete()
-        Protein.objects.raw("delete from sqlite_sequence where name='caller_protein';")
-        Domain.objects.all().delete()
-        Domain.objects.raw("delete from sqlite_sequence where name='caller_domain';")
-        Organism.objects.all().delete()
-        Organism.objects.raw("delete from sqlite_sequence where name='caller_organism';")
-        Pfam.objects.all().delete();
-        Pfam.objects.raw("delete from sqlite_sequence where name='caller_pfam';")
-        ProteinDomains.objects.all().delete()
-        ProteinDomains.objects.raw("delete from sqlite_sequence where name='caller_ProteinDomains';")
-
-        if len(Pfam.objects.all()) > 0:
+        # plain DELETEs, children first: a queryset delete() loads every row it cascades over into memory
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (OrganismPfam, ProteinDomains, Domain, Protein, Organism, Pfam):
+                cursor.execute(f'DELETE FROM {model._meta.db_table}')
+
+        DataVersion.objects.changed('dataset', everything=True)
+
+        if Pfam.objects.exists():
             return False 
-        if len(Protein.objects.all()) > 0:
+        if Protein.objects.exists():
             return False 
-        if len(Domain.objects.all()) > 0:
+        if Domain.objects.exists():
             return False 
-        if len (Organism.objects.all()) > 0:
+        if Organism.objects.exists():
             return False 
-        if len(ProteinDomains.objects.all()) >0:
+        if ProteinDomains.objects.exists():
             return False
         return True
      
-    def createDb(self,organisms,pfams,proteins,domains,proteinDomains):
-        Pfam.objects.bulk_create(pfams)
-        Organism.objects.bulk_create(organisms)
-        Protein.objects.bulk_create(proteins)
-        Domain.objects.bulk_create(domains)
-        ProteinDomains.objects.bulk_create(proteinDomains)
+    def createDb(self):
+        # the rows are in, the summaries computed from them are rebuilt in SQL
+        OrganismPfam.objects.rebuild()
+        Protein.objects.refresh_coverage()
+        # bulk inserts skip Model.save(), so every ETag and cached response is invalidated in one go
+        DataVersion.objects.changed('dataset', everything=True)
 
 #my code ends here
\ No newline at end of file
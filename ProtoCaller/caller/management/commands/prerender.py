@@ -0,0 +1,34 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+#my code starts here
+
+from caller.snapshots import brotli, prerender
+
+
+class Command(BaseCommand):
+    help = ('Prerenders the protein, Pfam and coverage details and the per organism protein and Pfam listings into '
+            'gzip/brotli precompressed static files plus a manifest, for SnapshotMiddleware to serve. '
+            'Only the entities whose data version changed since the last run are rendered again')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, help='snapshot directory, by default settings.SNAPSHOT_ROOT')
+        parser.add_argument('--base-url', type=str, help='address the clients use, for the links of the listings (default settings.SNAPSHOT_BASE_URL)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes rendering in parallel')
+        parser.add_argument('--full', action='store_true', help='render everything again')
+
+    def handle(self, *args, **options):
+        root = options['output'] or settings.SNAPSHOT_ROOT
+        if not root:
+            raise CommandError('no snapshot directory, set PROTOCALLER_SNAPSHOTS or pass --output')
+        if brotli is None:
+            self.stderr.write('brotli is not installed, writing gzip copies only')
+        os.makedirs(root, exist_ok=True)
+
+        began = time.perf_counter()
+        counts = prerender(root, options['base_url'] or settings.SNAPSHOT_BASE_URL, max(1, options['workers']), options['full'])
+        self.stdout.write(f'rendered {counts["proteins"]} proteins, {counts["pfams"]} Pfams and {counts["taxa"]} organisms, '
+                          f'removed {counts["removed"]} files, in {time.perf_counter() - began:.1f}s: {root}')
+
+#my code ends here
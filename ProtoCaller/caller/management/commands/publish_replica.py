@@ -0,0 +1,39 @@
+import os
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+#my code starts here
+
+
+class Command(BaseCommand):
+    help = 'Publishes a consistent snapshot of the primary database to the read-only replica files using the SQLite backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, help='write the snapshot to this file instead of the configured replicas')
+        parser.add_argument('--pages', type=int, default=1024, help='pages copied per backup step, so writers are not locked out for the whole copy')
+
+    def handle(self, *args, **options):
+        targets = [options['output']] if options['output'] else list(settings.DATABASE_REPLICAS.values())
+        if not targets:
+            raise CommandError('no replicas configured, set PROTOCALLER_REPLICAS or pass --output')
+
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('replica snapshots need an SQLite primary')
+        primary.ensure_connection()
+
+        for target in targets:
+            # build the copy next to the target and swap it in, readers keep the old file until they reconnect
+            staging = f'{target}.publishing'
+            snapshot = sqlite3.connect(staging)
+            try:
+                primary.connection.backup(snapshot, pages=options['pages'])
+                # replicas are opened immutable, so they must not depend on a -wal file
+                snapshot.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                snapshot.close()
+            os.replace(staging, target)
+            self.stdout.write(f'published replica snapshot: {target}')
+
+#my code ends here
@@ -1,14 +1,27 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponseRedirect
 # my code starts here 
 
 #redirects to index on 404 status.
+#Sync and async capable: a sync only middleware makes Django run the async views (caller.async_api) in a thread under ASGI.
 class RedirectToIndexMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.redirect(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.redirect(await self.get_response(request))
 
+    def redirect(self, response):
         # Check if the response status is 404 (Page Not Found)
         if response.status_code == 404:
             print('redirected to index')
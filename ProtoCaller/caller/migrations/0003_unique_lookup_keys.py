@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_lookup_keys(apps, schema_editor):
+    # Collapse rows sharing a lookup key onto the oldest row so the unique indexes can be built.
+    Organism = apps.get_model('caller', 'Organism')
+    Pfam = apps.get_model('caller', 'Pfam')
+    Protein = apps.get_model('caller', 'Protein')
+    Domain = apps.get_model('caller', 'Domain')
+    ProteinDomains = apps.get_model('caller', 'ProteinDomains')
+
+    duplicates = Organism.objects.values('taxa_id').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        stale = Organism.objects.filter(taxa_id=duplicate['taxa_id']).exclude(id=duplicate['keep'])
+        Protein.objects.filter(organism_id__in=stale).update(organism_id=duplicate['keep'])
+        stale.delete()
+
+    duplicates = Pfam.objects.values('domain_id').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        stale = Pfam.objects.filter(domain_id=duplicate['domain_id']).exclude(id=duplicate['keep'])
+        Domain.objects.filter(pfam_id__in=stale).update(pfam_id=duplicate['keep'])
+        stale.delete()
+
+    duplicates = Protein.objects.values('protein_id').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        stale = Protein.objects.filter(protein_id=duplicate['protein_id']).exclude(id=duplicate['keep'])
+        ProteinDomains.objects.filter(protein__in=stale).update(protein=duplicate['keep'])
+        stale.delete()
+
+    # Merging proteins can leave the same protein/domain pair linked twice
+    duplicates = ProteinDomains.objects.values('protein', 'domain').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        ProteinDomains.objects.filter(protein=duplicate['protein'], domain=duplicate['domain']).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caller', '0002_auto_20230717_1428'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_lookup_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='organism',
+            name='taxa_id',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pfam',
+            name='domain_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='protein',
+            name='protein_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:38
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def build_summary(apps, schema_editor):
+    # Historical models have no custom managers, so this mirrors OrganismPfamManager.rebuild()
+    OrganismPfam = apps.get_model('caller', 'OrganismPfam')
+    ProteinDomains = apps.get_model('caller', 'ProteinDomains')
+    rows = ProteinDomains.objects.filter(protein__organism_id__isnull=False, domain__pfam_id__isnull=False).values(
+        'protein__organism_id', 'domain__pfam_id').annotate(occurrences=Count('id'), proteins=Count('protein', distinct=True)).order_by()
+    OrganismPfam.objects.bulk_create(
+        [OrganismPfam(organism_id=row['protein__organism_id'], pfam_id=row['domain__pfam_id'],
+                      occurrences=row['occurrences'], proteins=row['proteins']) for row in rows.iterator()],
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caller', '0003_unique_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganismPfam',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurrences', models.IntegerField(default=0)),
+                ('proteins', models.IntegerField(default=0)),
+                ('organism', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='caller.organism')),
+                ('pfam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='caller.pfam')),
+            ],
+            options={
+                'unique_together': {('organism', 'pfam')},
+            },
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
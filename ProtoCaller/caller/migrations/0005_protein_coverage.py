@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caller', '0004_organism_pfam_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='protein',
+            name='coverage',
+            field=models.FloatField(default=0),
+        ),
+        # backfill with the same union-of-intervals aggregate ProteinManager.refresh_coverage() runs
+        migrations.RunSQL('''
+            WITH intervals AS (
+                SELECT pd.protein_id AS protein, d.start AS start, d.stop AS stop,
+                       MAX(d.stop) OVER (PARTITION BY pd.protein_id ORDER BY d.start, d.stop
+                                         ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS reached
+                FROM caller_proteindomains pd JOIN caller_domain d ON d.id = pd.domain_id
+            ), covered AS (
+                SELECT protein, SUM(CASE WHEN reached IS NULL OR start >= reached THEN stop - start
+                                         WHEN stop > reached THEN stop - reached
+                                         ELSE 0 END) AS covered
+                FROM intervals GROUP BY protein
+            )
+            UPDATE caller_protein
+            SET coverage = CASE WHEN length > 0
+                                THEN COALESCE((SELECT covered FROM covered WHERE covered.protein = caller_protein.id), 0) * 1.0 / length
+                                ELSE 0 END
+        ''', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:44
+
+import caller.fields
+from caller.fields import encode_sequence
+from django.db import migrations
+
+
+def pack_sequences(apps, schema_editor):
+    # Rows copied over from the old text column still hold plain strings, re-encode them in batches
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id, sequence FROM caller_protein')
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            packed = [(connection.Database.Binary(encode_sequence(sequence)), id) for id, sequence in rows if isinstance(sequence, str)]
+            if packed:
+                with connection.cursor() as writer:
+                    writer.executemany('UPDATE caller_protein SET sequence = %s WHERE id = %s', packed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caller', '0005_protein_coverage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='protein',
+            name='sequence',
+            field=caller.fields.PackedSequenceField(),
+        ),
+        migrations.RunPython(pack_sequences, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
 from django.core.exceptions import *
+from .fields import PackedSequenceField
+from .cache import response_cache
 # Create your models here.
 #my code starts here 
 # Organism model represents an organism in the database
@@ -8,7 +13,7 @@ class Organism(models.Model):
     genus = models.CharField(max_length=127, null=False, blank=False)
     species = models.CharField(max_length=255, null=False, blank=False)
     clade = models.CharField(max_length=10, null=False, blank=False)
-    taxa_id = models.IntegerField(blank=False, null=False)
+    taxa_id = models.IntegerField(blank=False, null=False, unique=True)
     
     def clean(self):
         # Validate that the genus field is not empty or only whitespace
@@ -26,7 +31,15 @@ class Organism(models.Model):
     def save(self, *args, **kwargs):
         # Run the clean() method to perform data validation before saving
         self.full_clean()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        # an edited organism shows up in the cached details of all its proteins
+        DataVersion.objects.changed('organism', taxa=[self.taxa_id], everything=not adding)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        DataVersion.objects.changed('organism', 'protein', taxa=[self.taxa_id], everything=True)
+        return result
     
     def get_pfams(self):
         try: 
@@ -46,19 +59,99 @@ class Organism(models.Model):
     def __str__(self):
         return f'taxa_id: {self.taxa_id} clade: {self.clade}, genus: {self.genus}, species: {self.species}'  
 
+class ProteinQuerySet(models.QuerySet):
+    
+    def with_sequence(self):
+        # Load the sequence column as well, for the views that actually return residues
+        return self.defer(None)
+    
+    def with_domains(self):
+        # The organism is joined in and the domains with their Pfams come in one extra query for the whole page
+        return self.select_related('organism_id').prefetch_related(
+            models.Prefetch('domains', queryset=Domain.objects.select_related('pfam_id').order_by('id')))
+
+class ProteinManager(models.Manager.from_queryset(ProteinQuerySet)):
+    
+    def get_queryset(self):
+        # Sequences are by far the widest column and only a few endpoints return them, so they are deferred by default
+        return super().get_queryset().defer('sequence')
+    
+    # Union length of each protein's domain intervals: ordered by start, a domain only adds the part that reaches
+    # past the furthest stop seen so far, so overlapping domains are not counted twice.
+    coverage_sql = '''
+        WITH intervals AS (
+            SELECT pd.protein_id AS protein, d.start AS start, d.stop AS stop,
+                   MAX(d.stop) OVER (PARTITION BY pd.protein_id ORDER BY d.start, d.stop
+                                     ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS reached
+            FROM caller_proteindomains pd JOIN caller_domain d ON d.id = pd.domain_id
+            {links}
+        ), covered AS (
+            SELECT protein, SUM(CASE WHEN reached IS NULL OR start >= reached THEN stop - start
+                                     WHEN stop > reached THEN stop - reached
+                                     ELSE 0 END) AS covered
+            FROM intervals GROUP BY protein
+        )
+        UPDATE caller_protein
+        SET coverage = CASE WHEN length > 0
+                            THEN COALESCE((SELECT covered FROM covered WHERE covered.protein = caller_protein.id), 0) * 1.0 / length
+                            ELSE 0 END
+        {proteins}
+    '''
+    
+    def refresh_coverage(self, proteins=None, batch_size=500):
+        # Recompute the stored coverage of every protein, or only of the given protein ids, in bulk SQL
+        with connection.cursor() as cursor:
+            if proteins is None:
+                cursor.execute(self.coverage_sql.format(links='', proteins=''))
+                return
+            
+            proteins = list(proteins)
+            for start in range(0, len(proteins), batch_size):
+                batch = proteins[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(self.coverage_sql.format(links=f'WHERE pd.protein_id IN ({placeholders})',
+                                                        proteins=f'WHERE id IN ({placeholders})'), batch + batch)
+
 # Protein model represents a protein in the database
 class Protein(models.Model):
     id = models.AutoField(primary_key=True)
-    protein_id = models.CharField(blank=False, null=False, max_length=255)
+    protein_id = models.CharField(blank=False, null=False, max_length=255, unique=True)
     organism_id = models.ForeignKey(Organism, on_delete=models.CASCADE, null=True)  
-    sequence = models.CharField(max_length=1024)
+    sequence = PackedSequenceField()
     length = models.IntegerField()
     domains = models.ManyToManyField('Domain', through='proteinDomains', related_name='domains')
+    coverage = models.FloatField(default=0)  # union length of the domains over length, kept up to date by ProteinManager.refresh_coverage()
+    
+    objects = ProteinManager()
 
     def save(self, *args, **kwargs):
         # Run the clean() method to perform data validation before saving
         self.full_clean()
+        # a protein renamed or moved to another organism leaves responses behind under its old accession and organism
+        previous = [] if self._state.adding else Protein.stored_keys([self.pk])
         super().save(*args, **kwargs)
+        proteins = [self.protein_id] + [proteinId for proteinId, taxaId in previous]
+        taxa = self.taxa_ids() + [taxaId for proteinId, taxaId in previous if taxaId is not None]
+        DataVersion.objects.changed('protein', proteins=list(dict.fromkeys(proteins)), taxa=list(dict.fromkeys(taxa)))
+    
+    def delete(self, *args, **kwargs):
+        taxa = self.taxa_ids()
+        result = super().delete(*args, **kwargs)
+        DataVersion.objects.changed('protein', proteins=[self.protein_id], taxa=taxa)
+        return result
+    
+    def taxa_ids(self):
+        # the taxa id of the organism this protein belongs to, if any, without loading the organism
+        if self.organism_id_id is None:
+            return []
+        if Protein.organism_id.is_cached(self):
+            return [self.organism_id.taxa_id]
+        return list(Organism.objects.filter(pk=self.organism_id_id).values_list('taxa_id', flat=True))
+    
+    @staticmethod
+    def stored_keys(ids):
+        # (protein_id, taxa id) of the proteins with the given primary keys, as stored, in one query
+        return list(Protein.objects.filter(pk__in=ids).values_list('protein_id', 'organism_id__taxa_id'))
     
     def clean(self):
         # Validate that the protein_id field is not empty or only whitespace
@@ -80,13 +173,21 @@ class Protein(models.Model):
 # Pfam model represents a Pfam entry in the database
 class Pfam(models.Model):
     id = models.AutoField(primary_key=True)
-    domain_id = models.CharField(max_length=255, blank=False, null=False)
+    domain_id = models.CharField(max_length=255, blank=False, null=False, unique=True)
     domain_description = models.CharField(max_length=255, null=False, blank=False)
 
     def save(self, *args, **kwargs):
         # Run the clean() method to perform data validation before saving
         self.full_clean()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        # an edited description shows up in the cached proteins and organism summaries carrying the Pfam
+        DataVersion.objects.changed('pfam', pfams=[self.domain_id], everything=not adding)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        DataVersion.objects.changed('pfam', 'domain', pfams=[self.domain_id], everything=True)
+        return result
 
     def clean(self):
         # Validate that the domain_id field is not empty or only whitespace
@@ -109,7 +210,20 @@ class Domain(models.Model):
     def save(self, *args, **kwargs):
         # Run the clean() method to perform data validation before saving
         self.full_clean()
+        # a new domain is not linked to any protein yet
+        linked = [] if self._state.adding else self.linked_proteins()
         super().save(*args, **kwargs)
+        DataVersion.objects.changed('domain', proteins=[row[0] for row in linked], taxa=[row[1] for row in linked if row[1] is not None])
+    
+    def delete(self, *args, **kwargs):
+        linked = self.linked_proteins()
+        result = super().delete(*args, **kwargs)
+        DataVersion.objects.changed('domain', 'protein', proteins=[row[0] for row in linked], taxa=[row[1] for row in linked if row[1] is not None])
+        return result
+    
+    def linked_proteins(self):
+        # (protein_id, taxa_id) of the proteins carrying this domain
+        return list(ProteinDomains.objects.filter(domain=self).values_list('protein__protein_id', 'protein__organism_id__taxa_id'))
 
     def clean(self):
         # Validate that both start and stop values are greater than 0
@@ -125,5 +239,137 @@ class ProteinDomains(models.Model):
     protein = models.ForeignKey(Protein, on_delete=models.CASCADE)
     domain = models.ForeignKey(Domain, on_delete=models.CASCADE)
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.changed(Protein.stored_keys([self.protein_id]))
+    
+    def delete(self, *args, **kwargs):
+        keys = Protein.stored_keys([self.protein_id])
+        result = super().delete(*args, **kwargs)
+        self.changed(keys)
+        return result
+    
+    @staticmethod
+    def changed(keys):
+        DataVersion.objects.changed('protein', proteins=[proteinId for proteinId, taxaId in keys],
+                                    taxa=[taxaId for proteinId, taxaId in keys if taxaId is not None])
+    
+
+class OrganismPfamManager(models.Manager):
+    
+    def rebuild(self, organisms=None, batch_size=5000):
+        # Recompute the summary from the protein/domain links, for every organism or only the given organism ids
+        links = ProteinDomains.objects.filter(protein__organism_id__isnull=False, domain__pfam_id__isnull=False)
+        stale = self.all()
+        if organisms is not None:
+            links = links.filter(protein__organism_id__in=organisms)
+            stale = stale.filter(organism__in=organisms)
+        
+        rows = links.values('protein__organism_id', 'domain__pfam_id').annotate(
+            occurrences=Count('id'), proteins=Count('protein', distinct=True)).order_by()
+        
+        with transaction.atomic():
+            stale.delete()
+            batch = []
+            for row in rows.iterator():
+                batch.append(self.model(organism_id=row['protein__organism_id'], pfam_id=row['domain__pfam_id'],
+                                        occurrences=row['occurrences'], proteins=row['proteins']))
+                if len(batch) >= batch_size:
+                    self.bulk_create(batch)
+                    batch = []
+            self.bulk_create(batch)
+    
+    def record(self, protein):
+        # Add the domains of a newly linked protein to its organism's summary rows
+        if protein.organism_id_id is None:
+            return
+        counts = ProteinDomains.objects.filter(protein=protein, domain__pfam_id__isnull=False).values(
+            'domain__pfam_id').annotate(occurrences=Count('id')).order_by()
+        
+        with transaction.atomic():
+            for row in counts:
+                summary = self.filter(organism_id=protein.organism_id_id, pfam_id=row['domain__pfam_id'])
+                updated = summary.update(occurrences=F('occurrences') + row['occurrences'], proteins=F('proteins') + 1)
+                if not updated:
+                    self.create(organism_id=protein.organism_id_id, pfam_id=row['domain__pfam_id'],
+                                occurrences=row['occurrences'], proteins=1)
+
+# OrganismPfam model is a precomputed summary of the distinct Pfams found in the proteins of an organism
+class OrganismPfam(models.Model):
+    organism = models.ForeignKey(Organism, on_delete=models.CASCADE)
+    pfam = models.ForeignKey(Pfam, on_delete=models.CASCADE)
+    occurrences = models.IntegerField(default=0)  # domains of this Pfam across the organism's proteins
+    proteins = models.IntegerField(default=0)  # proteins of the organism carrying at least one such domain
+    
+    objects = OrganismPfamManager()
+    
+    class Meta:
+        # also serves as the (organism, pfam) index /api/pfams/<taxa_id> reads its range from
+        unique_together = [('organism', 'pfam')]
+    
+
+class DataVersionManager(models.Manager):
+    
+    upsert_sql = '''
+        INSERT INTO {table} (scope, version, modified) VALUES (%s, 1, %s)
+        ON CONFLICT (scope) DO UPDATE SET version = {table}.version + 1, modified = excluded.modified
+    '''
+    
+    def bump(self, *scopes):
+        # Move each scope one version on in a single statement per scope, creating it at version 1 the first time.
+        # Bulk writes (bulk_create, raw SQL, the loader) skip save(), so their callers bump explicitly.
+        modified = self.model._meta.get_field('modified').get_db_prep_save(timezone.now(), connection)
+        with connection.cursor() as cursor:
+            cursor.executemany(self.upsert_sql.format(table=self.model._meta.db_table),
+                               [(scope, modified) for scope in dict.fromkeys(scopes)])
+    
+    def changed(self, *scopes, proteins=(), taxa=(), pfams=(), everything=False):
+        # Bump the scopes (plus the per protein, organism and Pfam scopes, and 'dataset' for everything) and drop
+        # the cached responses of the given proteins, organisms and Pfams, or every cached response.
+        # The per entity scopes tell `manage.py prerender` which snapshots to regenerate.
+        self.bump(*scopes, *(['dataset'] if everything else []),
+                  *(DataVersion.protein_scope(proteinId) for proteinId in proteins),
+                  *(DataVersion.taxa_scope(taxaId) for taxaId in taxa),
+                  *(DataVersion.pfam_scope(pfamId) for pfamId in pfams))
+        response_cache.invalidate(proteins=proteins, taxa=taxa, pfams=pfams, everything=everything)
+    
+    def current(self, scopes):
+        # The versions of the given scopes (0 for one never bumped) and the latest time any of them changed
+        return self.summarise(scopes, self.filter(scope__in=scopes).values_list('scope', 'version', 'modified'))
+    
+    async def acurrent(self, scopes):
+        # current() for the async views
+        return self.summarise(scopes, [row async for row in self.filter(scope__in=scopes).values_list('scope', 'version', 'modified')])
+    
+    @staticmethod
+    def summarise(scopes, rows):
+        rows = {scope: (version, modified) for scope, version, modified in rows}
+        versions = [rows.get(scope, (0, None))[0] for scope in scopes]
+        modified = max((row[1] for row in rows.values()), default=None)
+        return versions, modified
+
+# DataVersion is a monotonically increasing change counter per scope: a table ('protein', 'domain', 'pfam',
+# 'organism'), a protein ('protein:<protein_id>'), an organism ('taxa:<taxa_id>'), a Pfam ('pfam:<domain_id>')
+# or the whole 'dataset' (bumped by the loader and by changes reaching everything).
+# The conditional GET views build their ETags from it without touching the data itself.
+class DataVersion(models.Model):
+    scope = models.CharField(max_length=64, unique=True)
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+    
+    objects = DataVersionManager()
+    
+    @staticmethod
+    def taxa_scope(taxaId):
+        return f'taxa:{taxaId}'
+    
+    @staticmethod
+    def protein_scope(proteinId):
+        return f'protein:{proteinId}'
+    
+    @staticmethod
+    def pfam_scope(pfamId):
+        return f'pfam:{pfamId}'
+    
     
 #my code ends here 
\ No newline at end of file
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.http import Http404
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+#my code starts here
+
+# largest page a client may ask for with ?page_size=
+MAX_PAGE_SIZE = 1000
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key: every page is a range read on the id index, so deep pages cost
+    the same as the first one. No COUNT(*) is run unless the client asks for it with ?count=true.
+    """
+
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in TRUE_VALUES:
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([('next', self.get_next_link()), ('previous', self.get_previous_link())])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Page numbers by default, as before, with a client selectable ?page_size= up to MAX_PAGE_SIZE.
+    Clients crawling a whole listing opt in to keyset pagination with ?pagination=cursor and then follow the next links.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    cursor_class = KeysetPagination
+
+    def wants_cursor(self, request):
+        # the next/previous links of a cursor page carry ?cursor=, which keeps the client on keyset pages
+        return (request.query_params.get('pagination') == 'cursor'
+                or self.cursor_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.wants_cursor(request):
+            self.keyset = self.cursor_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    The default page number pagination (same pages, same links) for the async views, which get a plain Django
+    request and read the page with the async ORM: one COUNT and one slice, as the sync views do.
+    """
+
+    async def apaginate(self, queryset, request):
+        """The page of the queryset asked for with ?page= as a list, or Http404 for a page that does not exist."""
+        paginator = Paginator(queryset, self.page_size)
+        # count is a cached property, filled in here so the paginator never counts synchronously
+        paginator.count = await queryset.acount()
+        number = request.GET.get(self.page_query_param) or 1
+        if number in self.last_page_strings:
+            number = paginator.num_pages
+        try:
+            number = paginator.validate_number(number)
+        except InvalidPage:
+            raise Http404('Invalid page.')
+        bottom = (number - 1) * paginator.per_page
+        self.page = Page([row async for row in queryset[bottom:bottom + paginator.per_page]], number, paginator)
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_data(self, data):
+        return {'count': self.page.paginator.count, 'next': self.get_next_link(),
+                'previous': self.get_previous_link(), 'results': data}
+
+#my code ends here
@@ -0,0 +1,53 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+#my code starts here
+
+# both are optional: without orjson, ORJSONRenderer falls back to the stdlib renderer, and settings.py only
+# offers MessagePackRenderer when msgpack is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode_default(obj):
+    # whatever orjson/msgpack do not know natively (lazy strings, decimals, ...) is converted the way DRF does it
+    return JSONEncoder().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """The JSON renderer, backed by orjson. Renders the same bytes as DRF's JSONRenderer, several times faster."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # orjson only knows a 2 space indent, so the (browser) requests asking for one take the stdlib path
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+        # same escaping of the unicode line/paragraph separators as JSONRenderer, they are not valid inside javascript strings
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renders responses as MessagePack, selected with Accept: application/msgpack or ?format=msgpack."""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+#my code ends here
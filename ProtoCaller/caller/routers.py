@@ -0,0 +1,51 @@
+import random
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+#my code starts here
+
+_pinned = threading.local()
+
+
+@contextmanager
+def use_primary():
+    """Send every read made inside the block to the primary, e.g. for commands that read back what they write."""
+    depth = getattr(_pinned, 'depth', 0)
+    _pinned.depth = depth + 1
+    try:
+        yield
+    finally:
+        _pinned.depth = depth
+
+
+# Reads of the caller models go to a random read-only replica, writes always go to the primary.
+class ReadReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = list(getattr(settings, 'DATABASE_REPLICAS', {}))
+        # sessions, users etc. are written on every login and must never be read stale
+        if not replicas or model._meta.app_label != 'caller':
+            return None
+        # related objects are read from wherever the instance itself came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        # inside a write transaction (or a pinned block) reads have to see the writes made so far
+        if getattr(_pinned, 'depth', 0) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas are copies of the primary, so objects from any of them can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', {}):
+            return False
+        return None
+
+#my code ends here
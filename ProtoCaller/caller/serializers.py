@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User, Group
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from .models import *
 import json 
@@ -7,10 +8,6 @@ import json
 
 # Serializer for the Coverage view 
 class CoverageSerializer(serializers.ModelSerializer):
-    coverage = serializers.SerializerMethodField()
-    
-    def get_coverage(self, obj):
-        return self.context['coverage']
         
     class Meta:
         model = Protein    
@@ -22,6 +19,8 @@ class OrganismSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organism
         fields = ['id', 'taxa_id', 'clade', 'genus', 'species']
+        # taxa_id is unique, but posting an existing organism should reuse it rather than fail validation
+        extra_kwargs = {'taxa_id': {'validators': []}}
     
     def validate(self, data):
         # Validate that the taxa_id is greater than 0
@@ -32,8 +31,9 @@ class OrganismSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         try: 
-            # Get or create an Organism instance with the validated data
-            organism = Organism.objects.get_or_create(**validated_data)
+            # Get or create an Organism instance keyed on its unique taxa_id
+            taxa_id = validated_data.pop('taxa_id')
+            organism = Organism.objects.get_or_create(taxa_id=taxa_id, defaults=validated_data)
             return organism[0]
         except Exception:
             raise ValidationError("organism object could not be fetched/created")
@@ -44,10 +44,13 @@ class PfamSerializer(serializers.ModelSerializer):
     class Meta: 
         model = Pfam
         fields = ['id', 'domain_id', 'domain_description']
+        # domain_id is unique, but an existing Pfam should be reused rather than fail validation
+        extra_kwargs = {'domain_id': {'validators': []}}
     
     def create(self, validated_data):
-        # Get or create a Pfam instance with the validated data
-        pfam = Pfam.objects.get_or_create(**validated_data)[0]
+        # Get or create a Pfam instance keyed on its unique domain_id
+        domain_id = validated_data.pop('domain_id')
+        pfam = Pfam.objects.get_or_create(domain_id=domain_id, defaults=validated_data)[0]
         return pfam
     
 # Serializer for the Domain model
@@ -92,6 +95,7 @@ class DomainSerializer(serializers.ModelSerializer):
          
 # Serializer for the Protein model
 class ProteinSerializer(serializers.ModelSerializer):
+    sequence = serializers.CharField()
     taxonomy = OrganismSerializer(source='organism_id')
     domains = DomainSerializer(many=True)
     
@@ -99,6 +103,9 @@ class ProteinSerializer(serializers.ModelSerializer):
         model = Protein           
         fields = ['protein_id', 'sequence', 'taxonomy', 'length', 'domains']            
         read_only = ['id']
+        # an existing protein still validates as data (e.g. to compare it with a stored one); a taken protein_id
+        # is rejected in create() instead, where a duplicate becomes the same {'protein_id': [...]} error
+        extra_kwargs = {'protein_id': {'validators': []}}
         
     def validate(self, data):
         # Validate that the length value is greater than or equal to 0
@@ -131,15 +138,37 @@ class ProteinSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         # Create a new Protein instance using the validated data
-        protein = Protein.objects.create(
-            protein_id=validated_data['protein_id'],
-            organism_id=Organism.objects.get(taxa_id=validated_data['organism_id']['taxa_id']),
-            sequence=validated_data['sequence'],
-            length=validated_data['length']
-        )
+        try:
+            with transaction.atomic():
+                protein = Protein.objects.create(
+                    protein_id=validated_data['protein_id'],
+                    organism_id=Organism.objects.get(taxa_id=validated_data['organism_id']['taxa_id']),
+                    sequence=validated_data['sequence'],
+                    length=validated_data['length']
+                )
+        except ValidationError as error:
+            # Protein.save() runs full_clean(), which finds the taken protein_id
+            raise serializers.ValidationError(error.message_dict)
+        except IntegrityError:
+            # added by another writer after full_clean() looked
+            raise serializers.ValidationError({'protein_id': ['Protein with this Protein id already exists.']})
                 
         return protein 
 
+# Serializer for protein listings, which leave the sequence out
+class ProteinSummarySerializer(ProteinSerializer):
+    
+    class Meta(ProteinSerializer.Meta):
+        fields = ['protein_id', 'taxonomy', 'length', 'domains']
+
+# Serializer for the sequence of a protein
+class ProteinSequenceSerializer(serializers.ModelSerializer):
+    sequence = serializers.CharField()
+    
+    class Meta:
+        model = Protein
+        fields = ['protein_id', 'length', 'sequence']
+
 # Serializer for the Organism and Protein models
 class OrganismProteinSerializer(serializers.ModelSerializer):
                 
@@ -159,12 +188,55 @@ class OrganismProteinSerializer(serializers.ModelSerializer):
         model = Protein    
         fields = ['protein_id', 'id']
 
-# Serializer for the Organism and Domain models
+# Serializer for the precomputed Pfam summary of an organism
 class OrganismDomainSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='pfam_id')
+    domain_id = serializers.CharField(source='pfam.domain_id')
+    domain_description = serializers.CharField(source='pfam.domain_description')
   
     class Meta:
-        model = Pfam
-        fields = ['id', 'domain_id', 'domain_description']
+        model = OrganismPfam
+        fields = ['id', 'domain_id', 'domain_description', 'occurrences', 'proteins']
+
+# Plain serializers validating the records of a bulk ingest. Unlike the model serializers above they never
+# touch the database: the model rules (non blank names, positive length, start < stop) are checked here and
+# the lookups and writes are done set based by caller.ingest
+class OrganismRecordSerializer(serializers.Serializer):
+    taxa_id = serializers.IntegerField(min_value=1)
+    clade = serializers.CharField(max_length=10)
+    genus = serializers.CharField(max_length=127)
+    species = serializers.CharField(max_length=255)
+
+class PfamRecordSerializer(serializers.Serializer):
+    domain_id = serializers.CharField(max_length=255)
+    domain_description = serializers.CharField(max_length=255)
+
+class DomainRecordSerializer(serializers.Serializer):
+    pfam_id = PfamRecordSerializer()
+    description = serializers.CharField(max_length=255)
+    start = serializers.IntegerField(min_value=1)
+    stop = serializers.IntegerField(min_value=1)
+    
+    def validate(self, data):
+        if data['start'] >= data['stop']:
+            raise serializers.ValidationError('start cannot be greater than stop')
+        return data
+
+class ProteinRecordSerializer(serializers.Serializer):
+    protein_id = serializers.CharField(max_length=255)
+    sequence = serializers.CharField()
+    length = serializers.IntegerField(min_value=1)
+    # the organism is accepted under either name: organism_id as ProteinDetail takes it, taxonomy as it is returned
+    organism_id = OrganismRecordSerializer(required=False)
+    taxonomy = OrganismRecordSerializer(required=False)
+    domains = DomainRecordSerializer(many=True)
+    
+    def validate(self, data):
+        organism = data.pop('taxonomy', None) or data.get('organism_id')
+        if organism is None:
+            raise serializers.ValidationError({'organism_id': 'This field is required.'})
+        data['organism_id'] = organism
+        return data
 
 # Serializer for the ProteinDomains model
 class ProteinDomainSerializer(serializers.ModelSerializer):
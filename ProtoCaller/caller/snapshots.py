@@ -0,0 +1,351 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+#my code starts here
+
+# Static snapshots of the read API. `manage.py prerender` renders the protein, Pfam and coverage details and the
+# per organism protein and Pfam listings into a directory tree, each file next to its gzip (and, when the brotli
+# package is installed, brotli) compressed copy, and lists them in a manifest. SnapshotMiddleware answers the
+# requests it has a file for straight from disk, with no ORM work, and hands every other request to the views.
+# The bodies are rendered by the builders.py fast path, so they are byte for byte what the views return.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .builders import *
+from .models import *
+from .renderers import ORJSONRenderer
+from .streaming import accepted_encodings, accepts_encoding
+
+MANIFEST = 'manifest.json'
+# entities rendered per task, each task reads them with a few IN queries
+SNAPSHOT_CHUNK_SIZE = 500
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+JSON_MEDIA_TYPE = 'application/json'
+
+# request path -> snapshot file (relative to the snapshot root), and whether the endpoint is a paginated listing
+ROUTES = [
+    (re.compile(r'^/api/protein/([^/]+)$'), 'api/protein/{}.json', False),
+    (re.compile(r'^/api/coverage/([^/]+)$'), 'api/coverage/{}.json', False),
+    (re.compile(r'^/api/pfam/([^/]+)$'), 'api/pfam/{}.json', False),
+    (re.compile(r'^/api/proteins/(\d+)$'), 'api/proteins/{}/{}.json', True),
+    (re.compile(r'^/api/pfams/(\d+)$'), 'api/pfams/{}/{}.json', True),
+]
+
+
+def encodings():
+    """The precompressed copies written next to every file, as (Content-Encoding, file suffix), preferred first."""
+    if brotli is None:
+        return [('gzip', '.gz')]
+    return [('br', '.br'), ('gzip', '.gz')]
+
+
+def key_file(key):
+    # accessions go into file names as they are, bar the characters a file name cannot hold
+    return quote(str(key), safe='')
+
+
+def protein_files(proteinId):
+    return ['api/protein/%s.json' % key_file(proteinId), 'api/coverage/%s.json' % key_file(proteinId)]
+
+
+def pfam_files(pfamId):
+    return ['api/pfam/%s.json' % key_file(pfamId)]
+
+
+def is_taxa_file(path, taxaId):
+    return path.startswith(('api/proteins/%s/' % taxaId, 'api/pfams/%s/' % taxaId))
+
+
+def write_file(root, path, body):
+    """Write body and its compressed copies under root, each through a temporary file so readers never see half a file."""
+    target = os.path.join(root, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    copies = [('', body), ('.gz', gzip.compress(body, GZIP_LEVEL, mtime=0))]
+    if brotli is not None:
+        copies.append(('.br', brotli.compress(body, quality=BROTLI_QUALITY)))
+    for suffix, content in copies:
+        with open(target + suffix + '.tmp', 'wb') as output:
+            output.write(content)
+        os.replace(target + suffix + '.tmp', target + suffix)
+
+
+def remove_file(root, path):
+    for suffix in ['', '.gz', '.br']:
+        try:
+            os.remove(os.path.join(root, path + suffix))
+        except FileNotFoundError:
+            pass
+
+
+# {path: etag} of the files already on disk, set in each worker before it renders anything
+known_files = {}
+
+
+def set_known_files(files):
+    global known_files
+    known_files = files
+
+
+class SnapshotWriter:
+    """Renders entities into files under root, collecting {path: etag} for the manifest."""
+
+    def __init__(self, root, baseUrl):
+        self.root = root
+        self.baseUrl = baseUrl.rstrip('/')
+        self.render = ORJSONRenderer().render
+        self.files = {}
+
+    def write(self, path, data):
+        body = self.render(data)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        # replacing a file costs far more than rendering it, an unchanged body is left where it is
+        if known_files.get(path) != etag:
+            write_file(self.root, path, body)
+        self.files[path] = etag
+
+    def write_pages(self, pathFormat, key, url, items):
+        """A listing, page by page, with the count and links PageNumberPagination gives it."""
+        pageSize = PageNumberPagination.page_size
+        pages = max(1, -(-len(items) // pageSize))
+        for number in range(1, pages + 1):
+            pageUrl = self.baseUrl + url + ('?page=%d' % number if number > 1 else '')
+            previous = None
+            if number == 2:
+                previous = remove_query_param(pageUrl, 'page')
+            elif number > 2:
+                previous = replace_query_param(pageUrl, 'page', number - 1)
+            self.write(pathFormat.format(key, number), {
+                'count': len(items),
+                'next': replace_query_param(pageUrl, 'page', number + 1) if number < pages else None,
+                'previous': previous,
+                'results': items[(number - 1) * pageSize:number * pageSize],
+            })
+
+    def proteins(self, proteinIds):
+        found = fetch_proteins_by_id(proteinIds)
+        coverage = dict(Protein.objects.filter(protein_id__in=proteinIds).values_list('protein_id', 'coverage'))
+        for proteinId, protein in found.items():
+            detail, coverageFile = protein_files(proteinId)
+            self.write(detail, protein)
+            self.write(coverageFile, {'coverage': coverage[proteinId]})
+
+    def pfams(self, pfamIds):
+        for pfam in Pfam.objects.filter(domain_id__in=pfamIds).values('id', 'domain_id', 'domain_description'):
+            self.write(pfam_files(pfam['domain_id'])[0], pfam)
+
+    def taxa(self, taxaIds):
+        # one query per listing for the whole chunk of organisms, split up by organism here
+        taxaIds = list(Organism.objects.filter(taxa_id__in=taxaIds).values_list('taxa_id', flat=True))
+        proteins = defaultdict(list)
+        queryset = Protein.objects.filter(organism_id__taxa_id__in=taxaIds).order_by('organism_id__taxa_id', 'id')
+        for row in organism_protein_values(queryset, 'organism_id__taxa_id'):
+            proteins[row['organism_id__taxa_id']].append(row)
+        pfams = defaultdict(list)
+        queryset = OrganismPfam.objects.filter(organism__taxa_id__in=taxaIds).order_by('organism__taxa_id', 'pfam_id')
+        for row in organism_pfam_values(queryset, 'organism__taxa_id'):
+            pfams[row['organism__taxa_id']].append(row)
+        for taxaId in taxaIds:
+            self.write_pages('api/proteins/{}/{}.json', taxaId, f'/api/proteins/{taxaId}', build_organism_proteins(proteins[taxaId]))
+            self.write_pages('api/pfams/{}/{}.json', taxaId, f'/api/pfams/{taxaId}', build_organism_pfams(pfams[taxaId]))
+
+
+def render_task(root, baseUrl, kind, keys):
+    """Render one chunk of entities (run in a worker process). Returns {path: etag} of the files written."""
+    writer = SnapshotWriter(root, baseUrl)
+    getattr(writer, kind)(keys)
+    return writer.files
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as manifestFile:
+            return json.load(manifestFile)
+    except FileNotFoundError:
+        return None
+
+
+def prerender(root, baseUrl, workers=1, full=False):
+    """
+    Render the snapshots under root. Only the proteins, Pfams and organisms whose data version moved since the
+    last run are rendered again, unless there is no manifest yet, full is set or a change reached the whole
+    dataset. Returns the number of entities rendered per kind and the number of files removed.
+    """
+    manifest = load_manifest(root)
+    # read before rendering: a change made while the files are written shows up as changed on the next run
+    versions = dict(DataVersion.objects.values_list('scope', 'version'))
+    suffixes = [suffix for name, suffix in encodings()]
+
+    if (full or manifest is None or manifest['base_url'] != baseUrl or manifest['suffixes'] != suffixes
+            or manifest['versions'].get('dataset') != versions.get('dataset')):
+        proteins = list(Protein.objects.values_list('protein_id', flat=True))
+        pfams = list(Pfam.objects.values_list('domain_id', flat=True))
+        taxa = list(Organism.objects.values_list('taxa_id', flat=True))
+        previous = manifest['files'] if manifest is not None else {}
+        files = {}
+        # after a loader run most bodies are what they were: only the files whose etag changed are written,
+        # unless a full run is asked for, which rewrites every file
+        known = {} if full or manifest is None or manifest['suffixes'] != suffixes else previous
+    else:
+        changed = [scope for scope, version in versions.items() if manifest['versions'].get(scope) != version]
+        proteins = [scope.split(':', 1)[1] for scope in changed if scope.startswith('protein:')]
+        pfams = [scope.split(':', 1)[1] for scope in changed if scope.startswith('pfam:')]
+        taxa = [scope.split(':', 1)[1] for scope in changed if scope.startswith('taxa:')]
+        # the files of the changed entities are dropped, and written again unless the entity is gone
+        stale = set(path for proteinId in proteins for path in protein_files(proteinId))
+        stale.update(path for pfamId in pfams for path in pfam_files(pfamId))
+        stale.update(path for path in manifest['files'] if any(is_taxa_file(path, taxaId) for taxaId in taxa))
+        previous = {path: manifest['files'][path] for path in stale if path in manifest['files']}
+        files = {path: etag for path, etag in manifest['files'].items() if path not in stale}
+        known = previous
+
+    tasks = [(kind, keys[start:start + SNAPSHOT_CHUNK_SIZE])
+             for kind, keys in [('proteins', proteins), ('pfams', pfams), ('taxa', taxa)]
+             for start in range(0, len(keys), SNAPSHOT_CHUNK_SIZE)]
+    if workers > 1 and len(tasks) > 1:
+        # the forked workers open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=set_known_files, initargs=(known,)) as pool:
+            for future in [pool.submit(render_task, root, baseUrl, kind, keys) for kind, keys in tasks]:
+                files.update(future.result())
+    else:
+        set_known_files(known)
+        for kind, keys in tasks:
+            files.update(render_task(root, baseUrl, kind, keys))
+        set_known_files({})
+
+    removed = [path for path in previous if path not in files]
+    for path in removed:
+        remove_file(root, path)
+
+    manifest = {'generated': timezone.now().isoformat(), 'base_url': baseUrl, 'suffixes': suffixes,
+                'versions': versions, 'files': files}
+    with open(os.path.join(root, MANIFEST + '.tmp'), 'w') as manifestFile:
+        json.dump(manifest, manifestFile, separators=(',', ':'))
+    os.replace(os.path.join(root, MANIFEST + '.tmp'), os.path.join(root, MANIFEST))
+    return {'proteins': len(proteins), 'pfams': len(pfams), 'taxa': len(taxa), 'removed': len(removed)}
+
+
+class SnapshotMiddleware:
+    """
+    Serves GET and HEAD requests for prerendered endpoints from settings.SNAPSHOT_ROOT, picking the brotli or
+    gzip copy the client accepts, and answers If-None-Match from the manifest. Requests with other query
+    parameters, asking for another format than JSON, or without a snapshot file go on to the views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SNAPSHOT_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.root = settings.SNAPSHOT_ROOT
+        self.manifest = None
+        self.manifestStamp = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def current_manifest(self):
+        # reloaded when prerender replaces it, the running workers pick up a new snapshot without a restart
+        try:
+            stamp = os.stat(os.path.join(self.root, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if stamp != self.manifestStamp:
+            self.manifest = load_manifest(self.root)
+            self.manifestStamp = stamp
+        return self.manifest
+
+    @staticmethod
+    def accepts_json(request):
+        # the first media range decides, as DRF's content negotiation would pick the browsable API for a browser
+        accepted = request.META.get('HTTP_ACCEPT', '*/*').split(',')[0].split(';')[0].strip()
+        return accepted in ('', '*/*', 'application/*', JSON_MEDIA_TYPE)
+
+    @staticmethod
+    def not_modified(request, etag):
+        # If-None-Match is a list of etags (or *), compared weakly as Django's conditional GETs do
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return '*' in etags or any(tag.removeprefix('W/') == etag for tag in etags)
+
+    @staticmethod
+    def choose_encoding(request, suffixes):
+        # the precompressed copy the client rates highest, ties going to the preferred one; q=0 rules a coding out
+        codings = accepted_encodings(request)
+        choices = [(codings.get(name, codings.get('*', 0.0)), -rank, name, suffix)
+                   for rank, (name, suffix) in enumerate(encodings())
+                   if suffix in suffixes and accepts_encoding(request, name, codings)]
+        return max(choices)[2:] if choices else (None, '')
+
+    def snapshot_path(self, request):
+        for pattern, pathFormat, paginated in ROUTES:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if not paginated:
+                return None if request.GET else pathFormat.format(key_file(match.group(1)))
+            page = request.GET.get('page', '1')
+            if set(request.GET) - {'page'} or not page.isdigit():
+                return None
+            return pathFormat.format(match.group(1), int(page))
+        return None
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.accepts_json(request):
+            return None
+        path = self.snapshot_path(request)
+        manifest = self.current_manifest() if path is not None else None
+        etag = manifest['files'].get(path) if manifest is not None else None
+        if etag is None:
+            return None
+        # the links in a listing carry the host the snapshot was rendered for
+        if path.startswith(('api/proteins/', 'api/pfams/')) and manifest['base_url'].rstrip('/') != request.build_absolute_uri('/').rstrip('/'):
+            return None
+
+        if self.not_modified(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        encoding, suffix = self.choose_encoding(request, manifest['suffixes'])
+        try:
+            with open(os.path.join(self.root, path + suffix), 'rb') as snapshot:
+                body = snapshot.read()
+        except FileNotFoundError:
+            # removed since the manifest was read
+            return None
+        response = HttpResponse(body, content_type=JSON_MEDIA_TYPE)
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Vary'] = 'Accept, Accept-Encoding'
+        return response
+
+#my code ends here
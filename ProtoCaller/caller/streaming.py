@@ -0,0 +1,125 @@
+import json
+import zlib
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+#my code starts here
+
+# rows fetched (and prefetched for) per round of QuerySet.iterator(), and serialised together
+EXPORT_CHUNK_SIZE = 2000
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def dump_line(row):
+    """One record as a compact JSON line."""
+    return json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders a response (in practice only the error responses of the export views) as a single NDJSON line."""
+
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dump_line(data).encode('utf-8')
+
+
+def chunked(iterable, size=EXPORT_CHUNK_SIZE):
+    """Split an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_chunks(queryset, serialize, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a queryset as NDJSON, one encoded block per chunk.
+
+    The queryset is read with a single iterator() so the rows come back in one query (plus one per
+    prefetch per chunk), and only one chunk of instances is held in memory at any time.
+    """
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield ''.join(dump_line(row) for row in serialize(chunk)).encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte blocks on the fly, flushing after every block so the client is never starved."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def json_results(chunks, encode, tail=dict):
+    """
+    Stream a {"results": [...], ...} document. The results come from chunks (lists of objects, encoded with
+    encode), the other members from tail(), called once every result is out, e.g. to list the ids not found.
+    """
+    yield b'{"results":['
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        body = b','.join(encode(item) for item in chunk)
+        yield body if first else b',' + body
+        first = False
+    yield b']' + b''.join(b',' + encode(name) + b':' + encode(value) for name, value in tail().items()) + b'}'
+
+
+def accepted_encodings(request):
+    """The codings of the Accept-Encoding header with their q-values, e.g. {'gzip': 1.0, 'br': 0.0, '*': 0.5}."""
+    codings = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding.lower()] = quality
+    return codings
+
+
+def accepts_encoding(request, coding, codings=None):
+    """Whether the client takes coding: listed with q > 0, or not listed and * has q > 0 (q=0 means "not this one")."""
+    codings = accepted_encodings(request) if codings is None else codings
+    quality = codings.get(coding, codings.get('*', 0.0))
+    return quality > 0
+
+
+def accepts_gzip(request):
+    return accepts_encoding(request, 'gzip')
+
+
+def streaming_response(request, chunks, content_type, filename=None):
+    """A streaming response, gzipped when the client says it accepts it."""
+    if accepts_gzip(request):
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Vary'] = 'Accept-Encoding'
+    if filename is not None:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def ndjson_response(request, chunks, filename):
+    return streaming_response(request, chunks, NDJSON_MEDIA_TYPE, filename)
+
+#my code ends here
@@ -1,14 +1,41 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase
+import unittest
+from unittest import mock
+from django.contrib.auth.models import Group
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 import json
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
 from django.urls import reverse_lazy
 from rest_framework.test import APIRequestFactory,APIClient
 from rest_framework.test import APITestCase
 from django.forms.models import model_to_dict
 from .api import * 
+from .async_api import AsyncPageView, AsyncReadView
 from .models import *
 from .modelFactories import *
 from .serializers import *
+from .builders import *
+from rest_framework.renderers import JSONRenderer
+from .renderers import ORJSONRenderer, msgpack
+from .fields import decode_sequence, encode_sequence
+from .db import apply_sqlite_pragmas
+from .management.commands.loader import Command as LoaderCommand
+from .routers import ReadReplicaRouter, use_primary
+from .cache import ResponseCache, response_cache
+from .snapshots import prerender
 
 # Create your tests here.
 # My code begins here
@@ -77,6 +104,18 @@ class ModelsDbTests(TestCase):
             self.prot.save()
     
     
+    def testProteinIdUnique(self):
+        """a second protein with the same protein_id is rejected"""
+        duplicate = Protein(protein_id=self.prot.protein_id, organism_id=self.org, sequence='MKV', length=3)
+        with self.assertRaises(ValidationError):
+            duplicate.save()
+    
+    def testOrganismTaxaIdUnique(self):
+        """a second organism with the same taxa_id is rejected"""
+        duplicate = Organism(taxa_id=self.org.taxa_id, genus='genus', species='species', clade='E')
+        with self.assertRaises(ValidationError):
+            duplicate.save()
+    
     def testDomainExists(self):
         """domain model exists"""
         self.assertIsNotNone(self.dom)
@@ -97,6 +136,90 @@ class ModelsDbTests(TestCase):
             self.pfam.save()
         
     
+class SqliteProfileTests(TestCase):
+    
+    def testPragmasAppliedOnConnection(self):
+        """the connection_created hook applies the configured pragmas"""
+        with self.settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            apply_sqlite_pragmas(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0],-1234)
+        
+    
+class ReadReplicaRouterTests(TestCase):
+    
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+    
+    def testNoReplicasConfigured(self):
+        with self.settings(DATABASE_REPLICAS={}):
+            self.assertIsNone(self.router.db_for_read(Protein))
+    
+    def testReadsGoToReplica(self):
+        with self.settings(DATABASE_REPLICAS={'replica0':'replica.sqlite3'}):
+            # TestCase wraps every test in a transaction, which pins reads to the primary
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                self.assertEqual(self.router.db_for_read(Protein),'replica0')
+                with use_primary():
+                    self.assertEqual(self.router.db_for_read(Protein),'default')
+            self.assertEqual(self.router.db_for_read(Protein),'default')
+            self.assertEqual(self.router.db_for_write(Protein),'default')
+            self.assertFalse(self.router.allow_migrate('replica0','caller'))
+    
+    def testNonCallerModelsStayOnPrimary(self):
+        with self.settings(DATABASE_REPLICAS={'replica0':'replica.sqlite3'}):
+            self.assertIsNone(self.router.db_for_read(Group))
+    
+    
+class PublishReplicaTests(TransactionTestCase):
+    # the backup API cannot copy from a connection in the middle of a write transaction, so no TestCase here
+    
+    def tearDown(self):
+        ProteinFactory.reset_sequence(0)
+        OrganismFactory.reset_sequence(0)
+    
+    def testPublishReplica(self):
+        ProteinFactory.create(id=1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            target = os.path.join(tmpdir, 'replica.sqlite3')
+            out = StringIO()
+            call_command('publish_replica', output=target, stdout=out)
+            self.assertIn('published replica snapshot', out.getvalue())
+            replica = sqlite3.connect(f'file:{target}?mode=ro&immutable=1', uri=True)
+            try:
+                self.assertEqual(replica.execute('SELECT protein_id FROM caller_protein').fetchall(),[('protein0',)])
+            finally:
+                replica.close()
+        
+    
+class PackedSequenceTests(TestCase):
+    
+    def testPackedRoundTrip(self):
+        sequence = 'MKVLAAGIVGLLLAWSCDEFHNPQRSTYBZXUOJ*-'
+        packed = encode_sequence(sequence)
+        self.assertEqual(decode_sequence(packed),sequence)
+        self.assertLess(len(packed),len(sequence))
+        
+    def testUnpackableSequenceRoundTrip(self):
+        """sequences outside the packed alphabet fall back to compression without losing anything"""
+        for sequence in ['testSequence','a' * 5000,'']:
+            self.assertEqual(decode_sequence(encode_sequence(sequence)),sequence)
+    
+    def testLongSequenceStored(self):
+        """sequences are no longer capped at 1024 residues"""
+        sequence = 'ACDEFGHIKLMNPQRSTVWY' * 500
+        prot = ProteinFactory.create(id=1, sequence=sequence, length=len(sequence))
+        self.assertEqual(Protein.objects.with_sequence().get(id=prot.id).sequence,sequence)
+        
+    def testSequenceDecodedLazily(self):
+        prot = ProteinFactory.create(id=1, sequence='MKVL', length=4)
+        prot = Protein.objects.with_sequence().get(id=prot.id)
+        self.assertIsInstance(prot.__dict__['sequence'],bytes)
+        self.assertEqual(prot.sequence,'MKVL')
+        self.assertEqual(prot.__dict__['sequence'],'MKVL')
+        
+    
 class CallerAPIListTests(APITestCase):
     def setUp(self):
         self.c = APIClient()
@@ -136,6 +259,22 @@ class CallerAPIListTests(APITestCase):
         self.assertEqual(len(data['results']),self.batchSize)
        
     
+    def testProteinListDefersSequence(self):
+        """the protein listing neither returns nor selects the sequence column"""
+        goodUrl = reverse('protein_api_list')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(goodUrl,format='json')
+        data = json.loads(res.content)
+        self.assertNotIn('sequence', data['results'][0])
+        self.assertFalse(any('"sequence"' in query['sql'] for query in queries.captured_queries))
+    
+    def testGetProteinSequence(self):
+        goodUrl = reverse('sequence_api', kwargs={'protein_id':self.prots[0].protein_id})
+        res = self.c.get(goodUrl,format='json')
+        self.assertEqual(res.status_code,200)
+        data = json.loads(res.content)
+        self.assertEqual(data['sequence'],self.prots[0].sequence)
+    
     def testProteinListIncludesDomains(self):
         goodUrl = reverse('protein_api_list')
         res = self.c.get(goodUrl,format='json')
@@ -167,6 +306,96 @@ class CallerAPIListTests(APITestCase):
         self.assertTrue('domain_id' in data['results'][0])
         self.assertEqual(len(data['results']),self.batchSize)
       
+class CatalogPaginationTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.pfams = PfamFactory.create_batch(25)
+        
+    def tearDown(self):
+        PfamFactory.reset_sequence(0)
+    
+    def testPageSizeSelectable(self):
+        res = self.c.get(reverse('pfamlist'), {'page_size': 20})
+        data = json.loads(res.content)
+        self.assertEqual(len(data['results']),20)
+        self.assertEqual(data['count'],25)
+    
+    def testPageSizeCapped(self):
+        with mock.patch('caller.pagination.CatalogPagination.max_page_size', 5):
+            res = self.c.get(reverse('pfamlist'), {'page_size': 20})
+        self.assertEqual(len(json.loads(res.content)['results']),5)
+    
+    def testCursorCrawl(self):
+        url = reverse('pfamlist') + '?pagination=cursor&page_size=10'
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                res = self.c.get(url)
+            self.assertEqual(res.status_code,200)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+            data = json.loads(res.content)
+            self.assertNotIn('count', data)
+            seen += [row['domain_id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen,[pfam.domain_id for pfam in sorted(self.pfams, key=lambda pfam: pfam.id)])
+    
+    def testCursorCountOnRequest(self):
+        res = self.c.get(reverse('domain_list'), {'pagination': 'cursor', 'count': 'true'})
+        self.assertEqual(json.loads(res.content)['count'],0)
+    
+    
+class QueryCountTests(APITestCase):
+    """every list and detail view runs the same number of queries whatever the page size or domains per protein"""
+    
+    def setUp(self):
+        self.c = APIClient()
+        
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def populate(self, proteins, domainsPerProtein):
+        organism = OrganismFactory.create()
+        for n in range(proteins):
+            prot = ProteinFactory.create(organism_id=organism)
+            for k in range(domainsPerProtein):
+                ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create())
+        OrganismPfam.objects.rebuild()
+        return organism
+    
+    def countQueries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url, params)
+        self.assertEqual(res.status_code,200)
+        return len(queries.captured_queries)
+    
+    def assertConstantQueries(self, urlFor, **params):
+        counts = []
+        for proteins, domainsPerProtein in [(1, 1), (8, 4)]:
+            organism = self.populate(proteins, domainsPerProtein)
+            counts.append(self.countQueries(urlFor(organism), **params))
+        self.assertEqual(counts[0],counts[1])
+        return counts[0]
+    
+    def testProteinListQueries(self):
+        self.assertEqual(3,self.assertConstantQueries(lambda organism: reverse('protein_api_list'), page_size=100))
+    
+    def testDomainListQueries(self):
+        self.assertEqual(2,self.assertConstantQueries(lambda organism: reverse('domain_list')))
+    
+    def testProteinDetailQueries(self):
+        urlFor = lambda organism: reverse('protein_api', kwargs={'protein_id':Protein.objects.filter(organism_id=organism).latest('id').protein_id})
+        self.assertEqual(3,self.assertConstantQueries(urlFor))  # version lookup, protein, domains
+    
+    def testOrganismProteinListQueries(self):
+        self.assertEqual(2,self.assertConstantQueries(lambda organism: reverse('organism_proteins', kwargs={'taxa_id':organism.taxa_id})))
+    
+    def testOrganismPfamListQueries(self):
+        self.assertEqual(3,self.assertConstantQueries(lambda organism: reverse('organism_api', kwargs={'taxa_id':organism.taxa_id})))  # version lookup, count, page
+    
+    
 class OrganismTests(APITestCase):
     
     def setUp(self):
@@ -221,6 +450,8 @@ class ProteinTests(APITestCase):
         self.protDoms.append(ProteinDomains(protein=self.prot2,domain=self.dom3))
         
         ProteinDomains.objects.bulk_create(self.protDoms)
+        OrganismPfam.objects.rebuild()
+        Protein.objects.refresh_coverage()
         
     def tearDown(self):
        
@@ -278,12 +509,29 @@ class ProteinTests(APITestCase):
         data = json.loads(res.content)
         self.assertEqual(len(self.prot1.domains.all()),data['count'])
         
+    def testGetOrganismPfamsDistinct(self):
+        """Repeated Pfams are listed once with their occurrence and protein counts"""
+        prot3 = ProteinFactory.create(id=3, organism_id=self.prot1.organism_id)
+        ProteinDomains.objects.create(protein=prot3, domain=self.dom1)
+        ProteinDomains.objects.create(protein=prot3, domain=DomainFactory.create(id=4, pfam_id=self.dom1.pfam_id))
+        OrganismPfam.objects.rebuild()
+        goodUrl = reverse('organism_api', kwargs={'taxa_id':self.prot1.organism_id.taxa_id})    
+        res = self.c.get(goodUrl)
+        data = json.loads(res.content)
+        self.assertEqual(2,data['count'])
+        pfam = [row for row in data['results'] if row['domain_id'] == self.dom1.pfam_id.domain_id][0]
+        self.assertEqual(3,pfam['occurrences'])
+        self.assertEqual(2,pfam['proteins'])
+        
     def testCoverage(self):
         """tests the coverage end point"""
         expectedCoverage =0
         sum =0 
-        for dom in self.prot1.domains.all():
-            sum += dom.stop - dom.start  
+        reached = 0
+        # overlapping domains only count once
+        for dom in sorted(self.prot1.domains.all(), key=lambda dom: (dom.start, dom.stop)):
+            sum += max(0, dom.stop - max(dom.start, reached))
+            reached = max(reached, dom.stop)
         expectedCoverage = sum / self.prot1.length 
         proteinId = 'protein0'
         goodUrl=reverse('coverage_api',kwargs={'protein_id':proteinId})
@@ -293,6 +541,24 @@ class ProteinTests(APITestCase):
         data =json.loads(res.content)
         self.assertEqual(data['coverage'],expectedCoverage)
     
+    def testCoverageOverlappingDomains(self):
+        """overlapping domains are covered once and gaps are not covered"""
+        prot = ProteinFactory.create(id=3, length=100)
+        for n, (start, stop) in enumerate([(10, 30), (20, 50), (25, 40), (60, 70)]):
+            ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create(id=10 + n, start=start, stop=stop))
+        Protein.objects.refresh_coverage([prot.id])
+        goodUrl=reverse('coverage_api',kwargs={'protein_id':prot.protein_id})
+        data =json.loads(self.c.get(goodUrl).content)
+        self.assertEqual(data['coverage'],0.5)
+    
+    def testBackfillCoverage(self):
+        """the backfill command stores coverage for every protein"""
+        Protein.objects.update(coverage=0)
+        out = StringIO()
+        call_command('backfill_coverage', stdout=out)
+        self.assertIn('coverage computed for 2 proteins', out.getvalue())
+        self.assertGreater(Protein.objects.get(id=self.prot1.id).coverage, 0)
+    
     def testPostProteinOnNewValues(self):
         """tests whether a protein can be posted without any existing data in the DB"""
         goodUrl = reverse("new_protein")
@@ -313,6 +579,12 @@ class ProteinTests(APITestCase):
         returnedData = json.loads(res.content)
         
         self.assertIn(returnedData['protein_id'],data['protein_id'])
+        
+        summary = OrganismPfam.objects.get(organism__taxa_id=organism_data['taxa_id'])
+        self.assertEqual(summary.pfam.domain_id,pfam_data['domain_id'])
+        self.assertEqual(1,summary.occurrences)
+        self.assertEqual(1,summary.proteins)
+        self.assertEqual(1.0,Protein.objects.get(protein_id='testProtein').coverage)
     
     
     def testPostProteinExisting(self):
@@ -337,10 +609,786 @@ class ProteinTests(APITestCase):
         res.render() 
         returnedData = json.loads(res.content)
         self.assertIn(data['protein_id'],returnedData['protein_id'])
+    
+    def testPostProteinDuplicate(self):
+        """a protein_id that is already taken is a field error"""
+        goodUrl = reverse("new_protein")
+        organism_data = OrganismSerializer(self.prot1.organism_id).data
+        domain_data = [DomainSerializer(self.prot1.domains.all()[0]).data]
+        data = {'protein_id':self.prot1.protein_id,'organism_id':organism_data,'sequence':'testSequence',"length":100,'domains':domain_data}
+        res = self.c.post(goodUrl,data,format='json')
+        self.assertEqual(res.status_code,400)
+        self.assertIn('protein_id', json.loads(res.content))
+    
+    def testCreateRaceIsFieldError(self):
+        """a duplicate that slips past the validator is reported on protein_id, not as a database error"""
+        serializer = ProteinSerializer()
+        validated = {'protein_id':self.prot1.protein_id,'organism_id':{'taxa_id':self.prot1.organism_id.taxa_id},'sequence':'MKV','length':3}
+        with self.assertRaises(serializers.ValidationError) as raised:
+            serializer.create(validated)
+        self.assertIn('protein_id', raised.exception.detail)
+        # the same when the row appears between full_clean() and the insert
+        with mock.patch.object(Protein, 'full_clean'):
+            with self.assertRaises(serializers.ValidationError) as raised:
+                serializer.create(validated)
+        self.assertIn('protein_id', raised.exception.detail)
+        
+class FastPathGoldenTests(APITestCase):
+    """the values based fast path renders byte for byte what the serializers render"""
+    
+    def setUp(self):
+        self.c = APIClient()
+        self.render = JSONRenderer().render
+        self.prots = ProteinFactory.create_batch(3)
+        self.prots[1].sequence = 'mkv\u00e9LLA'
+        self.prots[1].save()
+        for prot in self.prots[:2]:
+            for dom in DomainFactory.create_batch(3, description='d\u00f6main \u2013 "quoted"'):
+                ProteinDomains.objects.create(protein=prot, domain=dom)
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def testProteinDetailGolden(self):
+        for prot in self.prots:
+            res = self.c.get(reverse('protein_api', kwargs={'protein_id':prot.protein_id}))
+            expected = ProteinSerializer(Protein.objects.with_sequence().with_domains().get(id=prot.id)).data
+            self.assertEqual(res.content,self.render(expected))
+    
+    def testProteinListGolden(self):
+        queryset = Protein.objects.with_domains().order_by('id')
+        self.assertEqual(self.render(fetch_proteins(protein_values(queryset))),
+                         self.render(ProteinSummarySerializer(queryset, many=True).data))
+        res = self.c.get(reverse('protein_api_list'))
+        self.assertEqual(self.render(res.data['results']),self.render(ProteinSummarySerializer(queryset, many=True).data))
+    
+    def testDomainListGolden(self):
+        queryset = Domain.objects.select_related('pfam_id').order_by('id')
+        self.assertEqual(self.render(build_domains(domain_values(queryset))),
+                         self.render(DomainSerializer(queryset, many=True).data))
+    
+    def testOrganismProteinListGolden(self):
+        taxaId = self.prots[0].organism_id.taxa_id
+        res = self.c.get(reverse('organism_proteins', kwargs={'taxa_id':taxaId}))
+        queryset = Protein.objects.filter(organism_id__taxa_id=taxaId).order_by('id')
+        expected = OrganismProteinSerializer(queryset, many=True, context={'taxa_id': taxaId}).data
+        self.assertEqual(self.render(res.data['results']),self.render(expected))
+    
+    def testValuesListDefaults(self):
+        class PfamValues(ValuesListMixin, generics.ListAPIView):
+            queryset = Pfam.objects.order_by('id')
+            values_fields = ('domain_id', 'domain_description')
+        res = PfamValues.as_view()(APIRequestFactory().get('/'))
+        self.assertEqual(res.data['results'],list(Pfam.objects.order_by('id').values('domain_id', 'domain_description')))
+    
+    
+class ProteinShapeTests(APITestCase):
+    """?fields= and ?expand= on the protein endpoints"""
+    
+    def setUp(self):
+        self.c = APIClient()
+        response_cache.clear()
+        self.prot = ProteinFactory.create()
+        self.pfam = PfamFactory.create()
+        self.dom = DomainFactory.create(pfam_id=self.pfam)
+        ProteinDomains.objects.create(protein=self.prot, domain=self.dom)
+        self.url = reverse('protein_api', kwargs={'protein_id':self.prot.protein_id})
+    
+    def tearDown(self):
+        response_cache.clear()
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def testNarrowDetail(self):
+        self.c.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(self.url, {'fields': 'length,protein_id'})
+        self.assertEqual(json.loads(res.content),{'protein_id': self.prot.protein_id, 'length': self.prot.length})
+        # version lookup and the protein row: no sequence, no organism join, no domain query
+        self.assertEqual(len(queries.captured_queries),2)
+        self.assertNotIn('sequence',queries.captured_queries[1]['sql'])
+        self.assertNotIn('caller_organism',queries.captured_queries[1]['sql'])
+    
+    def testNarrowList(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(reverse('protein_api_list'), {'fields': 'protein_id'})
+        self.assertEqual(res.data['results'],[{'protein_id': self.prot.protein_id}])
+        self.assertEqual(len(queries.captured_queries),2)  # count, page
+        res = self.c.get(reverse('protein_api_list'), {'fields': 'protein_id,sequence'})
+        self.assertEqual(res.data['results'][0]['sequence'],self.prot.sequence)
+    
+    def testExpand(self):
+        data = json.loads(self.c.get(self.url, {'expand': 'domains'}).content)
+        self.assertEqual(data['taxonomy'],self.prot.organism_id.taxa_id)
+        self.assertEqual(data['domains'],[{'pfam_id': self.pfam.domain_id, 'description': self.dom.description,
+                                           'start': self.dom.start, 'stop': self.dom.stop}])
+        data = json.loads(self.c.get(self.url, {'expand': '', 'fields': 'domains'}).content)
+        self.assertEqual(data,{'domains': [self.dom.id]})
+        # domains.pfam implies domains, and is the default
+        self.assertEqual(self.c.get(self.url, {'expand': 'taxonomy,domains.pfam'}).content,self.c.get(self.url).content)
+    
+    def testUnknownNames(self):
+        self.assertEqual(self.c.get(self.url, {'fields': 'protein_id,colour'}).status_code,400)
+        self.assertEqual(self.c.get(self.url, {'expand': 'organism'}).status_code,400)
+        res = self.c.get(reverse('async_protein_api', kwargs={'protein_id':self.prot.protein_id}), {'fields': 'colour'})
+        self.assertEqual(res.status_code,400)
+    
+    def testAsyncSameShape(self):
+        params = {'fields': 'protein_id,domains', 'expand': 'domains'}
+        res = self.c.get(reverse('async_protein_api', kwargs={'protein_id':self.prot.protein_id}), params)
+        self.assertEqual(res.content,self.c.get(self.url, params).content)
+    
+    
+class RendererTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.prots = ProteinFactory.create_batch(2)
+        ProteinDomains.objects.create(protein=self.prots[0], domain=DomainFactory.create(description='line\u2028break \u00e9'))
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def testORJSONMatchesJSONRenderer(self):
+        data = {'results': fetch_proteins(protein_values(Protein.objects.order_by('id'))), 'coverage': 1 / 3, 'count': None}
+        self.assertEqual(ORJSONRenderer().render(data),JSONRenderer().render(data))
+    
+    def testDefaultRendererIsORJSON(self):
+        res = self.c.get(reverse('domain_list'), {'format': 'json'})
+        self.assertEqual(res.status_code,200)
+        self.assertIsInstance(res.accepted_renderer,ORJSONRenderer)
+        self.assertEqual(res.content,JSONRenderer().render(res.data))
+    
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def testMessagePackNegotiated(self):
+        res = self.c.get(reverse('domain_list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(res['Content-Type'],'application/msgpack')
+        self.assertEqual(msgpack.unpackb(res.content)['results'][0]['description'],'line\u2028break \u00e9')
+    
+    
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.prots = ProteinFactory.create_batch(2)
+        self.pfam = PfamFactory.create()
+        ProteinDomains.objects.create(protein=self.prots[0], domain=DomainFactory.create(pfam_id=self.pfam))
+        OrganismPfam.objects.rebuild()
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def assertNotModified(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code,304)
+        self.assertEqual(res['ETag'],etag)
+        # answered from the version lookup alone
+        self.assertEqual(len(queries.captured_queries),1)
+    
+    def testProteinNotModified(self):
+        url = reverse('protein_api', kwargs={'protein_id':self.prots[0].protein_id})
+        res = self.c.get(url)
+        self.assertEqual(res.status_code,200)
+        self.assertIn('Last-Modified',res)
+        self.assertNotModified(url, res['ETag'])
         
-from io import StringIO
-from django.core.management import call_command
-
+        self.prots[0].length += 1
+        self.prots[0].save()
+        res = self.c.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code,200)
+        self.assertEqual(json.loads(res.content)['length'],self.prots[0].length)
+    
+    def testPfamNotModified(self):
+        url = reverse('pfam_api', kwargs={'pfam_id':self.pfam.domain_id})
+        etag = self.c.get(url)['ETag']
+        self.assertNotModified(url, etag)
+        self.pfam.domain_description = 'changed'
+        self.pfam.save()
+        self.assertNotEqual(self.c.get(url)['ETag'],etag)
+    
+    def testOrganismPfamsVersionedPerOrganism(self):
+        url = reverse('organism_api', kwargs={'taxa_id':self.prots[0].organism_id.taxa_id})
+        etag = self.c.get(url)['ETag']
+        # a protein of another organism leaves this organism's ETag alone
+        self.prots[1].length += 1
+        self.prots[1].save()
+        self.assertNotModified(url, etag)
+        ProteinDomains.objects.create(protein=self.prots[0], domain=DomainFactory.create(pfam_id=self.pfam))
+        self.assertNotEqual(self.c.get(url)['ETag'],etag)
+    
+    def testRenamedOrMovedProteinBumpsTheOldKeys(self):
+        protein = Protein.objects.get(pk=self.prots[0].pk)
+        oldId, oldTaxa = protein.protein_id, self.prots[0].organism_id.taxa_id
+        before = dict(DataVersion.objects.values_list('scope', 'version'))
+        protein.protein_id = 'renamed'
+        protein.organism_id_id = self.prots[1].organism_id_id
+        protein.save()
+        after = dict(DataVersion.objects.values_list('scope', 'version'))
+        for scope in (DataVersion.protein_scope(oldId), DataVersion.taxa_scope(oldTaxa), DataVersion.protein_scope('renamed'),
+                      DataVersion.taxa_scope(self.prots[1].organism_id.taxa_id)):
+            self.assertGreater(after[scope], before.get(scope, 0))
+    
+    def testETagPerRepresentation(self):
+        url = reverse('pfam_api', kwargs={'pfam_id':self.pfam.domain_id})
+        self.assertNotEqual(self.c.get(url)['ETag'],self.c.get(url, {'format': 'api'})['ETag'])
+    
+    def testDatasetBumpInvalidates(self):
+        url = reverse('pfam_api', kwargs={'pfam_id':self.pfam.domain_id})
+        etag = self.c.get(url)['ETag']
+        DataVersion.objects.bump('dataset')
+        self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code,200)
+    
+    
+class AsyncViewTests(APITestCase):
+    """the async read views answer with the same bytes and ETags as the sync ones"""
+    
+    def setUp(self):
+        self.c = APIClient()
+        response_cache.clear()
+        self.prots = ProteinFactory.create_batch(3, organism_id=OrganismFactory.create())
+        self.pfam = PfamFactory.create()
+        for prot in self.prots[:2]:
+            ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create(pfam_id=self.pfam, description='d\u00f6main'))
+        OrganismPfam.objects.rebuild()
+        Protein.objects.refresh_coverage()
+        self.taxaId = self.prots[0].organism_id.taxa_id
+    
+    def tearDown(self):
+        response_cache.clear()
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def urls(self):
+        protein = {'protein_id': self.prots[0].protein_id}
+        return [('protein_api', protein), ('pfam_api', {'pfam_id': self.pfam.domain_id}), ('coverage_api', protein),
+                ('organism_proteins', {'taxa_id': self.taxaId}), ('organism_api', {'taxa_id': self.taxaId})]
+    
+    def testSameResponses(self):
+        with self.settings(RESPONSE_CACHE_TIMEOUT=0):
+            for name, kwargs in self.urls():
+                sync = self.c.get(reverse(name, kwargs=kwargs))
+                res = self.c.get(reverse('async_' + name, kwargs=kwargs))
+                self.assertEqual(res.status_code,200)
+                self.assertEqual(res.content,sync.content)
+                self.assertEqual(res.get('ETag'),sync.get('ETag'))
+    
+    def testPageLinks(self):
+        ProteinFactory.create_batch(12, organism_id=self.prots[0].organism_id)
+        for page in ('2', 'last'):
+            sync = self.c.get(reverse('organism_proteins', kwargs={'taxa_id': self.taxaId}), {'page': page})
+            res = self.c.get(reverse('async_organism_proteins', kwargs={'taxa_id': self.taxaId}), {'page': page})
+            # the links point back at the async listing
+            self.assertEqual(res.content.replace(b'/api/async/',b'/api/'),sync.content)
+        # an invalid page is a 404, which the middleware turns into a redirect
+        self.assertEqual(self.c.get(reverse('async_organism_proteins', kwargs={'taxa_id': self.taxaId}), {'page': 9}).status_code,302)
+    
+    def testListingCachesKeepTheirLinks(self):
+        for pfam in PfamFactory.create_batch(14):
+            ProteinDomains.objects.create(protein=self.prots[0], domain=DomainFactory.create(pfam_id=pfam))
+        OrganismPfam.objects.rebuild()
+        kwargs = {'taxa_id': self.taxaId}
+        for first, second in [('async_organism_api', 'organism_api'), ('organism_api', 'async_organism_api')]:
+            response_cache.clear()
+            for name in (first, second):
+                url = reverse(name, kwargs=kwargs)
+                self.assertEqual(json.loads(self.c.get(url).content)['next'],'http://testserver' + url + '?page=2')
+    
+    def testNotModified(self):
+        url = reverse('async_protein_api', kwargs={'protein_id': self.prots[0].protein_id})
+        etag = self.c.get(reverse('protein_api', kwargs={'protein_id': self.prots[0].protein_id}))['ETag']
+        self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code,304)
+        self.prots[0].length += 1
+        self.prots[0].save()
+        self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code,200)
+    
+    def testSharesResponseCache(self):
+        kwargs = {'protein_id': self.prots[0].protein_id}
+        sync = self.c.get(reverse('coverage_api', kwargs=kwargs))
+        response_cache.reset_stats()
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(reverse('async_coverage_api', kwargs=kwargs))
+        self.assertEqual(res.content,sync.content)
+        self.assertEqual(response_cache.stats()['hits'],1)
+        self.assertEqual(len(queries.captured_queries),0)
+    
+    def testMissingIsRedirected(self):
+        self.assertEqual(self.c.get(reverse('async_protein_api', kwargs={'protein_id': 'missing'})).status_code,302)
+        self.assertEqual(self.c.get(reverse('async_pfam_api', kwargs={'pfam_id': 'missing'})).status_code,302)
+    
+    def testCachedEntitiesMustBeDeclared(self):
+        class AsyncPfamCount(AsyncReadView):
+            cache_endpoint = 'async_pfam_count'
+            def get_cache_lookup(self):
+                return 'all'
+            async def get_data(self, request):
+                return {'count': await Pfam.objects.acount()}
+        with self.assertRaises(ImproperlyConfigured):
+            async_to_sync(AsyncPfamCount.as_view())(RequestFactory().get('/'))
+        uncached = type('Uncached', (AsyncPfamCount,), {'cache_endpoint': None})
+        res = async_to_sync(uncached.as_view())(RequestFactory().get('/'))
+        self.assertEqual(json.loads(res.content),{'count': Pfam.objects.count()})
+    
+    def testPageDefaults(self):
+        class AsyncPfamList(AsyncPageView):
+            queryset = Pfam.objects.order_by('id')
+            values_fields = ('domain_id', 'domain_description')
+        res = async_to_sync(AsyncPfamList.as_view())(RequestFactory().get('/'))
+        self.assertEqual(json.loads(res.content)['results'],list(Pfam.objects.order_by('id').values('domain_id', 'domain_description')))
+    
+    async def testAsyncClient(self):
+        # through the async handler and middleware chain, as under an ASGI server
+        res = await AsyncClient().get(reverse('async_pfam_api', kwargs={'pfam_id': self.pfam.domain_id}))
+        self.assertEqual(res.status_code,200)
+        self.assertEqual(json.loads(res.content)['domain_id'],self.pfam.domain_id)
+    
+    
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        response_cache.clear()
+        self.prots = ProteinFactory.create_batch(2)
+        
+    def tearDown(self):
+        response_cache.clear()
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def get(self, prot):
+        return self.c.get(reverse('coverage_api', kwargs={'protein_id':prot.protein_id}))
+    
+    def testHitSkipsQueries(self):
+        first = self.get(self.prots[0])
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(self.prots[0])
+        self.assertEqual(second.content,first.content)
+        self.assertEqual(len(queries.captured_queries),0)
+        self.assertEqual(response_cache.stats()['hits'],1)
+        self.assertEqual(response_cache.stats()['misses'],1)
+    
+    def testWriteInvalidatesOnlyThatProtein(self):
+        self.get(self.prots[0])
+        self.get(self.prots[1])
+        self.prots[0].coverage = 0.5
+        self.prots[0].save()
+        self.assertEqual(json.loads(self.get(self.prots[0]).content)['coverage'],0.5)
+        self.get(self.prots[1])
+        self.assertEqual(response_cache.stats()['hits'],1)
+        self.assertEqual(response_cache.stats()['misses'],3)
+    
+    def testKeyedByRenderer(self):
+        self.get(self.prots[0])
+        res = self.c.get(reverse('coverage_api', kwargs={'protein_id':self.prots[0].protein_id}), {'format': 'api'})
+        self.assertIn(b'<html', res.content)
+        self.assertEqual(response_cache.stats()['hits'],0)
+    
+    def testNotFoundNotCached(self):
+        url = reverse('pfam_api', kwargs={'pfam_id':'PF_MISSING'})
+        self.assertNotEqual(self.c.get(url).status_code,200)
+        self.assertNotEqual(self.c.get(url).status_code,200)
+        self.assertEqual(response_cache.stats()['misses'],2)
+        PfamFactory.create(domain_id='PF_MISSING')
+        self.assertEqual(self.c.get(url).status_code,200)
+        self.assertEqual(response_cache.stats()['hits'],0)
+    
+    def testEvictionCounted(self):
+        self.get(self.prots[0])
+        response_cache.cache.delete_many([key for key in response_cache.stored])
+        self.get(self.prots[0])
+        self.assertEqual(response_cache.stats()['evictions'],1)
+    
+    def testStampedeCollapses(self):
+        cache = ResponseCache()
+        calls = []
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'content': b'x'}
+        threads = [threading.Thread(target=cache.get_or_compute, args=('stampede', compute, lambda entry: True)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls),1)
+        self.assertEqual(cache.stats()['collapsed'],7)
+    
+    def testConcurrentNotFoundAreNotShared(self):
+        # a 404 entry holds the response finalized for the leader's request, each collapsed request needs its own
+        def retrieve(view, request, *args, **kwargs):
+            time.sleep(0.1)
+            return Response({'detail': 'Not found.'}, status=404)
+        requests = [APIRequestFactory().get('/', HTTP_ACCEPT='application/json') for _ in range(4)]
+        responses = [None] * len(requests)
+        def get(n):
+            responses[n] = CoverageDetail.as_view()(requests[n], protein_id='missing')
+        with mock.patch.object(CoverageDetail, 'retrieve', retrieve):
+            threads = [threading.Thread(target=get, args=(n,)) for n in range(len(requests))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([res.status_code for res in responses],[404] * len(requests))
+        self.assertEqual(len({id(res) for res in responses}),len(requests))
+        for request, res in zip(requests, responses):
+            self.assertIs(res.renderer_context['request']._request,request)
+        self.assertEqual(response_cache.stats()['collapsed'],0)
+    
+    def testSlowKeyDoesNotBlockItsStripe(self):
+        cache = ResponseCache()
+        other = next(key for key in ('other%d' % n for n in range(10000)) if hash(key) % 64 == hash('slow') % 64)
+        started = threading.Event()
+        def slow():
+            started.set()
+            time.sleep(0.5)
+            return {'content': b'slow'}
+        thread = threading.Thread(target=cache.get_or_compute, args=('slow', slow, lambda entry: True))
+        thread.start()
+        started.wait()
+        began = time.monotonic()
+        cache.get_or_compute(other, lambda: {'content': b'other'}, lambda entry: True)
+        self.assertLess(time.monotonic() - began, 0.25)
+        thread.join()
+    
+    def testWaitEndsWithTheLease(self):
+        # the lease holder's result was not cacheable: the waiter computes it once the lease is gone, not after the timeout
+        cache = ResponseCache()
+        cache.cache.add('lease:gone', 1)
+        threading.Timer(0.1, cache.cache.delete, args=('lease:gone',)).start()
+        began = time.monotonic()
+        self.assertEqual(cache.get_or_compute('gone', lambda: {'status': 404}, lambda entry: False),{'status': 404})
+        self.assertLess(time.monotonic() - began, 2)
+    
+    def testEntitiesMustBeDeclared(self):
+        class PfamCount(CachedResponseMixin, generics.GenericAPIView):
+            cache_endpoint = 'pfam_count'
+            def get_cache_lookup(self):
+                return 'all'
+            def get(self, request, *args, **kwargs):
+                return self.cached(request, lambda: Response({'count': Pfam.objects.count()}))
+        request = lambda: APIRequestFactory().get('/', HTTP_ACCEPT='application/json')
+        with self.assertRaises(ImproperlyConfigured):
+            PfamCount.as_view()(request())
+        with self.assertRaises(ImproperlyConfigured):
+            type('Unnamed', (PfamCount,), {'cache_endpoint': None, 'cache_entities': []}).as_view()(request())
+        # declared empty: dropped by the writes that invalidate everything
+        view = type('Declared', (PfamCount,), {'cache_entities': []}).as_view()
+        self.assertEqual(json.loads(view(request()).content)['count'],Pfam.objects.count())
+    
+    def testStatsEndpoint(self):
+        self.get(self.prots[0])
+        data = json.loads(self.c.get(reverse('cache_stats')).content)
+        self.assertEqual(data['misses'],1)
+        self.assertIn('evictions', data)
+    
+    
+class ProteinBatchTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.prots = ProteinFactory.create_batch(3)
+        for prot in self.prots:
+            ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create())
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def read(self, res):
+        self.assertEqual(res.status_code,200)
+        return json.loads(b''.join(res.streaming_content))
+    
+    def testBatchInRequestOrder(self):
+        ids = [self.prots[2].protein_id, 'NOPE1', self.prots[0].protein_id, 'NOPE2']
+        data = self.read(self.c.get(reverse('protein_batch'), {'ids': ','.join(ids)}))
+        self.assertEqual([row['protein_id'] for row in data['results']],[ids[0], ids[2]])
+        self.assertEqual(data['missing'],['NOPE1', 'NOPE2'])
+        detail = json.loads(self.c.get(reverse('protein_api', kwargs={'protein_id':ids[0]})).content)
+        self.assertEqual(data['results'][0],detail)
+    
+    def testBatchPostQueries(self):
+        ids = [prot.protein_id for prot in self.prots] + ['NOPE%d' % n for n in range(1200)]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.read(self.c.post(reverse('protein_batch'), {'ids': ids}, format='json'))
+        self.assertEqual(len(data['results']),3)
+        self.assertEqual(len(data['missing']),1200)
+        # at most proteins and domains per chunk of BatchView.chunk_size ids
+        self.assertLessEqual(len(queries.captured_queries),2 * 3)
+    
+    def testBatchRejectsBadIds(self):
+        self.assertEqual(self.c.post(reverse('protein_batch'), {'ids': [1, 2]}, format='json').status_code,400)
+        self.assertEqual(self.c.get(reverse('protein_batch')).status_code,400)
+        with mock.patch.object(ProteinBatch, 'max_ids', 2):
+            self.assertEqual(self.c.post(reverse('protein_batch'), ['A', 'B', 'C'], format='json').status_code,400)
+    
+    
+class CoverageBatchTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        organism = OrganismFactory.create()
+        self.pfam = PfamFactory.create()
+        self.prots = [ProteinFactory.create(organism_id=organism, length=100) for _ in range(3)]
+        # 0.5, 0.2 and no domains
+        ProteinDomains.objects.create(protein=self.prots[0], domain=DomainFactory.create(start=1, stop=51, pfam_id=self.pfam))
+        ProteinDomains.objects.create(protein=self.prots[1], domain=DomainFactory.create(start=11, stop=31))
+        self.other = ProteinFactory.create()
+        Protein.objects.refresh_coverage()
+        self.taxaId = organism.taxa_id
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def read(self, res):
+        self.assertEqual(res.status_code,200)
+        return json.loads(b''.join(res.streaming_content))
+    
+    def testCoverageByTaxa(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.read(self.c.get(reverse('coverage_batch'), {'taxa_id': self.taxaId}))
+        self.assertEqual(len(queries.captured_queries),1)
+        self.assertEqual(data['results'],[{'protein_id': self.prots[0].protein_id, 'coverage': 0.5},
+                                          {'protein_id': self.prots[1].protein_id, 'coverage': 0.2},
+                                          {'protein_id': self.prots[2].protein_id, 'coverage': 0.0}])
+        self.assertNotIn('missing', data)
+    
+    def testCoverageRange(self):
+        data = self.read(self.c.get(reverse('coverage_batch'), {'taxa_id': self.taxaId, 'min_coverage': 0.1, 'max_coverage': 0.3}))
+        self.assertEqual([row['protein_id'] for row in data['results']],[self.prots[1].protein_id])
+    
+    def testCoverageByPfam(self):
+        data = self.read(self.c.get(reverse('coverage_batch'), {'pfam': self.pfam.domain_id}))
+        self.assertEqual([row['protein_id'] for row in data['results']],[self.prots[0].protein_id])
+    
+    def testCoverageByIds(self):
+        ids = [self.prots[1].protein_id, 'NOPE', self.prots[0].protein_id]
+        data = self.read(self.c.post(reverse('coverage_batch') + '?max_coverage=0.3', {'ids': ids}, format='json'))
+        self.assertEqual([row['protein_id'] for row in data['results']],[self.prots[1].protein_id])
+        self.assertEqual(data['missing'],['NOPE'])
+    
+    def testCoverageFilteredIdsAreNotMissing(self):
+        ids = [self.other.protein_id, 'NOPE', self.prots[0].protein_id]
+        data = self.read(self.c.post(reverse('coverage_batch') + f'?taxa_id={self.taxaId}', {'ids': ids}, format='json'))
+        self.assertEqual([row['protein_id'] for row in data['results']],[self.prots[0].protein_id])
+        self.assertEqual(data['missing'],['NOPE'])
+    
+    def testCoverageBadFilter(self):
+        self.assertEqual(self.c.get(reverse('coverage_batch'), {'min_coverage': 'high'}).status_code,400)
+        self.assertEqual(self.c.get(reverse('coverage_batch'), {'max_coverage': 'nan'}).status_code,400)
+    
+    
+class BulkIngestTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.existing = ProteinFactory.create()
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def record(self, n, taxaId=100, domains=2):
+        return {'protein_id': 'bulk%d' % n, 'sequence': 'MKV' * 10, 'length': 30,
+                'organism_id': {'taxa_id': taxaId, 'clade': 'E', 'genus': 'Genus', 'species': 'species'},
+                'domains': [{'pfam_id': {'domain_id': 'PFB%d' % k, 'domain_description': 'bulk pfam'},
+                             'description': 'bulk domain', 'start': 1 + k, 'stop': 11 + k} for k in range(domains)]}
+    
+    def post(self, records):
+        return self.c.post(reverse('protein_bulk'), records, format='json')
+    
+    def testBulkCreate(self):
+        res = self.post([self.record(n, taxaId=100 + n % 2) for n in range(4)])
+        self.assertEqual(res.status_code,201)
+        self.assertEqual(json.loads(res.content)['created'],['bulk0', 'bulk1', 'bulk2', 'bulk3'])
+        detail = json.loads(self.c.get(reverse('protein_api', kwargs={'protein_id':'bulk1'})).content)
+        self.assertEqual(detail['taxonomy']['taxa_id'],101)
+        self.assertEqual([domain['pfam_id']['domain_id'] for domain in detail['domains']],['PFB0', 'PFB1'])
+        summary = OrganismPfam.objects.get(organism__taxa_id=100, pfam__domain_id='PFB0')
+        self.assertEqual((summary.occurrences, summary.proteins),(2, 2))
+        self.assertAlmostEqual(Protein.objects.get(protein_id='bulk0').coverage,11 / 30)
+    
+    def testBulkQueriesConstant(self):
+        # the first batch also creates the Pfams the later ones reuse
+        self.post([self.record(1000, taxaId=999)])
+        counts = []
+        for start, size in [(0, 1), (100, 20)]:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post([self.record(start + n, taxaId=100 + start + n) for n in range(size)]).status_code,201)
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0],counts[1])
+    
+    def testBulkReportsErrorsPerRecord(self):
+        bad = self.record(1)
+        bad['domains'][0]['start'] = 50
+        records = [self.record(0), bad, self.record(0), {'protein_id': self.existing.protein_id}, 'junk',
+                   dict(self.record(2), protein_id=self.existing.protein_id)]
+        res = self.post(records)
+        self.assertEqual(res.status_code,200)
+        data = json.loads(res.content)
+        self.assertEqual(data['created'],['bulk0'])
+        self.assertEqual([error['index'] for error in data['errors']],[1, 2, 3, 4, 5])
+        self.assertIn('already exists', str(data['errors'][4]['errors']))
+        self.assertFalse(Protein.objects.filter(protein_id='bulk1').exists())
+    
+    def testBulkRejectsNonList(self):
+        self.assertEqual(self.post({'protein_id': 'x'}).status_code,400)
+        self.assertEqual(self.post(['junk']).status_code,400)
+    
+    
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.c = APIClient()
+        self.prots = ProteinFactory.create_batch(3)
+        for prot in self.prots:
+            ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create())
+    
+    def tearDown(self):
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def readLines(self, res):
+        self.assertEqual(res.status_code,200)
+        self.assertEqual(res['Content-Type'],'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(res.streaming_content).decode('utf-8').splitlines()]
+    
+    def testExportProteins(self):
+        rows = self.readLines(self.c.get(reverse('protein_export')))
+        self.assertEqual([row['protein_id'] for row in rows],[prot.protein_id for prot in self.prots])
+        detail = json.loads(self.c.get(reverse('protein_api', kwargs={'protein_id':self.prots[0].protein_id})).content)
+        self.assertEqual(rows[0],detail)
+    
+    def testExportFilteredByTaxa(self):
+        taxaId = self.prots[1].organism_id.taxa_id
+        rows = self.readLines(self.c.get(reverse('protein_export'), {'taxa_id': taxaId}))
+        self.assertEqual([row['protein_id'] for row in rows],[self.prots[1].protein_id])
+        rows = self.readLines(self.c.get(reverse('domain_export'), {'taxa_id': taxaId}))
+        self.assertEqual([row['id'] for row in rows],[self.prots[1].domains.get().id])
+        rows = self.readLines(self.c.get(reverse('organism_export'), {'taxa_id': taxaId}))
+        self.assertEqual([row['taxa_id'] for row in rows],[taxaId])
+    
+    def testExportGzip(self):
+        res = self.c.get(reverse('domain_export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(res['Content-Encoding'],'gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(res.streaming_content)).splitlines()]
+        self.assertEqual(len(rows),3)
+    
+    def testExportGzipRefused(self):
+        for header in ['gzip;q=0', 'gzip; q=0.0, deflate', '*;q=0', 'identity, *;q=0', 'x-gzip']:
+            res = self.c.get(reverse('domain_export'), HTTP_ACCEPT_ENCODING=header)
+            self.assertFalse(res.has_header('Content-Encoding'), header)
+            self.assertEqual(len(self.readLines(res)),3)
+        for header in ['GZIP;q=0.5', 'br;q=0, *', 'deflate, gzip;q=1.0']:
+            self.assertEqual(self.c.get(reverse('domain_export'), HTTP_ACCEPT_ENCODING=header)['Content-Encoding'],'gzip', header)
+    
+    def testExportBadTaxa(self):
+        res = self.c.get(reverse('organism_export'), {'taxa_id': 'abc'})
+        self.assertEqual(res.status_code,400)
+    
+    
+class SnapshotTests(APITestCase):
+    """prerendered snapshots hold what the views return, and are served without touching the database"""
+    
+    def setUp(self):
+        self.c = APIClient()
+        response_cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.org = OrganismFactory.create()
+        self.prots = ProteinFactory.create_batch(12, organism_id=self.org)
+        self.pfam = PfamFactory.create()
+        for prot in self.prots[:3]:
+            ProteinDomains.objects.create(protein=prot, domain=DomainFactory.create(pfam_id=self.pfam))
+        OrganismPfam.objects.rebuild()
+        Protein.objects.refresh_coverage()
+        prerender(self.root, 'http://testserver')
+    
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        response_cache.clear()
+        OrganismFactory.reset_sequence(0)
+        ProteinFactory.reset_sequence(0)
+        DomainFactory.reset_sequence(0)
+        PfamFactory.reset_sequence(0)
+    
+    def read(self, path):
+        with open(os.path.join(self.root, path), 'rb') as snapshot:
+            return snapshot.read()
+    
+    def testFilesMatchViews(self):
+        prot = self.prots[0]
+        for url, path in [(reverse('protein_api', kwargs={'protein_id':prot.protein_id}), f'api/protein/{prot.protein_id}.json'),
+                          (reverse('coverage_api', kwargs={'protein_id':prot.protein_id}), f'api/coverage/{prot.protein_id}.json'),
+                          (reverse('pfam_api', kwargs={'pfam_id':self.pfam.domain_id}), f'api/pfam/{self.pfam.domain_id}.json'),
+                          (reverse('organism_proteins', kwargs={'taxa_id':self.org.taxa_id}), f'api/proteins/{self.org.taxa_id}/1.json'),
+                          (reverse('organism_proteins', kwargs={'taxa_id':self.org.taxa_id}) + '?page=2', f'api/proteins/{self.org.taxa_id}/2.json'),
+                          (reverse('organism_api', kwargs={'taxa_id':self.org.taxa_id}), f'api/pfams/{self.org.taxa_id}/1.json')]:
+            self.assertEqual(self.read(path),self.c.get(url).content)
+            self.assertEqual(gzip.decompress(self.read(path + '.gz')),self.read(path))
+    
+    def testIncremental(self):
+        self.assertEqual(prerender(self.root, 'http://testserver'),{'proteins': 0, 'pfams': 0, 'taxa': 0, 'removed': 0})
+        self.prots[0].length += 1
+        self.prots[0].save()
+        self.assertEqual(prerender(self.root, 'http://testserver'),{'proteins': 1, 'pfams': 0, 'taxa': 1, 'removed': 0})
+        self.assertEqual(json.loads(self.read(f'api/protein/{self.prots[0].protein_id}.json'))['length'],self.prots[0].length)
+        self.prots[10].delete()
+        self.prots[11].delete()
+        counts = prerender(self.root, 'http://testserver')
+        # the details and coverage of both proteins, and the second page of their organism's listing
+        self.assertEqual(counts['removed'],5)
+        self.assertFalse(os.path.exists(os.path.join(self.root, f'api/protein/{self.prots[11].protein_id}.json')))
+    
+    def testServedWithoutQueries(self):
+        url = reverse('protein_api', kwargs={'protein_id':self.prots[0].protein_id})
+        expected = self.c.get(url).content
+        with self.settings(SNAPSHOT_ROOT=self.root):
+            client = APIClient()
+            with CaptureQueriesContext(connection) as queries:
+                res = client.get(url)
+                zipped = client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                notModified = client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+            self.assertEqual(len(queries.captured_queries),0)
+            self.assertEqual(res.content,expected)
+            self.assertEqual(zipped['Content-Encoding'],'gzip')
+            self.assertEqual(gzip.decompress(zipped.content),expected)
+            self.assertEqual(notModified.status_code,304)
+            # anything the snapshot does not hold goes on to the views
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(json.loads(client.get(url, {'fields': 'length'}).content),{'length': self.prots[0].length})
+            self.assertNotEqual(len(queries.captured_queries),0)
+    
+    def testServedHeadersParsed(self):
+        url = reverse('protein_api', kwargs={'protein_id':self.prots[0].protein_id})
+        with self.settings(SNAPSHOT_ROOT=self.root):
+            client = APIClient()
+            etag = client.get(url)['ETag']
+            # an etag that merely contains ours, or a longer one, is a different version
+            for header in [etag[:-1] + '0"', '"x' + etag[1:], etag[:-2] + '"']:
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=header).status_code,200, header)
+            for header in [f'"other", {etag}', f'W/{etag}', '*']:
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=header).status_code,304, header)
+            for header in ['gzip;q=0', 'x-gzip', '*;q=0, identity']:
+                self.assertFalse(client.get(url, HTTP_ACCEPT_ENCODING=header).has_header('Content-Encoding'), header)
+            self.assertEqual(client.get(url, HTTP_ACCEPT_ENCODING='identity;q=0.5, gzip;q=0.8')['Content-Encoding'],'gzip')
+    
+    
 class LoaderTest(TestCase):
     
     def setUp(self):
@@ -411,6 +1459,173 @@ class LoaderTest(TestCase):
         
         
         
+class LoaderPipelineTests(TestCase):
+    """the loader streams its input in batches, the result does not depend on the batch size"""
+    
+    proteinRows = [
+        'protein_id,taxa_id,clade,genus species,domain description,pfam,start,stop,length',
+        'P1,10,E,Genus one,first domain,PF1,1,40,100',
+        'P2,20,B,Genus two,second domain,PF2,5,25,50',
+        'P1,10,E,Genus one,third domain,PF2,30,60,100',
+        'P3,10,E,Genus one,fourth domain,PF1,1,10,20',
+    ]
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = {}
+        for name, lines in [('pfams', ['pfam,description', 'PF1,pfam one', 'PF2,pfam two']),
+                            ('proteins', self.proteinRows),
+                            ('sequences', ['protein_id,sequence', 'P1,MKVL', 'P2,MKV', 'P3,ACDE'])]:
+            self.files[name] = os.path.join(self.dir, name + '.csv')
+            with open(self.files[name], 'w') as csvFile:
+                csvFile.write('\n'.join(lines) + '\n')
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+    
+    def load(self, batchSize, **options):
+        call_command('loader', batch_size=batchSize, stdout=StringIO(), **options, **self.files)
+        return [list(Protein.objects.order_by('id').values_list('id', 'protein_id', 'organism_id__taxa_id', 'length', 'coverage')),
+                list(ProteinDomains.objects.order_by('domain_id').values_list('protein_id', 'domain_id', 'domain__pfam_id__domain_id')),
+                list(OrganismPfam.objects.order_by('organism_id', 'pfam_id').values_list('organism__taxa_id', 'pfam__domain_id', 'occurrences', 'proteins'))]
+    
+    def testBatchSizeIndependent(self):
+        loaded = self.load(1)
+        # ids are the row numbers of the first row naming an entity
+        self.assertEqual(loaded[0],[(2, 'P1', 10, 100, 0.59), (3, 'P2', 20, 50, 0.4), (5, 'P3', 10, 20, 0.45)])
+        self.assertEqual(Protein.objects.get(protein_id='P1').sequence,'MKVL')
+        self.assertEqual(loaded[2],[(10, 'PF1', 2, 2), (10, 'PF2', 1, 1), (20, 'PF2', 1, 1)])
+        self.assertEqual(self.load(1000),loaded)
+    
+    def testIncrementalAlongsideOtherWriters(self):
+        self.load(5000)
+        with open(self.files['proteins'], 'a') as csvFile:
+            csvFile.write('P4,30,A,Genus three,fifth domain,PF1,1,5,10\nP5,30,A,Genus three,sixth domain,PF2,2,6,10\n')
+        upsert = LoaderCommand.upsertProteins
+        def interleaved(command, rows):
+            # the API takes the next protein and domain ids between two batches
+            n = Protein.objects.count()
+            organism = Organism.objects.create(taxa_id=900 + n, genus='Api', species='writer', clade='E')
+            Protein.objects.create(protein_id=f'API{n}', sequence='MKV', length=3, organism_id=organism)
+            Domain.objects.create(pfam_id=Pfam.objects.first(), start=1, stop=2, description='api')
+            return upsert(command, rows)
+        with mock.patch.object(LoaderCommand, 'upsertProteins', interleaved):
+            call_command('loader', incremental=True, batch_size=1, stdout=StringIO(), **self.files)
+        self.assertEqual(list(ProteinDomains.objects.filter(protein__protein_id__in=['P4', 'P5']).order_by('protein__protein_id')
+                              .values_list('protein__protein_id', 'domain__description')),[('P4', 'fifth domain'), ('P5', 'sixth domain')])
+    
+    def testFailedIncrementalKeepsVersions(self):
+        # the batches committed before a failure have their summaries and versions up to date
+        self.load(5000)
+        with open(self.files['proteins'], 'a') as csvFile:
+            csvFile.write('P4,30,A,Genus three,fifth domain,PF1,1,5,10\n')
+        with mock.patch.object(LoaderCommand, 'upsertSequences', side_effect=RuntimeError):
+            with self.assertRaises(CommandError):
+                call_command('loader', incremental=True, batch_size=1, stdout=StringIO(), **self.files)
+        self.assertIn('protein:P4', set(DataVersion.objects.values_list('scope', flat=True)))
+        self.assertIn('taxa:30', set(DataVersion.objects.values_list('scope', flat=True)))
+        self.assertEqual(list(OrganismPfam.objects.filter(organism__taxa_id=30).values_list('pfam__domain_id', 'proteins')),[('PF1', 1)])
+        self.assertEqual(Protein.objects.get(protein_id='P4').coverage,0.4)
+    
+    def testParallelParsing(self):
+        loaded = self.load(2)
+        # chunks of a line or two, parsed across the pool and put back in order
+        with mock.patch('caller.management.commands.loader.PARSE_CHUNK_BYTES', 40):
+            self.assertEqual(self.load(2, workers=3),loaded)
+        self.assertEqual(Protein.objects.get(protein_id='P3').sequence,'ACDE')
+    
+    def testPandasEngine(self):
+        # with a row holding a lone ',' field, which both engines drop
+        with open(self.files['proteins'], 'a') as csvFile:
+            csvFile.write('P2,20,B,Genus two,",",fifth domain,PF1,10,20,50\n')
+        loaded = self.load(2)
+        sequences = {protein.protein_id: protein.sequence for protein in Protein.objects.with_sequence()}
+        descriptions = sorted(Domain.objects.values_list('description', 'start', 'stop'))
+        self.assertIn(('fifth domain', 10, 20), descriptions)
+        self.assertEqual(self.load(2, engine='pandas'),loaded)
+        self.assertEqual({protein.protein_id: protein.sequence for protein in Protein.objects.with_sequence()},sequences)
+        self.assertEqual(sorted(Domain.objects.values_list('description', 'start', 'stop')),descriptions)
+    
+    def testStreamingProgressOnStdout(self):
+        out = StringIO()
+        with mock.patch('builtins.print') as printed:
+            call_command('loader', stdout=out, **self.files)
+        self.assertEqual([call for call in printed.call_args_list if 'running on' in str(call)],[])
+        self.assertIn('running on: seq_fp', out.getvalue())
+    
+    def testPandasProgressOnStdout(self):
+        out = StringIO()
+        with mock.patch('builtins.print') as printed:
+            call_command('loader', engine='pandas', stdout=out, **self.files)
+        # bar the table counts every full load prints at the end
+        self.assertEqual([call for call in printed.call_args_list if 'running on' in str(call)],[])
+        self.assertIn('running on: seq_fp', out.getvalue())
+    
+    def testFastaSequences(self):
+        # wrapped, gzipped, with a UniProt style header and a record for a protein the proteins file does not have
+        self.files['sequences'] = os.path.join(self.dir, 'sequences.fasta.gz')
+        with gzip.open(self.files['sequences'], 'wt') as fastaFile:
+            fastaFile.write('>P1 first protein\nMK\nVL\n>sp|P2|TEST_HUMAN second protein\nMKV\n>P9\nAAA\n>P3\nACDE\n')
+        out = StringIO()
+        call_command('loader', stdout=out, stderr=StringIO(), **self.files)
+        self.assertEqual({protein.protein_id: protein.sequence for protein in Protein.objects.with_sequence()},
+                         {'P1': 'MKVL', 'P2': 'MKV', 'P3': 'ACDE'})
+        self.assertIn('1 sequences of unknown proteins skipped', out.getvalue())
+    
+    def testFastaUndecodable(self):
+        # a sequence outside ASCII and a header outside UTF-8 are skipped and counted, the rest still loads
+        self.files['sequences'] = os.path.join(self.dir, 'sequences.fasta')
+        with open(self.files['sequences'], 'wb') as fastaFile:
+            fastaFile.write(b'>P1\nMK\xc3\xa9VL\n>P2\nMKV\n>P3 \xff\nACDE\n')
+        out, err = StringIO(), StringIO()
+        call_command('loader', stdout=out, stderr=err, **self.files)
+        self.assertEqual({protein.protein_id: protein.sequence for protein in Protein.objects.with_sequence()},{'P1': '', 'P2': 'MKV', 'P3': ''})
+        self.assertIn('2 undecodable sequences skipped', out.getvalue())
+        self.assertIn('line 1:', err.getvalue())
+        self.assertIn('line 5:', err.getvalue())
+    
+    def dump(self):
+        # the tables by natural key, the ids differ between an incremental and a full load
+        return [sorted(Protein.objects.values_list('protein_id', 'organism_id__taxa_id', 'length', 'coverage')),
+                sorted(ProteinDomains.objects.values_list('protein__protein_id', 'domain__pfam_id__domain_id', 'domain__start', 'domain__description')),
+                sorted(OrganismPfam.objects.values_list('organism__taxa_id', 'pfam__domain_id', 'occurrences', 'proteins')),
+                sorted(Organism.objects.values_list('taxa_id', flat=True)),
+                {protein.protein_id: protein.sequence for protein in Protein.objects.with_sequence()}]
+    
+    def testIncrementalProgressOnStdout(self):
+        self.load(5000)
+        out = StringIO()
+        with mock.patch('builtins.print') as printed:
+            call_command('loader', incremental=True, stdout=out, **self.files)
+        printed.assert_not_called()
+        self.assertIn('running on: seq_fp', out.getvalue())
+    
+    def testIncremental(self):
+        self.load(5000)
+        versions = dict(DataVersion.objects.values_list('scope', 'version'))
+        rows = [row for row in self.proteinRows if not row.startswith('P3')] + ['P4,30,A,Genus three,fifth domain,PF1,1,5,10']
+        rows[3] = rows[3].replace('third domain', 'third domain v2')
+        with open(self.files['proteins'], 'w') as csvFile:
+            csvFile.write('\n'.join(rows) + '\n')
+        with open(self.files['sequences'], 'w') as csvFile:
+            csvFile.write('protein_id,sequence\nP1,MKVLA\nP2,MKV\nP4,ACD\n')
+        
+        out = StringIO()
+        call_command('loader', incremental=True, prune=True, batch_size=2, stdout=out, **self.files)
+        self.assertIn('Protein: 1 inserted, 1 updated, 1 deleted', out.getvalue())
+        self.assertIn('Domain: 1 inserted, 1 updated, 1 deleted', out.getvalue())
+        self.assertIn('Organism: 1 inserted, 0 updated, 0 deleted', out.getvalue())
+        incremental = self.dump()
+        # nothing changed for P2, nor for the whole dataset, so their versions (and cached responses) stay
+        after = dict(DataVersion.objects.values_list('scope', 'version'))
+        self.assertNotIn('protein:P2',after)
+        self.assertEqual(after['dataset'],versions['dataset'])
+        self.assertIn('protein:P1',after)
+        
+        self.load(5000)
+        self.assertEqual(incremental,self.dump())
+    
+    
 class DomainSerialiserTest(APITestCase):
     
     
@@ -1,6 +1,7 @@
 from django.urls import path,include
 from rest_framework import routers 
 from .api import * 
+from .async_api import *
 from .views import *
 # my code starts here 
 urlpatterns=[
@@ -10,15 +11,29 @@ urlpatterns=[
     path('api/protein',ProteinCreate.as_view(),name='protein_create'),
     
     path('api/proteins/<int:taxa_id>',OrganismProteinList.as_view(),name='organism_proteins'),
+    path('api/proteins/batch',ProteinBatch.as_view(),name='protein_batch'),
+    path('api/proteins/bulk',ProteinBulkCreate.as_view(),name='protein_bulk'),
     path('api/pfams/<int:taxa_id>',OrganismPfamList.as_view(),name='organism_api'),
     path('api/pfam/<str:pfam_id>',PfamDetail.as_view(),name='pfam_api'),
+    path('api/coverage/batch',CoverageBatch.as_view(),name='coverage_batch'),
     path('api/coverage/<str:protein_id>',CoverageDetail.as_view(),name='coverage_api'),
+    path('api/sequence/<str:protein_id>',ProteinSequenceDetail.as_view(),name='sequence_api'),
     #additional
     path('',index.as_view(),name='index'),
     path('api/proteins', ProteinList.as_view(),name='protein_api_list'),
     path('api/organisms',OrganismList.as_view(),name='organism_api_list'),
     path('api/domains',DomainList.as_view(),name='domain_list'),
     path('api/pfams',PfamList.as_view(),name='pfamlist'),
+    path('api/export/proteins.ndjson',ProteinExport.as_view(),name='protein_export'),
+    path('api/export/domains.ndjson',DomainExport.as_view(),name='domain_export'),
+    path('api/export/organisms.ndjson',OrganismExport.as_view(),name='organism_export'),
+    path('api/cache/stats',CacheStats.as_view(),name='cache_stats'),
+    #async read endpoints, for ASGI deployments
+    path('api/async/protein/<str:protein_id>',AsyncProteinDetail.as_view(),name='async_protein_api'),
+    path('api/async/proteins/<int:taxa_id>',AsyncOrganismProteinList.as_view(),name='async_organism_proteins'),
+    path('api/async/pfams/<int:taxa_id>',AsyncOrganismPfamList.as_view(),name='async_organism_api'),
+    path('api/async/pfam/<str:pfam_id>',AsyncPfamDetail.as_view(),name='async_pfam_api'),
+    path('api/async/coverage/<str:protein_id>',AsyncCoverageDetail.as_view(),name='async_coverage_api'),
     
 ]
 